@@ -0,0 +1,115 @@
+# bench_admission.py
+# Simulación de una venta: una base de datos con capacidad limitada (latencia que
+# crece con la concurrencia) recibe a ritmo fijo lecturas de catálogo, pagos y una
+# avalancha de /admin/orders lentos. Compara sin control de admisión vs.
+# farmachelo.admission.AdmissionMiddleware: latencia por clase y 503 rápidos.
+#
+#   python benchmarks/bench_admission.py [--seconds 5] [--catalog 400] [--payments 20] [--admin 60]
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.middleware import Middleware  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from farmachelo import admission  # noqa: E402
+
+
+class SimulatedDatabase:
+    """Cada operación tarda ``cost`` × (1 + concurrencia / capacidad)"""
+
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self.active = 0
+
+    async def query(self, cost: float):
+        self.active += 1
+        try:
+            await asyncio.sleep(cost * (1 + self.active / self.capacity))
+        finally:
+            self.active -= 1
+
+
+def build_app(with_admission: bool) -> Starlette:
+    database = SimulatedDatabase()
+
+    async def catalog(request):
+        await database.query(0.005)
+        return JSONResponse({"ok": True})
+
+    async def payment(request):
+        for _ in range(4):
+            await database.query(0.01)
+        return JSONResponse({"ok": True})
+
+    async def admin_orders(request):
+        await database.query(0.4)
+        return JSONResponse({"ok": True})
+
+    middleware = [Middleware(admission.AdmissionMiddleware, controller=admission.AdmissionController.from_env())] if with_admission else []
+    return Starlette(routes=[
+        Route("/api/products", catalog),
+        Route("/api/payments/process", payment, methods=["POST"]),
+        Route("/api/admin/orders", admin_orders),
+    ], middleware=middleware)
+
+
+async def run(app, rates: dict, seconds: float):
+    results = {name: [] for name in rates}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        async def one(name: str, method: str, url: str, scheduled: float):
+            response = await client.request(method, url)
+            results[name].append((response.status_code, time.perf_counter() - scheduled))
+
+        schedule = []
+        for name, (method, url, rate) in rates.items():
+            schedule += [(i / rate, name, method, url) for i in range(int(rate * seconds))]
+        schedule.sort()
+        tasks = []
+        start = time.perf_counter()
+        for offset, name, method, url in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(one(name, method, url, start + offset)))
+        await asyncio.gather(*tasks)
+    return results
+
+
+def summarize(samples):
+    ok = sorted(latency for status, latency in samples if status == 200)
+    shed = [latency for status, latency in samples if status == 503]
+    p = lambda values, q: values[max(0, int(len(values) * q) - 1)] * 1e3 if values else float("nan")
+    return (f"{len(ok):5d} ok  p50 {p(ok, 0.5):8.1f} ms  p99 {p(ok, 0.99):8.1f} ms  "
+            f"{len(shed):5d} × 503 (mediana {statistics.median(shed) * 1e3 if shed else float('nan'):6.1f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--catalog", type=float, default=400, help="lecturas de catálogo por segundo")
+    parser.add_argument("--payments", type=float, default=20, help="pagos por segundo")
+    parser.add_argument("--admin", type=float, default=60, help="/admin/orders lentos por segundo")
+    args = parser.parse_args()
+    rates = {
+        "catalog": ("GET", "/api/products", args.catalog),
+        "payment": ("POST", "/api/payments/process", args.payments),
+        "admin": ("GET", "/api/admin/orders", args.admin),
+    }
+    for label, with_admission in (("sin admisión", False), ("AdmissionMiddleware", True)):
+        results = asyncio.run(run(build_app(with_admission), rates, args.seconds))
+        print(label)
+        for name, samples in results.items():
+            print(f"  {name:<8} {summarize(samples)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench_cards.py
+# Micro-benchmark: motor IIN (farmachelo.cards) vs. las funciones originales de server.py
+#
+#   python benchmarks/bench_cards.py [--n 10000]
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from farmachelo import cards  # noqa: E402
+
+
+def legacy_validate_card_number(card_number: str) -> bool:
+    card_number = card_number.replace(" ", "")
+    if not card_number.isdigit():
+        return False
+    total = 0
+    reverse_digits = card_number[::-1]
+    for i, digit in enumerate(reverse_digits):
+        n = int(digit)
+        if i % 2 == 1:
+            n *= 2
+            if n > 9:
+                n -= 9
+        total += n
+    return total % 10 == 0
+
+
+def legacy_get_card_type(card_number: str) -> str:
+    card_number = card_number.replace(" ", "")
+    if card_number.startswith("4"):
+        return "Visa"
+    elif card_number.startswith(("51", "52", "53", "54", "55")):
+        return "Mastercard"
+    elif card_number.startswith(("34", "37")):
+        return "Amex"
+    elif card_number.startswith(("300", "301", "302", "303", "304", "305", "36", "38")):
+        return "Diners Club"
+    elif card_number.startswith(("6011", "65")):
+        return "Discover"
+    else:
+        return "Unknown"
+
+
+PREFIXES = ["4", "51", "55", "2221", "2720", "34", "37", "36", "6011", "65", "5018", "6759", "590712", "3530", "62"]
+
+
+def make_numbers(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    numbers = []
+    for _ in range(n):
+        prefix = rng.choice(PREFIXES)
+        body = prefix + "".join(rng.choice("0123456789") for _ in range(15 - len(prefix)))
+        for check in "0123456789":
+            if cards.luhn_valid(body + check):
+                numbers.append(body + check)
+                break
+    return numbers
+
+
+def bench(label, func, numbers, repeat=5):
+    best = min(timeit.repeat(lambda: [func(n) for n in numbers], number=1, repeat=repeat))
+    print(f"{label:<36} {best * 1e3:9.2f} ms  {best / len(numbers) * 1e9:8.0f} ns/tarjeta")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=10000)
+    args = parser.parse_args()
+
+    numbers = make_numbers(args.n)
+    print(f"📊 {len(numbers)} tarjetas")
+    bench("legacy validate_card_number", legacy_validate_card_number, numbers)
+    bench("cards.luhn_valid", cards.luhn_valid, numbers)
+    bench("legacy get_card_type", legacy_get_card_type, numbers)
+    bench("cards.get_card_type", cards.get_card_type, numbers)
+    bench("cards.inspect_card", cards.inspect_card, numbers)
+
+    mismatches = sum(legacy_validate_card_number(n) != cards.luhn_valid(n) for n in numbers)
+    print(f"✅ Diferencias Luhn: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# bench_fieldsets.py
+# Bytes en el cable (respuesta BSON de MongoDB) y tiempo de decodificación en el
+# driver: documentos completos vs. proyecciones (helpers internos y ?fields=)
+#
+#   python benchmarks/bench_fieldsets.py
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bson  # noqa: E402
+from bson import ObjectId  # noqa: E402
+
+from farmachelo import fieldsets, jsonresp, synthetic  # noqa: E402
+from server import (  # noqa: E402
+    ADMIN_ORDER_EXTRA_FIELDS, Order, PRODUCT_CART_PROJECTION, Product,
+)
+
+
+def project(document, projection):
+    """Lo que hace el servidor con una proyección de inclusión"""
+    if projection is None:
+        return document
+    keep = {key for key, value in projection.items() if value}
+    return {key: value for key, value in document.items() if key in keep}
+
+
+def wire(documents, projection):
+    # Una respuesta de find/getMore: los documentos dentro de un lote BSON
+    return bson.encode({"cursor": {"firstBatch": [project(d, projection) for d in documents], "id": 0}, "ok": 1.0})
+
+
+def report(name, documents, projection, json_content=None, full_json=None):
+    full = wire(documents, None)
+    sparse = wire(documents, projection)
+    runs = max(10, 20000 // max(1, len(documents)))
+    full_decode = timeit.timeit(lambda: bson.decode(full), number=runs) / runs
+    sparse_decode = timeit.timeit(lambda: bson.decode(sparse), number=runs) / runs
+    print(name)
+    print(f"  BSON:        {len(full):>9} B -> {len(sparse):>9} B  ({len(sparse) / len(full):.0%})")
+    print(f"  decodificar: {full_decode * 1e6:>7.1f} µs -> {sparse_decode * 1e6:>7.1f} µs  ({full_decode / sparse_decode:.1f}x)")
+    if json_content is not None:
+        print(f"  JSON:        {len(full_json):>9} B -> {len(json_content):>9} B  ({len(json_content) / len(full_json):.0%})")
+
+
+def main():
+    config = synthetic.GeneratorConfig(products=500, users=1000, orders=100)
+    products = [{"_id": ObjectId(), **p} for p in synthetic.generate_products(config)]
+    orders = [{"_id": ObjectId(), **order} for order, _, _ in synthetic.generate_orders(config, products, 0, 100)]
+
+    report("_enrich_cart: producto por item", products[:1], PRODUCT_CART_PROJECTION)
+
+    fieldset = fieldsets.parse_fields("id,name,price,image_url", frozenset(Product.model_fields))
+    page = products[:100]
+    report(
+        "GET /api/products?fields=id,name,price,image_url (100)", page, fieldset.projection(),
+        jsonresp.dumps(jsonresp.serialize_list(Product, [project(p, fieldset.projection()) for p in page], True, fieldset.names)),
+        jsonresp.dumps(jsonresp.serialize_list(Product, page, True)),
+    )
+
+    admin_fields = "id,status,created_at,total_amount,user_info,items_details,invoice_info"
+    fieldset = fieldsets.parse_fields(admin_fields, frozenset(Order.model_fields) | frozenset(ADMIN_ORDER_EXTRA_FIELDS))
+    projection = fieldset.projection("user_id", "items", "enriched_items", "invoice_number", stored=Order.model_fields)
+    report(f"GET /api/admin/orders?fields={admin_fields} (100)", orders, projection)
+
+
+if __name__ == "__main__":
+    main()
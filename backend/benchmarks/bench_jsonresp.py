@@ -0,0 +1,96 @@
+# bench_jsonresp.py
+# Serialización de listados: modelo por documento + response_model de FastAPI
+# (validación doble, json.dumps) vs. TypeAdapter cacheado / modo confiable con orjson
+#
+#   python benchmarks/bench_jsonresp.py [--sizes 1,100,10000]
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bson import ObjectId  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from farmachelo import jsonresp  # noqa: E402
+from server import Product  # noqa: E402
+
+
+def mongo_documents(count: int) -> List[dict]:
+    base = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "id": str(uuid.uuid4()),
+            "name": f"Producto {i}",
+            "description": "Tabletas recubiertas x 20",
+            "price": 1000.0 + i,
+            "category": "Analgésicos",
+            "stock": i % 500,
+            "image_url": f"/uploads/{i}.jpg",
+            "requires_prescription": i % 7 == 0,
+            "active": True,
+            "created_at": base + timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+LEGACY_FIELD = create_response_field(name="Response_get_products", type_=List[Product])
+LOOP = asyncio.new_event_loop()
+
+
+def legacy(documents):
+    content = [Product(**document) for document in documents]
+    value = LOOP.run_until_complete(serialize_response(field=LEGACY_FIELD, response_content=content))
+    return JSONResponse(value).body
+
+
+def validated(documents):
+    return jsonresp.list_response(Product, documents).body
+
+
+def trusted(documents):
+    # La ruta pide la proyección sin _id a MongoDB
+    return jsonresp.list_response(Product, documents, trusted=True).body
+
+
+def measure(function, documents, budget=1.0):
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        function(documents)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / runs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,100,10000")
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        documents = mongo_documents(size)
+        projected = [{k: v for k, v in document.items() if k != "_id"} for document in documents]
+        assert json.loads(legacy(documents)) == json.loads(validated(documents)) == json.loads(trusted(projected))
+
+        baseline = measure(legacy, documents)
+        print(f"{size} elementos")
+        print(f"  {'modelo por doc + response_model':<34} {baseline * 1e6:10.1f} µs")
+        for name, function, docs in (("TypeAdapter + orjson", validated, documents), ("confiable + orjson", trusted, projected)):
+            elapsed = measure(function, docs)
+            print(f"  {name:<34} {elapsed * 1e6:10.1f} µs  ({baseline / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
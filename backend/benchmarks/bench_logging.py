@@ -0,0 +1,84 @@
+# bench_logging.py
+# Costo por petición de los 4 logs de add_cart_item: logging síncrono con
+# f-strings (configuración anterior) vs. cola + listener con formato diferido y muestreo
+#
+#   python benchmarks/bench_logging.py [--n 20000]
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pydantic import BaseModel  # noqa: E402
+
+from farmachelo import logs  # noqa: E402
+
+
+class CartItem(BaseModel):
+    product_id: str
+    quantity: int
+    prescription_file: str = None
+
+
+def eager_request(logger, item):
+    logger.info(f"Adding item to cart for user user-123: {item}")
+    logger.info(f"Cart found/created: cart-456")
+    logger.info(f"Added new product {item.product_id} to cart")
+    logger.info(f"Cart update result: matched=1, modified=1, upserted_id=None")
+
+
+def lazy_request(logger, item):
+    logger.info("Adding item to cart for user %s: %s x%s", "user-123", item.product_id, item.quantity)
+    logger.info("Cart found/created: %s", "cart-456")
+    logger.info("Added new product %s to cart", item.product_id)
+    logger.info("Cart update result: matched=%s, modified=%s, upserted_id=%s", 1, 1, None)
+
+
+def measure(name, request, logger, n, item):
+    start = time.perf_counter()
+    for _ in range(n):
+        request(logger, item)
+    per_request = (time.perf_counter() - start) / n
+    print(f"{name:<40} {per_request * 1e6:8.2f} µs/petición")
+
+
+def fresh_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    args = parser.parse_args()
+    item = CartItem(product_id="b9b92c75-844b-5e90-9515-2b71169caed7", quantity=2)
+    sink = open(os.devnull, "w")
+
+    sync_handler = logging.StreamHandler(sink)
+    sync_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    measure("síncrono + f-strings (anterior)", eager_request, fresh_logger("bench.sync", sync_handler), args.n, item)
+
+    for label, rate in (("cola + formato diferido", 1.0), ("cola + formato diferido, muestreo 5%", 0.05)):
+        output = logging.StreamHandler(sink)
+        output.setFormatter(logs.JsonFormatter())
+        handler = logs.LazyQueueHandler(queue.SimpleQueue())
+        handler.addFilter(logs.SamplingFilter({"bench": rate}))
+        handler.addFilter(logs.RequestIdFilter())
+        listener = logging.handlers.QueueListener(handler.queue, output)
+        listener.start()
+        measure(label, lazy_request, fresh_logger(f"bench.queue{rate}", handler), args.n, item)
+        drain_start = time.perf_counter()
+        listener.stop()
+        print(f"{'':<40} (vaciado del listener: {(time.perf_counter() - drain_start) * 1e3:.1f} ms fuera del loop)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# bench_metrics.py
+# Costo por petición del MetricsMiddleware sobre una app ASGI vacía
+#
+#   python benchmarks/bench_metrics.py [--n 100000]
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from farmachelo import metrics  # noqa: E402
+
+
+class _Route:
+    path = "/api/products/{product_id}"
+
+
+async def noop_app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def run(app, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        await app({"type": "http", "method": "GET", "path": "/api/products/abc"}, receive, send)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000)
+    args = parser.parse_args()
+
+    wrapped = metrics.MetricsMiddleware(noop_app)
+    baseline = min(asyncio.run(run(noop_app, args.n)) for _ in range(3))
+    instrumented = min(asyncio.run(run(wrapped, args.n)) for _ in range(3))
+    print(f"sin middleware   {baseline * 1e6:7.2f} µs/petición")
+    print(f"con middleware   {instrumented * 1e6:7.2f} µs/petición")
+    print(f"overhead         {(instrumented - baseline) * 1e6:7.2f} µs/petición")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# bench_startup.py
+# Arranque en frío: lanza N intérpretes nuevos que importan server.py (y con
+# --lifespan además corren el lifespan hasta que se abre la compuerta de /ready)
+# y reporta la mediana de cada fase de farmachelo.startup. Sale con código 1 si
+# la mediana del total supera el presupuesto: sirve como chequeo en CI.
+#
+#   python benchmarks/bench_startup.py [--runs 5] [--budget-ms 1500] [--lifespan]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_ONLY = """
+import json, server
+print(json.dumps(server.startup.phases.snapshot()))
+"""
+
+WITH_LIFESPAN = """
+import json, time, server
+from fastapi.testclient import TestClient
+with TestClient(server.app) as client:
+    deadline = time.monotonic() + 60
+    while client.get("/ready").json()["status"] == "starting" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    print(json.dumps(server.startup.phases.snapshot()))
+"""
+
+
+def cold_start(code: str) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(f"El arranque falló:\n{result.stderr[-2000:]}")
+    snapshot = json.loads(result.stdout.strip().splitlines()[-1])
+    snapshot["wall_ms"] = wall * 1000
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", 1500)))
+    parser.add_argument("--lifespan", action="store_true", help="incluir lifespan y precalentamiento (requiere MongoDB)")
+    args = parser.parse_args()
+
+    code = WITH_LIFESPAN if args.lifespan else IMPORT_ONLY
+    runs = [cold_start(code) for _ in range(max(1, args.runs))]
+    phases = {}
+    for run in runs:
+        for name, value in run["phases_ms"].items():
+            phases.setdefault(name, []).append(value)
+
+    print(f"{len(runs)} arranques en frío ({'con lifespan' if args.lifespan else 'solo importación'})")
+    for name, values in phases.items():
+        print(f"  {name:<12} mediana {statistics.median(values):7.1f} ms  máx {max(values):7.1f} ms")
+    total = statistics.median(run["total_ms"] for run in runs)
+    wall = statistics.median(run["wall_ms"] for run in runs)
+    print(f"  {'total':<12} mediana {total:7.1f} ms  (proceso completo {wall:.0f} ms)  presupuesto {args.budget_ms:.0f} ms")
+    if total > args.budget_ms:
+        print(f"❌ El arranque en frío supera el presupuesto en {total - args.budget_ms:.0f} ms")
+        return 1
+    print("✅ Dentro del presupuesto")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# bench_uploads.py
+# /uploads a ritmo fijo (1000 req/s por defecto, lazo abierto): el handler anterior
+# (exists() + FileResponse por petición) vs. farmachelo.static.UploadsApp, con
+# descargas completas, revalidaciones (If-None-Match) y rangos.
+# La latencia se mide desde el instante programado, no desde el envío real.
+#
+#   python benchmarks/bench_uploads.py [--rate 1000] [--seconds 5] [--kb 60]
+import argparse
+import asyncio
+import hashlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, HTTPException  # noqa: E402
+from fastapi.responses import FileResponse  # noqa: E402
+
+from farmachelo import blobstore, static  # noqa: E402
+
+
+def legacy_app(root: Path) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/uploads/{filename}")
+    async def get_uploaded_file(filename: str):
+        file_path = root / filename
+        if not file_path.exists():
+            raise HTTPException(status_code=404, detail="File not found")
+        return FileResponse(file_path)
+
+    return app
+
+
+def static_app(root: Path) -> FastAPI:
+    app = FastAPI()
+    app.add_route("/uploads/{filename}", static.UploadsApp(blobstore.LocalBlobStore(root)), methods=["GET", "HEAD"], include_in_schema=False)
+    return app
+
+
+async def run(app, url: str, headers: dict, rate: int, seconds: float):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    statuses = {}
+    received = 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(scheduled: float):
+            nonlocal received
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - scheduled)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            received += len(response.content)
+
+        await client.get(url, headers=headers)  # calentar cachés
+        total = int(rate * seconds)
+        tasks = []
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(one(scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+    latencies.sort()
+    return {
+        "achieved": total / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "cpu_per_request": cpu / total,
+        "bytes_per_request": received / total,
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--kb", type=int, default=60, help="tamaño de la imagen servida")
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="bench-uploads-"))
+    data = os.urandom(args.kb * 1024)
+    filename = f"{hashlib.sha256(data).hexdigest()}.jpg"
+    (root / filename).write_bytes(data)
+    etag = f'"{hashlib.sha256(data).hexdigest()}"'
+    url = f"/uploads/{filename}"
+
+    scenarios = (
+        ("GET completo", {}),
+        ("revalidación If-None-Match", {"if-none-match": etag}),
+        ("Range bytes=0-4095", {"range": "bytes=0-4095"}),
+    )
+    print(f"{args.rate} req/s durante {args.seconds:g} s, imagen de {args.kb} KB")
+    for name, headers in scenarios:
+        print(name)
+        for label, app in (("handler anterior", legacy_app(root)), ("UploadsApp", static_app(root))):
+            result = asyncio.run(run(app, url, headers, args.rate, args.seconds))
+            print(
+                f"  {label:<18} {result['achieved']:7.0f} req/s  p50 {result['p50'] * 1e3:7.2f} ms  "
+                f"p99 {result['p99'] * 1e3:7.2f} ms  CPU {result['cpu_per_request'] * 1e6:7.1f} µs/req  "
+                f"{result['bytes_per_request'] / 1024:6.1f} KB/resp  {result['statuses']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
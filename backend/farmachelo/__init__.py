@@ -0,0 +1 @@
+"""Módulos de soporte del backend de Farmachelo."""
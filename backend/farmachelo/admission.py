@@ -0,0 +1,377 @@
+"""
+Control de admisión: límites de concurrencia por clase de ruta, colas acotadas,
+plazo por petición y descarte adaptativo.
+
+Cada petición ``/api`` se asigna a una clase (``payment``, ``catalog``,
+``admin``, ``uploads`` o ``default``) con su propio límite de peticiones en
+curso y su cola de espera. Además hay un límite global
+(``ADMISSION_MAX_IN_FLIGHT``): cuando se libera un hueco se despierta primero a
+la clase de mayor prioridad, de modo que los pagos adelantan a todo lo demás.
+
+Una petición recibe 503 con ``Retry-After`` sin llegar a la app cuando:
+
+- la cola de su clase está llena (``queue_full``);
+- la espera prevista (cola × latencia media ÷ límite) no cabe en su plazo
+  (``predicted_timeout``), para responder rápido en vez de esperar a fallar;
+- lleva en cola más de ``queue_timeout`` (``queue_timeout``).
+
+El plazo de la clase (``deadline``, acortable con ``X-Request-Timeout-Ms``)
+empieza a contar al llegar y se aplica con ``pymongo.timeout``: el driver envía
+``maxTimeMS`` con el tiempo restante en cada comando y acota también la
+selección de servidor y el checkout del pool. Si la app falla una vez vencido
+el plazo (o por un timeout de MongoDB) la respuesta es 503 en lugar de 500.
+
+El límite de cada clase es adaptativo (AIMD): cada ventana de
+``ADMISSION_WINDOW_MS`` se reduce un 25% si más del 10% de las respuestas
+superaron su latencia objetivo o acabaron en timeout, y crece un 10% si la
+clase estuvo saturada sin ralentizarse. Se mueve entre ``min_limit`` y
+``max_limit``; los pagos tienen un mínimo alto para no quedarse sin capacidad.
+
+Variables por clase: ``ADMISSION_<CLASE>_LIMIT``, ``_MIN_LIMIT``,
+``_MAX_LIMIT``, ``_QUEUE``, ``_QUEUE_TIMEOUT_MS``, ``_DEADLINE_MS`` y
+``_TARGET_MS``. ``ADMISSION=off`` desactiva el middleware. Los límites son por
+worker.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+from farmachelo import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rutas que nunca se encolan: diagnóstico (útil justo durante una sobrecarga)
+EXEMPT_PREFIXES = ("/api/admin/diagnostics", "/api/admin/profiles")
+SLOW_FRACTION = 0.10
+DECREASE_FACTOR = 0.75
+INCREASE_FACTOR = 1.10
+MIN_WINDOW_SAMPLES = 10
+
+admission_total = metrics.registry.register(metrics.Counter(
+    "farmachelo_admission_total", "Decisiones de admisión por clase de ruta", ("route_class", "outcome")))
+admission_limit = metrics.registry.register(metrics.Gauge(
+    "farmachelo_admission_limit", "Límite adaptativo de concurrencia por clase", ("route_class",)))
+admission_in_flight = metrics.registry.register(metrics.Gauge(
+    "farmachelo_admission_in_flight", "Peticiones admitidas en curso por clase", ("route_class",)))
+admission_queued = metrics.registry.register(metrics.Gauge(
+    "farmachelo_admission_queued", "Peticiones en cola por clase", ("route_class",)))
+admission_queue_wait = metrics.registry.register(metrics.Histogram(
+    "farmachelo_admission_queue_wait_seconds", "Espera en cola antes de ser admitida", ("route_class",),
+    buckets=metrics.FAST_BUCKETS))
+
+
+class Shed(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class RouteClass:
+    name: str
+    prefixes: Tuple[str, ...]
+    methods: Optional[Tuple[str, ...]]
+    priority: int  # menor = más prioritaria
+    limit: float
+    min_limit: int
+    max_limit: int
+    queue_size: int
+    queue_timeout: float
+    deadline: float
+    target: float
+    in_flight: int = 0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+    latency_ewma: float = 0.0
+    window_started: float = field(default_factory=time.monotonic)
+    window_total: int = 0
+    window_slow: int = 0
+    window_saturated: bool = False
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return any(path.startswith(prefix) for prefix in self.prefixes)
+
+    def has_room(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "priority": self.priority,
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "queue_size": self.queue_size,
+            "queue_timeout_ms": self.queue_timeout * 1000,
+            "deadline_ms": self.deadline * 1000,
+            "target_ms": self.target * 1000,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 2),
+        }
+
+
+# nombre, prefijos, métodos, prioridad, límite, mínimo, máximo, cola, espera ms, plazo ms, objetivo ms
+DEFAULT_CLASSES = (
+    ("payment", ("/api/payments/", "/api/invoices"), ("POST",), 0, 32, 16, 64, 128, 5000, 15000, 2000),
+    ("uploads", ("/api/prescriptions/uploads", "/api/admin/upload-image", "/api/admin/prescriptions/"), None, 2, 16, 4, 32, 32, 2000, 120000, 30000),
+    ("admin", ("/api/admin/",), None, 3, 8, 2, 32, 32, 2000, 10000, 2000),
+    ("catalog", ("/api/products",), ("GET", "HEAD"), 1, 64, 8, 256, 256, 500, 3000, 300),
+    ("default", ("/api/",), None, 2, 64, 8, 128, 128, 1000, 5000, 500),
+)
+
+
+def classes_from_env() -> List[RouteClass]:
+    classes = []
+    for name, prefixes, methods, priority, limit, min_limit, max_limit, queue, queue_ms, deadline_ms, target_ms in DEFAULT_CLASSES:
+        prefix = f"ADMISSION_{name.upper()}_"
+        env = lambda key, default: float(os.environ.get(prefix + key, default))
+        min_limit = int(env("MIN_LIMIT", min_limit))
+        max_limit = max(min_limit, int(env("MAX_LIMIT", max_limit)))
+        classes.append(RouteClass(
+            name=name,
+            prefixes=prefixes,
+            methods=methods,
+            priority=priority,
+            limit=min(max_limit, max(min_limit, env("LIMIT", limit))),
+            min_limit=min_limit,
+            max_limit=max_limit,
+            queue_size=int(env("QUEUE", queue)),
+            queue_timeout=env("QUEUE_TIMEOUT_MS", queue_ms) / 1000,
+            deadline=env("DEADLINE_MS", deadline_ms) / 1000,
+            target=env("TARGET_MS", target_ms) / 1000,
+        ))
+    return classes
+
+
+class AdmissionController:
+    def __init__(self, classes: List[RouteClass], max_in_flight: int = 256, window: float = 1.0, enabled: bool = True):
+        self.classes = classes
+        self.by_priority = sorted(classes, key=lambda route_class: route_class.priority)
+        self.max_in_flight = max_in_flight
+        self.window = window
+        self.enabled = enabled
+        self.in_flight = 0
+        for route_class in classes:
+            admission_limit.set(int(route_class.limit), (route_class.name,))
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            classes_from_env(),
+            max_in_flight=int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 256)),
+            window=float(os.environ.get("ADMISSION_WINDOW_MS", 1000)) / 1000,
+            enabled=os.environ.get("ADMISSION", "on").lower() not in ("0", "off", "false", "no"),
+        )
+
+    def classify(self, method: str, path: str) -> Optional[RouteClass]:
+        if path.startswith(EXEMPT_PREFIXES):
+            return None
+        for route_class in self.classes:
+            if route_class.matches(method, path):
+                return route_class
+        return None
+
+    def _can_start(self, route_class: RouteClass) -> bool:
+        if not route_class.has_room() or self.in_flight >= self.max_in_flight:
+            return False
+        # No adelantar a peticiones en cola de la misma clase o de una más prioritaria
+        return not any(
+            other.waiters for other in self.by_priority
+            if other.priority <= route_class.priority and (other is route_class or other.has_room())
+        )
+
+    def _start(self, route_class: RouteClass) -> None:
+        route_class.in_flight += 1
+        self.in_flight += 1
+        if not route_class.has_room():
+            route_class.window_saturated = True
+        admission_in_flight.inc((route_class.name,))
+
+    def _expected_wait(self, route_class: RouteClass) -> float:
+        if not route_class.latency_ewma:
+            return 0.0
+        return (len(route_class.waiters) + 1) * route_class.latency_ewma / max(1, int(route_class.limit))
+
+    async def acquire(self, route_class: RouteClass, deadline: float) -> None:
+        """Admite la petición o lanza ``Shed``; ``deadline`` en segundos de ``time.monotonic()``"""
+        if self._can_start(route_class):
+            self._start(route_class)
+            admission_total.inc((route_class.name, "admitted"))
+            return
+        route_class.window_saturated = True
+        retry_after = max(1.0, route_class.latency_ewma * 2)
+        if len(route_class.waiters) >= route_class.queue_size:
+            raise Shed("queue_full", retry_after)
+        budget = min(route_class.queue_timeout, deadline - time.monotonic())
+        if self._expected_wait(route_class) > budget:
+            raise Shed("predicted_timeout", retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        admission_queued.inc((route_class.name,))
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=max(0.0, budget))
+        except asyncio.CancelledError:
+            self._abandon(route_class, waiter)
+            raise
+        if not waiter.done():
+            self._abandon(route_class, waiter)
+            raise Shed("queue_timeout", retry_after)
+        admission_queue_wait.observe((route_class.name,), time.monotonic() - started)
+        admission_total.inc((route_class.name, "queued"))
+
+    def _abandon(self, route_class: RouteClass, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # Se le concedió el hueco justo al cancelarse: devolverlo
+            self._finish(route_class)
+            return
+        waiter.cancel()
+        try:
+            route_class.waiters.remove(waiter)
+            admission_queued.dec((route_class.name,))
+        except ValueError:
+            pass
+
+    def _wake(self) -> None:
+        for route_class in self.by_priority:
+            while route_class.waiters and route_class.has_room() and self.in_flight < self.max_in_flight:
+                waiter = route_class.waiters.popleft()
+                admission_queued.dec((route_class.name,))
+                if waiter.done():
+                    continue
+                self._start(route_class)
+                waiter.set_result(None)
+            if self.in_flight >= self.max_in_flight:
+                return
+
+    def _finish(self, route_class: RouteClass) -> None:
+        route_class.in_flight -= 1
+        self.in_flight -= 1
+        admission_in_flight.dec((route_class.name,))
+        self._wake()
+
+    def release(self, route_class: RouteClass, latency: float, overloaded: bool) -> None:
+        """Libera el hueco y alimenta el límite adaptativo con la latencia observada"""
+        route_class.latency_ewma = latency if not route_class.latency_ewma else 0.8 * route_class.latency_ewma + 0.2 * latency
+        route_class.window_total += 1
+        if overloaded or latency > route_class.target:
+            route_class.window_slow += 1
+        self._adapt(route_class)
+        self._finish(route_class)
+
+    def _adapt(self, route_class: RouteClass) -> None:
+        now = time.monotonic()
+        if now - route_class.window_started < self.window or route_class.window_total < MIN_WINDOW_SAMPLES:
+            return
+        previous = int(route_class.limit)
+        if route_class.window_slow > route_class.window_total * SLOW_FRACTION:
+            route_class.limit = max(route_class.min_limit, route_class.limit * DECREASE_FACTOR)
+        elif route_class.window_saturated:
+            route_class.limit = min(route_class.max_limit, max(route_class.limit + 1, route_class.limit * INCREASE_FACTOR))
+        if int(route_class.limit) != previous:
+            logger.info(f"Admission limit for {route_class.name}: {previous} -> {int(route_class.limit)} "
+                        f"({route_class.window_slow}/{route_class.window_total} slow)")
+            admission_limit.set(int(route_class.limit), (route_class.name,))
+        route_class.window_started = now
+        route_class.window_total = 0
+        route_class.window_slow = 0
+        route_class.window_saturated = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "classes": {route_class.name: route_class.snapshot() for route_class in self.classes},
+        }
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    return isinstance(exc, PyMongoError) and exc.timeout
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: cola por clase de ruta, plazo con ``pymongo.timeout`` y 503 al descartar"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+        route_class = self.controller.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.monotonic()
+        timeout = route_class.deadline
+        requested = next((v for k, v in scope["headers"] if k == b"x-request-timeout-ms"), b"")
+        if requested.isdigit():
+            timeout = min(timeout, int(requested) / 1000)
+        deadline = arrived + timeout
+
+        try:
+            await self.controller.acquire(route_class, deadline)
+        except Shed as shed:
+            admission_total.inc((route_class.name, shed.reason))
+            await _unavailable(send, shed.retry_after)
+            return
+
+        started = False
+        overloaded = False
+
+        async def tracking_send(message):
+            nonlocal started, overloaded
+            if message["type"] == "http.response.start":
+                if message["status"] == 500 and time.monotonic() >= deadline:
+                    # La app capturó el timeout de MongoDB y respondió 500: es sobrecarga, no un error
+                    overloaded = True
+                    started = True
+                    admission_total.inc((route_class.name, "deadline_exceeded"))
+                    await _unavailable(send, max(1.0, route_class.latency_ewma * 2))
+                    return
+                started = True
+            elif overloaded:
+                return
+            await send(message)
+
+        try:
+            remaining = max(0.001, deadline - time.monotonic())
+            with pymongo.timeout(remaining):
+                await self.app(scope, receive, tracking_send)
+        except Exception as exc:
+            if started or not (_is_timeout(exc) or time.monotonic() >= deadline):
+                raise
+            overloaded = True
+            admission_total.inc((route_class.name, "deadline_exceeded"))
+            await _unavailable(send, max(1.0, route_class.latency_ewma * 2))
+        finally:
+            self.controller.release(route_class, time.monotonic() - arrived, overloaded)
+
+
+async def _unavailable(send, retry_after: float) -> None:
+    body = b'{"detail":"Servicio saturado, intenta de nuevo en unos segundos"}'
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(int(retry_after + 0.5)).encode()),
+            (b"cache-control", b"no-store"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
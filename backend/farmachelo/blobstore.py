@@ -0,0 +1,391 @@
+"""
+Almacenamiento de blobs intercambiable: disco local, GridFS o S3 compatible.
+
+Todos los backends comparten la misma interfaz asíncrona y transmiten por
+bloques (nunca cargan el archivo entero en memoria):
+
+- ``stat(key)`` → ``BlobInfo`` o None
+- ``put_file(key, path, content_type)`` sube un archivo local; False si la
+  clave ya existía (los nombres son direccionados por contenido)
+- ``read(key, start, length)`` iterador asíncrono de bloques
+- ``fetch_to(key, path)`` copia a un archivo local (Pillow, importaciones)
+- ``presigned_url(key)`` URL firmada temporal (solo S3)
+
+``from_env(namespace, root, db)`` elige el backend con ``BLOB_BACKEND``
+(``local`` por defecto, ``gridfs`` o ``s3``). Cada espacio (``uploads``,
+``prescriptions``) va a su directorio, bucket de GridFS o prefijo de S3.
+
+S3 se habla directamente con httpx y firma SigV4 (sin boto3): sirve para AWS,
+MinIO, R2, etc. Variables: ``S3_BUCKET``, ``S3_REGION`` (us-east-1),
+``S3_ENDPOINT_URL`` (p. ej. ``http://localhost:9000`` para MinIO; implica
+direccionamiento por ruta), ``S3_ACCESS_KEY_ID``/``S3_SECRET_ACCESS_KEY`` (o
+las ``AWS_*``), ``S3_PRESIGN_SECONDS`` (900) y ``S3_PUBLIC_URL`` (base pública
+del bucket: las imágenes se enlazan directamente en lugar de pasar por
+``/uploads``).
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import stat
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+from urllib.parse import quote, urlsplit
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+BACKENDS = ("local", "gridfs", "s3")
+
+
+@dataclass
+class BlobInfo:
+    key: str
+    size: int
+    mtime: float
+    content_type: Optional[str] = None
+
+
+class BlobStore:
+    """Interfaz común de los backends"""
+
+    name = "base"
+    # Raíz en disco cuando los blobs son archivos locales (lectura directa con pread/Pillow)
+    local_root: Optional[Path] = None
+    # Base pública para enlazar los blobs sin pasar por la app
+    public_url: Optional[str] = None
+    # /uploads redirige a una URL firmada en lugar de transmitir el blob
+    redirects = False
+
+    async def stat(self, key: str) -> Optional[BlobInfo]:
+        raise NotImplementedError
+
+    async def put_file(self, key: str, path: Path, content_type: Optional[str] = None) -> bool:
+        raise NotImplementedError
+
+    def read(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def presigned_url(self, key: str, expires: Optional[int] = None) -> Optional[str]:
+        return None
+
+    async def fetch_to(self, key: str, path: Path) -> None:
+        """Copia el blob a ``path`` por bloques (escritura atómica)"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        handle = await asyncio.to_thread(open, temp_path, "wb")
+        try:
+            async for chunk in self.read(key):
+                await asyncio.to_thread(handle.write, chunk)
+        finally:
+            await asyncio.to_thread(handle.close)
+        os.replace(temp_path, path)
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalBlobStore(BlobStore):
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.local_root = self.root
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key
+
+    def _stat(self, key: str) -> Optional[BlobInfo]:
+        path = self.path_for(key)
+        # Nada de enlaces simbólicos que salgan de la raíz
+        if os.path.dirname(os.path.realpath(path)) != os.path.realpath(self.root):
+            return None
+        try:
+            info = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not stat.S_ISREG(info.st_mode):
+            return None
+        return BlobInfo(key, info.st_size, info.st_mtime)
+
+    async def stat(self, key: str) -> Optional[BlobInfo]:
+        return await asyncio.to_thread(self._stat, key)
+
+    def _link(self, key: str, path: Path) -> bool:
+        self.root.mkdir(parents=True, exist_ok=True)
+        final_path = self.path_for(key)
+        try:
+            os.link(path, final_path)
+            return True
+        except FileExistsError:
+            return False
+        except OSError:
+            # Sistemas de archivos sin hard links: copiar a un temporal y renombrar (atómico)
+            if final_path.exists():
+                return False
+            temp_path = final_path.with_name(f"{key}.{os.getpid()}.tmp")
+            with open(path, "rb") as reader, open(temp_path, "wb") as writer:
+                while chunk := reader.read(CHUNK_SIZE):
+                    writer.write(chunk)
+            os.replace(temp_path, final_path)
+            return True
+
+    async def put_file(self, key: str, path: Path, content_type: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self._link, key, path)
+
+    async def read(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        handle = await asyncio.to_thread(open, self.path_for(key), "rb")
+        try:
+            offset = start
+            remaining = length if length is not None else os.fstat(handle.fileno()).st_size - start
+            while remaining > 0:
+                chunk = await asyncio.to_thread(os.pread, handle.fileno(), min(CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(handle.close)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.path_for(key).unlink, True)
+
+
+class GridFSBlobStore(BlobStore):
+    """Blobs en un bucket GridFS de la misma base de datos (compartido entre workers y hosts)"""
+
+    name = "gridfs"
+
+    def __init__(self, db, bucket: str):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+        self.files = db[f"{bucket}.files"]
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket, chunk_size_bytes=CHUNK_SIZE)
+
+    async def stat(self, key: str) -> Optional[BlobInfo]:
+        document = await self.files.find_one(
+            {"filename": key}, {"length": 1, "uploadDate": 1, "metadata.contentType": 1}, sort=[("uploadDate", -1)])
+        if document is None:
+            return None
+        return BlobInfo(
+            key,
+            document["length"],
+            document["uploadDate"].replace(tzinfo=timezone.utc).timestamp(),
+            (document.get("metadata") or {}).get("contentType"),
+        )
+
+    async def put_file(self, key: str, path: Path, content_type: Optional[str] = None) -> bool:
+        if await self.files.count_documents({"filename": key}, limit=1):
+            return False
+        grid_in = self.bucket.open_upload_stream(key, metadata={"contentType": content_type})
+        handle = await asyncio.to_thread(open, path, "rb")
+        try:
+            while chunk := await asyncio.to_thread(handle.read, CHUNK_SIZE):
+                await grid_in.write(chunk)
+            await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+        finally:
+            await asyncio.to_thread(handle.close)
+        return True
+
+    async def read(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        grid_out = await self.bucket.open_download_stream_by_name(key)
+        grid_out.seek(start)
+        remaining = length if length is not None else grid_out.length - start
+        while remaining > 0:
+            chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def delete(self, key: str) -> None:
+        async for document in self.files.find({"filename": key}, {"_id": 1}):
+            await self.bucket.delete(document["_id"])
+
+
+def _sign(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+class S3BlobStore(BlobStore):
+    """Cliente S3 mínimo (HEAD/GET/PUT/DELETE + URLs firmadas) sobre httpx con SigV4"""
+
+    name = "s3"
+    redirects = True
+
+    def __init__(self, bucket: str, access_key: str, secret_key: str, region: str = "us-east-1",
+                 endpoint_url: Optional[str] = None, prefix: str = "", public_url: Optional[str] = None,
+                 presign_seconds: int = 900, http: Optional["httpx.AsyncClient"] = None):
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.presign_seconds = presign_seconds
+        if endpoint_url:
+            # MinIO y compatibles: https://endpoint/bucket/clave
+            self.base_url = endpoint_url.rstrip("/")
+            self.base_path = f"/{bucket}"
+        else:
+            self.base_url = f"https://{bucket}.s3.{region}.amazonaws.com"
+            self.base_path = ""
+        self.host = urlsplit(self.base_url).netloc
+        if http is None:
+            # httpx (~50 ms de importación) solo hace falta con BLOB_BACKEND=s3
+            import httpx
+            http = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0))
+        self.http = http
+
+    @classmethod
+    def from_env(cls, namespace: str, public: bool) -> "S3BlobStore":
+        return cls(
+            bucket=os.environ["S3_BUCKET"],
+            access_key=os.environ.get("S3_ACCESS_KEY_ID") or os.environ["AWS_ACCESS_KEY_ID"],
+            secret_key=os.environ.get("S3_SECRET_ACCESS_KEY") or os.environ["AWS_SECRET_ACCESS_KEY"],
+            region=os.environ.get("S3_REGION", "us-east-1"),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL"),
+            prefix=namespace,
+            public_url=os.environ.get("S3_PUBLIC_URL") if public else None,
+            presign_seconds=int(os.environ.get("S3_PRESIGN_SECONDS", 900)),
+        )
+
+    # ---- SigV4 ----
+
+    def _path(self, key: str) -> str:
+        return quote(f"{self.base_path}/{self.prefix}{key}", safe="/-_.~")
+
+    def _scope(self, now: datetime):
+        date = now.strftime("%Y%m%d")
+        return date, f"{date}/{self.region}/s3/aws4_request"
+
+    def _signature(self, date: str, string_to_sign: str) -> str:
+        key = _sign(_sign(_sign(_sign(f"AWS4{self.secret_key}".encode(), date), self.region), "s3"), "aws4_request")
+        return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def _canonical_query(params: dict) -> str:
+        return "&".join(f"{quote(k, safe='-_.~')}={quote(str(v), safe='-_.~')}" for k, v in sorted(params.items()))
+
+    def signed_headers(self, method: str, key: str, headers: Optional[dict] = None,
+                       payload_hash: str = "UNSIGNED-PAYLOAD", now: Optional[datetime] = None) -> dict:
+        now = now or datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date, scope = self._scope(now)
+        signed = {k.lower(): str(v).strip() for k, v in (headers or {}).items()}
+        signed.update({"host": self.host, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date})
+        names = ";".join(sorted(signed))
+        canonical = "\n".join([
+            method, self._path(key), "",
+            "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+            names, payload_hash,
+        ])
+        string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+        signed["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, SignedHeaders={names}, "
+            f"Signature={self._signature(date, string_to_sign)}"
+        )
+        del signed["host"]
+        return signed
+
+    def presign(self, method: str, key: str, expires: int, now: Optional[datetime] = None) -> str:
+        now = now or datetime.now(timezone.utc)
+        date, scope = self._scope(now)
+        params = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{scope}",
+            "X-Amz-Date": now.strftime("%Y%m%dT%H%M%SZ"),
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": "host",
+        }
+        query = self._canonical_query(params)
+        canonical = "\n".join([method, self._path(key), query, f"host:{self.host}\n", "host", "UNSIGNED-PAYLOAD"])
+        string_to_sign = "\n".join(["AWS4-HMAC-SHA256", params["X-Amz-Date"], scope, hashlib.sha256(canonical.encode()).hexdigest()])
+        return f"{self.base_url}{self._path(key)}?{query}&X-Amz-Signature={self._signature(date, string_to_sign)}"
+
+    # ---- operaciones ----
+
+    async def stat(self, key: str) -> Optional[BlobInfo]:
+        response = await self.http.head(self.base_url + self._path(key), headers=self.signed_headers("HEAD", key))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        last_modified = response.headers.get("last-modified")
+        return BlobInfo(
+            key,
+            int(response.headers["content-length"]),
+            parsedate_to_datetime(last_modified).timestamp() if last_modified else 0.0,
+            response.headers.get("content-type"),
+        )
+
+    async def put_file(self, key: str, path: Path, content_type: Optional[str] = None) -> bool:
+        if await self.stat(key) is not None:
+            return False
+        size = (await asyncio.to_thread(os.stat, path)).st_size
+        headers = {"content-length": str(size)}
+        if content_type:
+            headers["content-type"] = content_type
+
+        async def body():
+            handle = await asyncio.to_thread(open, path, "rb")
+            try:
+                while chunk := await asyncio.to_thread(handle.read, CHUNK_SIZE):
+                    yield chunk
+            finally:
+                await asyncio.to_thread(handle.close)
+
+        # Content-Length explícito: S3 no acepta PUT con transfer-encoding chunked
+        response = await self.http.put(
+            self.base_url + self._path(key), content=body(), headers=self.signed_headers("PUT", key, headers))
+        response.raise_for_status()
+        return True
+
+    async def read(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        headers = {}
+        if start or length is not None:
+            headers["range"] = f"bytes={start}-{'' if length is None else start + length - 1}"
+        request_headers = self.signed_headers("GET", key)
+        request_headers.update(headers)
+        async with self.http.stream("GET", self.base_url + self._path(key), headers=request_headers) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+
+    async def delete(self, key: str) -> None:
+        response = await self.http.delete(self.base_url + self._path(key), headers=self.signed_headers("DELETE", key))
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    async def presigned_url(self, key: str, expires: Optional[int] = None) -> Optional[str]:
+        return self.presign("GET", key, expires or self.presign_seconds)
+
+    async def close(self) -> None:
+        await self.http.aclose()
+
+
+def from_env(namespace: str, root: Path, db=None, public: bool = False) -> BlobStore:
+    """Backend de ``BLOB_BACKEND`` para el espacio ``namespace`` (directorio, bucket o prefijo)"""
+    backend = os.environ.get("BLOB_BACKEND", "local")
+    if backend not in BACKENDS:
+        raise ValueError(f"BLOB_BACKEND desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+    if backend == "gridfs":
+        if db is None:
+            raise ValueError("BLOB_BACKEND=gridfs requiere la base de datos")
+        return GridFSBlobStore(db, namespace)
+    if backend == "s3":
+        return S3BlobStore.from_env(namespace, public)
+    return LocalBlobStore(root / namespace)
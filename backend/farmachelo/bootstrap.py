@@ -0,0 +1,156 @@
+"""
+Datos iniciales idempotentes: productos de muestra y administrador por defecto.
+
+Ya no bloquean el arranque: ``server.py`` los lanza en segundo plano
+(``BOOTSTRAP=background``, por defecto) y reintenta con backoff si MongoDB aún
+no responde; con ``BOOTSTRAP=off`` se ejecutan a mano con
+``python -m farmachelo.manage bootstrap``. Con el lanzador multi-worker solo
+los lanza el worker 0 (``startup_once`` corre en un proceso que termina antes
+de crear los workers); si ese worker se reemplaza antes de terminar, el
+siguiente despliegue o ``manage bootstrap`` los completan.
+
+Los documentos se crean con ``upsert`` + ``$setOnInsert`` sobre un ``_id``
+determinista (uuid5 del nombre o del email): varios workers pueden correrlo a
+la vez sin duplicar nada y nunca se pisan cambios hechos desde el panel. Los
+productos de muestra solo se insertan si el catálogo está vacío.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADMIN_EMAIL = "admin@farmachelo.com"
+DEFAULT_ADMIN_PASSWORD = "admin123"
+DEFAULT_ADMIN_NAME = "Administrador Principal"
+# Mismo espacio que ``manage import-products``: un nombre siempre da el mismo id
+PRODUCT_ID_NAMESPACE = uuid.UUID("8f7c1a52-4a8e-4a57-9d6e-6a0f3c1b2e10")
+ADMIN_ID_NAMESPACE = uuid.UUID("3d0c6f7e-2b1a-4f5e-9c8d-7a6b5c4d3e2f")
+MAX_RETRY_DELAY = 60.0
+
+# Catálogo de muestra para instalaciones nuevas
+PHARMACY_PRODUCTS = [
+    {
+        "name": "Paracetamol 500mg",
+        "description": "Analgésico y antipirético para alivio del dolor y fiebre",
+        "price": 8500,
+        "category": "over_counter",
+        "stock": 100,
+        "image_url": "https://images.unsplash.com/photo-1631549916768-4119b2e5f926?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NDQ2Mzl8MHwxfHNlYXJjaHw0fHxwaGFybWFjeXxlbnwwfHx8fDE3NTYyNTEyMjd8MA&ixlib=rb-4.1.0&q=85",
+        "requires_prescription": False
+    },
+    {
+        "name": "Ibuprofeno 400mg",
+        "description": "Antiinflamatorio no esteroideo para dolor e inflamación",
+        "price": 12000,
+        "category": "over_counter",
+        "stock": 85,
+        "image_url": "https://images.pexels.com/photos/139398/thermometer-headache-pain-pills-139398.jpeg",
+        "requires_prescription": False
+    },
+]
+
+
+def hash_password(password: str) -> str:
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def product_id(name: str) -> str:
+    return str(uuid.uuid5(PRODUCT_ID_NAMESPACE, name))
+
+
+def _ignore_duplicates(error: BulkWriteError) -> None:
+    # Dos workers haciendo upsert del mismo _id a la vez: uno inserta, el otro choca
+    if any(item.get("code") != 11000 for item in error.details.get("writeErrors", [])):
+        raise error
+
+
+async def seed_products(db) -> int:
+    """Inserta los productos de muestra si el catálogo está vacío; devuelve cuántos creó"""
+    if await db.products.find_one({}, {"_id": 1}) is not None:
+        return 0
+    now = datetime.now(timezone.utc)
+    operations = []
+    for data in PHARMACY_PRODUCTS:
+        identifier = product_id(data["name"])
+        document = {
+            "id": identifier,
+            "category": None,
+            "image_url": None,
+            "requires_prescription": False,
+            **data,
+            "price": float(data["price"]),
+            "active": True,
+            "created_at": now,
+        }
+        operations.append(UpdateOne({"_id": identifier}, {"$setOnInsert": document}, upsert=True))
+    try:
+        result = await db.products.bulk_write(operations, ordered=False)
+    except BulkWriteError as error:
+        _ignore_duplicates(error)
+        return error.details.get("nUpserted", 0)
+    return result.upserted_count
+
+
+async def ensure_admin(db, email: str, password: str, name: str) -> bool:
+    """Crea el administrador si no existe (por email); True si lo creó"""
+    if await db.admin_users.find_one({"email": email}, {"_id": 1}) is not None:
+        return False
+    identifier = str(uuid.uuid5(ADMIN_ID_NAMESPACE, email.lower()))
+    try:
+        result = await db.admin_users.update_one(
+            {"_id": identifier},
+            {"$setOnInsert": {
+                "id": identifier,
+                "email": email,
+                "password": hash_password(password),
+                "name": name,
+                "is_admin": True,
+                "created_at": datetime.now(timezone.utc),
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return result.upserted_id is not None
+
+
+def default_admin() -> Dict[str, str]:
+    return {
+        "email": os.environ.get("DEFAULT_ADMIN_EMAIL", DEFAULT_ADMIN_EMAIL),
+        "password": os.environ.get("DEFAULT_ADMIN_PASSWORD", DEFAULT_ADMIN_PASSWORD),
+        "name": DEFAULT_ADMIN_NAME,
+    }
+
+
+async def bootstrap(db) -> Dict[str, Any]:
+    seeded = await seed_products(db)
+    if seeded:
+        logger.info(f"Seeded {seeded} sample products")
+    admin = default_admin()
+    created = await ensure_admin(db, admin["email"], admin["password"], admin["name"])
+    if created:
+        logger.info(f"Default admin user created: {admin['email']}")
+    return {"products": seeded, "admin_created": created}
+
+
+async def run_in_background(db, breaker=None) -> Optional[Dict[str, Any]]:
+    """Reintenta ``bootstrap`` con backoff hasta completarlo (MongoDB puede no estar listo)"""
+    delay = 1.0
+    while True:
+        if breaker is None or not breaker.is_open:
+            try:
+                return await bootstrap(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error bootstrapping initial data, retrying in {delay:.0f}s: {str(e)}")
+        await asyncio.sleep(delay)
+        delay = min(MAX_RETRY_DELAY, delay * 2)
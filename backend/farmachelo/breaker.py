@@ -0,0 +1,366 @@
+"""
+Circuit breaker de MongoDB y modo degradado con snapshot del catálogo.
+
+El breaker se abre cuando:
+
+- la topología pierde su servidor escribible (evento del monitor del driver), o
+- se acumulan ``MONGO_BREAKER_FAILURES`` (5) fallos de red seguidos: comandos que
+  fallan por conexión o heartbeats fallidos, estos últimos mientras la app
+  espera la selección de servidor.
+
+Mientras está abierto, ``BreakerMiddleware`` responde 503 con ``Retry-After``
+a toda petición ``/api`` que necesite la base de datos, sin esperar al timeout
+de selección de servidor. Las lecturas del catálogo (``GET /api/products...``)
+siguen pasando: los handlers sirven el último snapshot bueno guardado en disco
+(``X-Catalog-Snapshot`` indica su fecha). Cada ``MONGO_BREAKER_RESET_SECONDS``
+(5) un ``ping`` de prueba (estado ``half_open``) decide si se vuelve a cerrar.
+
+El snapshot (``CATALOG_SNAPSHOT_PATH``, por defecto ``cache/catalog.json``) se
+refresca cada ``CATALOG_SNAPSHOT_SECONDS`` (60) por el primer worker que lo
+encuentra viejo y se escribe de forma atómica; los demás lo recargan al ver
+cambiar su mtime. Sobrevive a reinicios: un worker que arranca con MongoDB
+caído ya puede servir el catálogo.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import orjson
+import pymongo
+from pymongo import monitoring
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from farmachelo import jsonresp, metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+NETWORK_ERRORS = frozenset((
+    "AutoReconnect", "ConnectionFailure", "NetworkTimeout", "NotPrimaryError",
+    "ServerSelectionTimeoutError", "WaitQueueTimeoutError",
+))
+# Rutas que siguen pasando con el breaker abierto (el handler usa el snapshot)
+SNAPSHOT_PREFIXES = ("/api/products",)
+EXEMPT_PREFIXES = ("/api/admin/diagnostics",)
+
+breaker_open = metrics.registry.register(metrics.Gauge(
+    "farmachelo_mongodb_breaker_open", "1 mientras el circuit breaker de MongoDB está abierto"))
+breaker_trips_total = metrics.registry.register(metrics.Counter(
+    "farmachelo_mongodb_breaker_trips_total", "Aperturas del circuit breaker de MongoDB", ("reason",)))
+breaker_rejected_total = metrics.registry.register(metrics.Counter(
+    "farmachelo_mongodb_breaker_rejected_total", "Peticiones rechazadas con el breaker abierto", ("method",)))
+snapshot_served_total = metrics.registry.register(metrics.Counter(
+    "farmachelo_catalog_snapshot_served_total", "Respuestas del catálogo servidas desde el snapshot"))
+
+
+def is_unavailable(exc: BaseException) -> bool:
+    """Errores que indican que MongoDB no responde (no errores de la consulta)"""
+    return isinstance(exc, ConnectionFailure) or (isinstance(exc, PyMongoError) and exc.timeout)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 5.0, probe_timeout: float = 2.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.state = CLOSED
+        self.reason: Optional[str] = None
+        self.opened_at: Optional[float] = None
+        self.failures = 0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(
+            failure_threshold=int(os.environ.get("MONGO_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.environ.get("MONGO_BREAKER_RESET_SECONDS", 5)),
+            probe_timeout=float(os.environ.get("MONGO_BREAKER_PROBE_TIMEOUT_SECONDS", 2)),
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != CLOSED
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 1
+        return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at) + 0.999))
+
+    def record_success(self) -> None:
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def record_failure(self, reason: str) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._trip(reason)
+
+    def trip(self, reason: str) -> None:
+        with self._lock:
+            if self.state == CLOSED:
+                self._trip(reason)
+
+    def _trip(self, reason: str) -> None:
+        self.state = OPEN
+        self.reason = reason
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        breaker_open.set(1)
+        breaker_trips_total.inc((reason.split(":")[0],))
+        logger.warning(f"MongoDB circuit breaker opened: {reason}")
+
+    def _close(self) -> None:
+        with self._lock:
+            downtime = time.monotonic() - (self.opened_at or time.monotonic())
+            self.state = CLOSED
+            self.reason = None
+            self.opened_at = None
+            self.failures = 0
+            breaker_open.set(0)
+        logger.info(f"MongoDB circuit breaker closed after {downtime:.1f}s")
+
+    async def probe(self, client) -> bool:
+        """Estado half_open: un ``ping`` con plazo corto decide si se cierra"""
+        self.state = HALF_OPEN
+        try:
+            with pymongo.timeout(self.probe_timeout):
+                await client.admin.command("ping")
+        except PyMongoError as exc:
+            with self._lock:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            logger.warning(f"MongoDB probe failed, breaker stays open: {exc.__class__.__name__}")
+            return False
+        self._close()
+        return True
+
+    async def run(self, client, interval: float = 0.5) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                await self.probe(client)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 1) if self.opened_at else None,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+        }
+
+
+# ==================== LISTENERS ====================
+
+class BreakerCommandListener(monitoring.CommandListener):
+    """Fallos de red en comandos cuentan para abrir; un éxito reinicia la cuenta"""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.breaker.record_success()
+
+    def failed(self, event):
+        errtype = event.failure.get("errtype") if isinstance(event.failure, dict) else None
+        if errtype in NETWORK_ERRORS:
+            self.breaker.record_failure(f"command:{errtype}")
+
+
+class BreakerTopologyListener(monitoring.ServerHeartbeatListener, monitoring.TopologyListener):
+    """Abre al perder el servidor escribible y cuenta los heartbeats fallidos"""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        # ServerHeartbeatFailedEvent (TopologyListener no define failed)
+        self.breaker.record_failure(f"heartbeat:{event.reply.__class__.__name__}")
+
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        if event.previous_description.has_writable_server() and not event.new_description.has_writable_server():
+            self.breaker.trip("topology:no writable server")
+
+    def closed(self, event):
+        pass
+
+
+def event_listeners(breaker: CircuitBreaker) -> list:
+    return [BreakerCommandListener(breaker), BreakerTopologyListener(breaker)]
+
+
+# ==================== SNAPSHOT DEL CATÁLOGO ====================
+
+class CatalogSnapshot:
+    def __init__(self, path: Path, interval: float = 60.0):
+        self.path = Path(path)
+        self.interval = interval
+        self.products: List[Dict[str, Any]] = []
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.taken_at: Optional[str] = None
+        self.loaded_mtime = 0.0
+
+    @classmethod
+    def from_env(cls, root: Path) -> "CatalogSnapshot":
+        return cls(
+            Path(os.environ.get("CATALOG_SNAPSHOT_PATH", root / "cache" / "catalog.json")),
+            interval=float(os.environ.get("CATALOG_SNAPSHOT_SECONDS", 60)),
+        )
+
+    @property
+    def available(self) -> bool:
+        return self.taken_at is not None
+
+    def _install(self, payload: Dict[str, Any], mtime: float) -> None:
+        self.products = payload["products"]
+        self.by_id = {product["id"]: product for product in self.products}
+        self.taken_at = payload["taken_at"]
+        self.loaded_mtime = mtime
+
+    def _mtime(self) -> float:
+        try:
+            return self.path.stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def load(self) -> bool:
+        """Carga el snapshot del disco si es más nuevo que el que está en memoria"""
+        mtime = self._mtime()
+        if not mtime or mtime <= self.loaded_mtime:
+            return False
+        try:
+            self._install(orjson.loads(self.path.read_bytes()), mtime)
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning(f"Ignoring unreadable catalog snapshot {self.path}: {exc}")
+            return False
+        return True
+
+    def _write(self, payload: Dict[str, Any]) -> float:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(jsonresp.dumps(payload))
+        os.replace(tmp, self.path)
+        return self._mtime()
+
+    async def refresh(self, collection, projection: dict) -> int:
+        products = await collection.find({"active": True}, projection).to_list(None)
+        payload = {"taken_at": datetime.now(timezone.utc).isoformat(), "products": products}
+        # Pasar por JSON normaliza fechas y tipos igual que al recargar del disco
+        payload = orjson.loads(jsonresp.dumps(payload))
+        mtime = await asyncio.to_thread(self._write, payload)
+        self._install(payload, mtime)
+        return len(products)
+
+    async def refresh_if_stale(self, collection, projection: dict) -> Optional[int]:
+        """Refresca si el archivo está viejo (lo hace el primer worker que lo note) o recarga si cambió"""
+        if time.time() - self._mtime() < self.interval:
+            await asyncio.to_thread(self.load)
+            return None
+        count = await self.refresh(collection, projection)
+        logger.info(f"Catalog snapshot refreshed: {count} products")
+        return count
+
+    async def run(self, collection, projection: dict, breaker: CircuitBreaker) -> None:
+        """Bucle periódico; la primera carga la hace el precalentamiento del arranque"""
+        while True:
+            await asyncio.sleep(self.interval * random.uniform(0.5, 1.0))
+            if breaker.is_open:
+                await asyncio.to_thread(self.load)
+                continue
+            try:
+                await self.refresh_if_stale(collection, projection)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refreshing catalog snapshot: {str(e)}")
+
+    def search(self, category: Optional[str] = None, search: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Mismo filtro que ``GET /api/products`` (categoría exacta, nombre por regex sin mayúsculas)"""
+        products = self.products
+        if category:
+            products = [product for product in products if product.get("category") == category]
+        if search:
+            try:
+                pattern = re.compile(search, re.IGNORECASE)
+            except re.error:
+                pattern = re.compile(re.escape(search), re.IGNORECASE)
+            products = [product for product in products if pattern.search(product.get("name", ""))]
+        return products[:limit]
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(product_id)
+
+    def status(self) -> Dict[str, Any]:
+        return {"available": self.available, "taken_at": self.taken_at, "products": len(self.products)}
+
+
+# ==================== MIDDLEWARE ====================
+
+class BreakerMiddleware:
+    """Middleware ASGI: con el breaker abierto, 503 inmediato salvo catálogo y diagnóstico"""
+
+    def __init__(self, app, breaker: CircuitBreaker):
+        self.app = app
+        self.breaker = breaker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        if self.breaker.is_open and not self._passes(scope["method"], scope["path"]):
+            breaker_rejected_total.inc((scope["method"],))
+            await self._unavailable(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        except PyMongoError as exc:
+            # Selección de servidor agotada y otros fallos que no generan eventos de comando
+            if is_unavailable(exc):
+                self.breaker.record_failure(f"request:{exc.__class__.__name__}")
+            raise
+
+    @staticmethod
+    def _passes(method: str, path: str) -> bool:
+        if path.startswith(EXEMPT_PREFIXES):
+            return True
+        return method in ("GET", "HEAD") and path.startswith(SNAPSHOT_PREFIXES)
+
+    async def _unavailable(self, send) -> None:
+        retry_after = self.breaker.retry_after()
+        body = jsonresp.dumps({
+            "detail": "Base de datos no disponible temporalmente, intenta de nuevo en unos segundos",
+            "retry_after": retry_after,
+        })
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+                (b"cache-control", b"no-store"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
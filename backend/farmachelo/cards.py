@@ -0,0 +1,197 @@
+"""
+Motor de metadatos de tarjetas basado en una tabla de rangos IIN/BIN.
+
+La tabla se carga desde ``data/iin_ranges.csv`` en arreglos ordenados para
+resolver la franquicia con ``bisect`` en lugar de una cadena de ``startswith``.
+"""
+import bisect
+import csv
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+IIN_TABLE_PATH = Path(__file__).parent / "data" / "iin_ranges.csv"
+UNKNOWN_SCHEME = "Unknown"
+
+# Dígito doblado en Luhn (2*d, restando 9 si pasa de 9) expresado como carácter
+_LUHN_DOUBLED = str.maketrans("0123456789", "0246813579")
+
+
+@dataclass(frozen=True)
+class CardScheme:
+    scheme: str
+    lengths: Tuple[int, ...]
+    country: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class CardInfo:
+    number_valid: bool
+    luhn_valid: bool
+    length_valid: bool
+    scheme: str = UNKNOWN_SCHEME
+    country: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "valid": self.number_valid,
+            "luhn_valid": self.luhn_valid,
+            "length_valid": self.length_valid,
+            "card_type": self.scheme,
+            "country": self.country,
+        }
+
+
+class IINTable:
+    """
+    Tabla de rangos IIN aplanada sobre prefijos de ancho fijo: los rangos más
+    específicos (prefijos más largos) tienen prioridad y cada consulta es un
+    único ``bisect``.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, str, CardScheme]]):
+        ranges = []
+        for start, end, scheme in rows:
+            if len(start) != len(end) or int(start) > int(end):
+                raise ValueError(f"Rango IIN inválido: {start}-{end}")
+            ranges.append((len(start), int(start), int(end), scheme))
+
+        self.key_digits = max((r[0] for r in ranges), default=1)
+        expanded = []
+        for prefix_len, start, end, scheme in ranges:
+            scale = 10 ** (self.key_digits - prefix_len)
+            expanded.append((prefix_len, start * scale, (end + 1) * scale, scheme))
+
+        # Segmentos [lo, hi) con la franquicia del rango más específico que los cubre
+        bounds = sorted({b for _, lo, hi, _ in expanded for b in (lo, hi)})
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._schemes: List[CardScheme] = []
+        for lo, hi in zip(bounds, bounds[1:]):
+            covering = [r for r in expanded if r[1] <= lo and hi <= r[2]]
+            if not covering:
+                continue
+            most_specific = max(r[0] for r in covering)
+            winners = [r for r in covering if r[0] == most_specific]
+            if len(winners) > 1:
+                raise ValueError(f"Rangos IIN solapados en el prefijo {lo}")
+            scheme = winners[0][3]
+            if self._schemes and self._ends[-1] == lo and self._schemes[-1] is scheme:
+                self._ends[-1] = hi
+            else:
+                self._starts.append(lo)
+                self._ends.append(hi)
+                self._schemes.append(scheme)
+        self.scheme_names = frozenset(r[3].scheme for r in ranges)
+
+    @classmethod
+    def from_csv(cls, path: Path = IIN_TABLE_PATH) -> "IINTable":
+        with open(path, newline="", encoding="utf-8") as fh:
+            rows = [
+                (
+                    row["start"].strip(),
+                    row["end"].strip(),
+                    CardScheme(
+                        scheme=row["scheme"].strip(),
+                        lengths=tuple(int(n) for n in row["lengths"].split("|")),
+                        country=row["country"].strip() or None,
+                    ),
+                )
+                for row in csv.DictReader(fh)
+            ]
+        return cls(rows)
+
+    def lookup(self, digits: str) -> Optional[CardScheme]:
+        """Devuelve la franquicia del rango más específico que contiene el número"""
+        # Solo dígitos ASCII: isdigit() también acepta '²' o '٣', que int() rechaza o convierte
+        if not (digits.isascii() and digits.isdigit()):
+            return None
+        key = int(digits[:self.key_digits].ljust(self.key_digits, "0"))
+        index = bisect.bisect_right(self._starts, key) - 1
+        if index >= 0 and key < self._ends[index]:
+            return self._schemes[index]
+        return None
+
+
+DEFAULT_IIN_TABLE = IINTable.from_csv()
+
+
+def normalize_card_number(card_number: str) -> str:
+    return card_number.replace(" ", "").replace("-", "")
+
+
+def luhn_valid(digits: str) -> bool:
+    """Algoritmo de Luhn sobre una cadena de solo dígitos"""
+    if not digits:
+        return False
+    doubled = digits[-2::-2].translate(_LUHN_DOUBLED)
+    total = sum(digits[-1::-2].encode()) + sum(doubled.encode()) - 48 * len(digits)
+    return total % 10 == 0
+
+
+def inspect_card(card_number: str, table: IINTable = DEFAULT_IIN_TABLE) -> CardInfo:
+    """Valida un número completo y resuelve franquicia, longitud y país emisor"""
+    digits = normalize_card_number(card_number)
+    if not (digits.isascii() and digits.isdigit()):
+        return CardInfo(number_valid=False, luhn_valid=False, length_valid=False)
+
+    luhn_ok = luhn_valid(digits)
+    scheme = table.lookup(digits)
+    if scheme is None:
+        return CardInfo(number_valid=False, luhn_valid=luhn_ok, length_valid=False)
+
+    length_ok = len(digits) in scheme.lengths
+    return CardInfo(
+        number_valid=luhn_ok and length_ok,
+        luhn_valid=luhn_ok,
+        length_valid=length_ok,
+        scheme=scheme.scheme,
+        country=scheme.country,
+    )
+
+
+def get_card_type(card_number: str, table: IINTable = DEFAULT_IIN_TABLE) -> str:
+    scheme = table.lookup(normalize_card_number(card_number))
+    return scheme.scheme if scheme else UNKNOWN_SCHEME
+
+
+def validate_cards(card_numbers: Iterable[str], table: IINTable = DEFAULT_IIN_TABLE) -> List[CardInfo]:
+    """Validación por lotes de números completos"""
+    return [inspect_card(number, table) for number in card_numbers]
+
+
+def reconcile_card_records(records: Iterable[Dict[str, Any]], table: IINTable = DEFAULT_IIN_TABLE) -> Dict[str, Any]:
+    """
+    Revisa registros almacenados (``card_last_four``/``card_type``) y reporta los
+    que no tienen un sufijo de 4 dígitos o una franquicia conocida.
+    """
+    checked = 0
+    by_type: Counter = Counter()
+    issues: List[Dict[str, Any]] = []
+    for record in records:
+        checked += 1
+        last_four = record.get("card_last_four") or ""
+        card_type = record.get("card_type") or UNKNOWN_SCHEME
+        by_type[card_type] += 1
+
+        reasons = []
+        if len(last_four) != 4 or not last_four.isdigit():
+            reasons.append("invalid_last_four")
+        if card_type not in table.scheme_names:
+            reasons.append("unknown_card_type")
+        if reasons:
+            issues.append({
+                "id": record.get("id"),
+                "transaction_id": record.get("transaction_id"),
+                "card_last_four": last_four,
+                "card_type": card_type,
+                "reasons": reasons,
+            })
+
+    return {
+        "checked": checked,
+        "invalid": len(issues),
+        "by_card_type": dict(by_type),
+        "issues": issues,
+    }
@@ -0,0 +1,196 @@
+"""
+Compresión de respuestas negociada con ``Accept-Encoding``.
+
+- gzip siempre; brotli (``brotli``/``brotlicffi``) y zstd (``zstandard``) si
+  están instalados. Entre las codificaciones aceptadas con la misma ``q`` se
+  prefiere br > zstd > gzip.
+- Solo tipos compresibles (JSON, texto, JS, XML, SVG) y cuerpos de al menos
+  ``COMPRESSION_MIN_BYTES`` (1024). Las respuestas en streaming
+  (``more_body``, p. ej. ``FileResponse``) pasan sin tocar.
+- Las respuestas GET 200 reciben un ``ETag`` débil calculado sobre el cuerpo
+  sin comprimir; los bytes comprimidos se guardan por (ETag, codificación) en
+  un LRU de ``COMPRESSION_CACHE_MB`` (32), así un catálogo idéntico se comprime
+  una vez y no en cada petición. ``If-None-Match`` con ese ETag responde 304.
+"""
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+from farmachelo import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 5))
+ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", 3))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+compression_cache_total = metrics.registry.register(metrics.Counter(
+    "farmachelo_compression_cache_total", "Respuestas comprimidas servidas desde caché o comprimidas al vuelo", ("encoding", "result")))
+
+
+def _encoders() -> Dict[str, Callable[[bytes], bytes]]:
+    encoders: Dict[str, Callable[[bytes], bytes]] = {}
+    if brotli is not None:
+        encoders["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        encoders["zstd"] = compressor.compress
+    encoders["gzip"] = lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return encoders
+
+
+ENCODERS = _encoders()
+
+
+def negotiate(accept_encoding: str, available=None) -> Optional[str]:
+    """Mejor codificación disponible según las ``q`` del cliente (orden del servidor en empates)"""
+    available = available or ENCODERS
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def body_etag(body: bytes) -> str:
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+class CompressedCache:
+    """LRU de cuerpos comprimidos acotado por bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def put(self, key: Tuple[str, str], body: bytes) -> None:
+        if len(body) > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI: compresión negociada, ETag y caché de bytes comprimidos"""
+
+    def __init__(self, app, minimum_size: Optional[int] = None, cache_bytes: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size or int(os.environ.get("COMPRESSION_MIN_BYTES", 1024))
+        self.cache = CompressedCache(cache_bytes or int(float(os.environ.get("COMPRESSION_CACHE_MB", 32)) * 1024 * 1024))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        if_none_match = None
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+            elif key == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+        encoding = negotiate(accept_encoding) if accept_encoding else None
+        conditional = scope["method"] in ("GET", "HEAD")
+        pending_start = None
+
+        async def send_wrapper(message):
+            nonlocal pending_start
+            if message["type"] == "http.response.start":
+                pending_start = message
+                return
+            if message["type"] != "http.response.body" or pending_start is None:
+                await send(message)
+                return
+            start, pending_start = pending_start, None
+            if message.get("more_body", False):
+                # Streaming: sin ETag ni compresión
+                await send(start)
+                await send(message)
+                return
+            start, body = self._finalize(start, message.get("body", b""), encoding, conditional, if_none_match)
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _finalize(self, start, body: bytes, encoding: Optional[str], conditional: bool, if_none_match: Optional[str]):
+        status = start["status"]
+        headers = MutableHeaders(raw=list(start.get("headers", [])))
+
+        etag = headers.get("etag")
+        if etag is None and conditional and status == 200 and body and "no-store" not in headers.get("cache-control", ""):
+            etag = headers["etag"] = body_etag(body)
+        if etag is not None and if_none_match and conditional and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+            for name in ("content-length", "content-type", "content-encoding"):
+                if name in headers:
+                    del headers[name]
+            return {**start, "status": 304, "headers": headers.raw}, b""
+
+        content_type = headers.get("content-type", "")
+        if (
+            encoding is None
+            or status in (204, 206, 304)
+            or len(body) < self.minimum_size
+            or "content-encoding" in headers
+            or not content_type.startswith(COMPRESSIBLE_TYPES)
+        ):
+            return {**start, "headers": headers.raw}, body
+
+        compressed = None
+        if etag is not None:
+            compressed = self.cache.get((etag, encoding))
+        if compressed is None:
+            compressed = ENCODERS[encoding](body)
+            if etag is not None:
+                self.cache.put((etag, encoding), compressed)
+            compression_cache_total.inc((encoding, "miss" if etag is not None else "uncached"))
+        else:
+            compression_cache_total.inc((encoding, "hit"))
+
+        headers["content-encoding"] = encoding
+        headers["content-length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        return {**start, "headers": headers.raw}, compressed
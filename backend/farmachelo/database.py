@@ -0,0 +1,329 @@
+"""
+Configuración del cliente de MongoDB y clases de operación.
+
+El cliente se construye a partir de ``MONGO_URL`` más variables ``MONGO_*``; una
+opción escrita en la URI siempre gana sobre la variable equivalente, así cada
+entorno puede ajustar el pool desde donde le resulte cómodo.
+
+==================================  ===========================  ==============
+Variable                            Opción del driver            Por defecto
+==================================  ===========================  ==============
+``MONGO_MAX_POOL_SIZE``             maxPoolSize                  100
+``MONGO_MIN_POOL_SIZE``             minPoolSize                  0
+``MONGO_MAX_CONNECTING``            maxConnecting                2
+``MONGO_MAX_IDLE_MS``               maxIdleTimeMS                sin límite
+``MONGO_WAIT_QUEUE_TIMEOUT_MS``     waitQueueTimeoutMS           sin límite
+``MONGO_SERVER_SELECTION_MS``       serverSelectionTimeoutMS     30000
+``MONGO_CONNECT_TIMEOUT_MS``        connectTimeoutMS             20000
+``MONGO_SOCKET_TIMEOUT_MS``         socketTimeoutMS              sin límite
+``MONGO_COMPRESSORS``               compressors                  ninguno
+``MONGO_RETRY_WRITES``              retryWrites                  true
+``MONGO_APPNAME``                   appname                      farmachelo
+==================================  ===========================  ==============
+
+``MONGO_COMPRESSORS`` acepta ``zstd,snappy,zlib``; los que no tengan su librería
+instalada se descartan con un aviso. Los tamaños de pool son por proceso: con
+``WORKERS=n`` el servidor abre hasta ``n × maxPoolSize`` conexiones.
+
+Clases de operación (``Workloads``): cada una es la misma base de datos con otro
+write concern / read preference, sin abrir otro cliente.
+
+- ``cart``: carrito, ``w:1`` (``MONGO_CART_W``). Se reconstruye desde el cliente.
+- ``payment``: pedidos, transacciones y facturas del flujo de pago, ``w:majority``
+  con journal y read concern majority (``MONGO_PAYMENT_W``,
+  ``MONGO_PAYMENT_WTIMEOUT_MS``).
+- ``analytics``: estadísticas del panel, ``secondaryPreferred``
+  (``MONGO_ANALYTICS_READ_PREFERENCE``, ``MONGO_ANALYTICS_MAX_STALENESS_S`` ≥ 90).
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference, monitoring
+from pymongo import compression_support
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from pymongo.write_concern import WriteConcern
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "mongodb://localhost:27017"
+DEFAULT_DB_NAME = "farmachelo_web_database"
+
+# Variable de entorno → (opción del driver, conversión)
+ENV_OPTIONS: Dict[str, Tuple[str, Any]] = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "MONGO_MAX_IDLE_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_COMPRESSORS": ("compressors", str),
+    "MONGO_RETRY_WRITES": ("retryWrites", lambda value: value.lower() in ("1", "true", "yes")),
+    "MONGO_APPNAME": ("appname", str),
+}
+
+_COMPRESSOR_AVAILABLE = {
+    "zstd": compression_support._HAVE_ZSTD,
+    "snappy": compression_support._HAVE_SNAPPY,
+    "zlib": compression_support._HAVE_ZLIB,
+}
+
+
+def uri_options(url: str) -> set:
+    """Opciones (en minúsculas) ya presentes en la query de la URI"""
+    return {key.lower() for key, _ in parse_qsl(urlsplit(url).query, keep_blank_values=True)}
+
+
+def available_compressors(value: str) -> str:
+    names = [name.strip().lower() for name in value.split(",") if name.strip()]
+    usable = [name for name in names if _COMPRESSOR_AVAILABLE.get(name)]
+    for name in set(names) - set(usable):
+        logger.warning(f"MongoDB compressor '{name}' is not available and will be ignored")
+    return ",".join(usable)
+
+
+def _write_concern(w: str, wtimeout_ms: int = 0, journal: Optional[bool] = None) -> WriteConcern:
+    value: Any = int(w) if w.isdigit() else w
+    return WriteConcern(w=value, wtimeout=wtimeout_ms or None, j=journal)
+
+
+# ==================== POOL ====================
+
+@dataclass
+class ServerPoolStats:
+    open: int = 0
+    checked_out: int = 0
+    waiting: int = 0
+    created_total: int = 0
+    closed_total: int = 0
+    checkouts_total: int = 0
+    checkout_failures: Dict[str, int] = field(default_factory=dict)
+    cleared_total: int = 0
+    last_cleared_at: Optional[float] = None
+    max_wait_ms: float = 0.0
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Estado vivo del pool por servidor, a partir de los eventos CMAP del driver"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers: Dict[Tuple[str, int], ServerPoolStats] = {}
+        self._checkout_started = threading.local()
+
+    def _server(self, address) -> ServerPoolStats:
+        stats = self._servers.get(address)
+        if stats is None:
+            stats = self._servers[address] = ServerPoolStats()
+        return stats
+
+    def connection_check_out_started(self, event):
+        self._checkout_started.value = time.perf_counter()
+        with self._lock:
+            self._server(event.address).waiting += 1
+
+    def _checkout_done(self, stats: ServerPoolStats) -> None:
+        stats.waiting = max(0, stats.waiting - 1)
+        started = getattr(self._checkout_started, "value", None)
+        if started is not None:
+            stats.max_wait_ms = max(stats.max_wait_ms, (time.perf_counter() - started) * 1000)
+            self._checkout_started.value = None
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            stats = self._server(event.address)
+            self._checkout_done(stats)
+            stats.checked_out += 1
+            stats.checkouts_total += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            stats = self._server(event.address)
+            self._checkout_done(stats)
+            stats.checkout_failures[event.reason] = stats.checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            stats = self._server(event.address)
+            stats.checked_out = max(0, stats.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            stats = self._server(event.address)
+            stats.open += 1
+            stats.created_total += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            stats = self._server(event.address)
+            stats.open = max(0, stats.open - 1)
+            stats.closed_total += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        with self._lock:
+            self._server(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            stats = self._server(event.address)
+            stats.cleared_total += 1
+            stats.last_cleared_at = time.time()
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._servers.pop(event.address, None)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                f"{host}:{port}": {
+                    "open": stats.open,
+                    "checked_out": stats.checked_out,
+                    "available": max(0, stats.open - stats.checked_out),
+                    "waiting": stats.waiting,
+                    "created_total": stats.created_total,
+                    "closed_total": stats.closed_total,
+                    "checkouts_total": stats.checkouts_total,
+                    "checkout_failures": dict(stats.checkout_failures),
+                    "cleared_total": stats.cleared_total,
+                    "last_cleared_at": stats.last_cleared_at,
+                    "max_wait_ms": round(stats.max_wait_ms, 2),
+                }
+                for (host, port), stats in self._servers.items()
+            }
+
+    def reset_peaks(self) -> None:
+        with self._lock:
+            for stats in self._servers.values():
+                stats.max_wait_ms = 0.0
+
+
+# ==================== CLASES DE OPERACIÓN ====================
+
+@dataclass(frozen=True)
+class Workload:
+    write_concern: Optional[WriteConcern] = None
+    read_preference: Any = None
+    read_concern: Optional[ReadConcern] = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "write_concern": self.write_concern.document if self.write_concern else "default",
+            "read_preference": self.read_preference.document if self.read_preference else "default",
+            "read_concern": self.read_concern.level if self.read_concern and self.read_concern.level else "default",
+        }
+
+
+def workloads_from_env() -> Dict[str, Workload]:
+    analytics_mode = os.environ.get("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+    max_staleness = int(os.environ.get("MONGO_ANALYTICS_MAX_STALENESS_S", -1))
+    analytics_preference = (
+        ReadPreference.PRIMARY if analytics_mode == "primary"
+        else make_read_preference(read_pref_mode_from_name(analytics_mode), None, max_staleness=max_staleness)
+    )
+    return {
+        "cart": Workload(write_concern=_write_concern(os.environ.get("MONGO_CART_W", "1"))),
+        "payment": Workload(
+            write_concern=_write_concern(
+                os.environ.get("MONGO_PAYMENT_W", "majority"),
+                int(os.environ.get("MONGO_PAYMENT_WTIMEOUT_MS", 5000)),
+                journal=True,
+            ),
+            read_preference=ReadPreference.PRIMARY,
+            read_concern=ReadConcern("majority"),
+        ),
+        "analytics": Workload(read_preference=analytics_preference, read_concern=ReadConcern("local")),
+    }
+
+
+class Workloads:
+    """Vistas de la base de datos por clase de operación (comparten cliente y pool)"""
+
+    def __init__(self, db, definitions: Dict[str, Workload]):
+        self.definitions = definitions
+        for name, workload in definitions.items():
+            setattr(self, name, db.with_options(
+                write_concern=workload.write_concern,
+                read_preference=workload.read_preference,
+                read_concern=workload.read_concern,
+            ))
+
+    def describe(self) -> Dict[str, Dict[str, Any]]:
+        return {name: workload.describe() for name, workload in self.definitions.items()}
+
+
+# ==================== CLIENTE ====================
+
+class MongoConfig:
+    def __init__(self, url: str = DEFAULT_URL, db_name: str = DEFAULT_DB_NAME, options: Optional[Dict[str, Any]] = None):
+        self.url = url
+        self.db_name = db_name
+        self.options = options or {}
+
+    @classmethod
+    def from_env(cls) -> "MongoConfig":
+        url = os.environ.get("MONGO_URL", DEFAULT_URL)
+        in_uri = uri_options(url)
+        options: Dict[str, Any] = {}
+        for variable, (option, convert) in ENV_OPTIONS.items():
+            value = os.environ.get(variable)
+            if not value or option.lower() in in_uri:
+                continue
+            options[option] = convert(value)
+        if "compressors" in options:
+            options["compressors"] = available_compressors(options["compressors"])
+            if not options["compressors"]:
+                del options["compressors"]
+        if "appname" not in in_uri:
+            options.setdefault("appname", "farmachelo")
+        return cls(url, os.environ.get("DB_NAME", DEFAULT_DB_NAME), options)
+
+    def client(self, event_listeners: Optional[list] = None) -> AsyncIOMotorClient:
+        return AsyncIOMotorClient(self.url, event_listeners=event_listeners or [], **self.options)
+
+
+def effective_options(client) -> Dict[str, Any]:
+    """Opciones con las que quedó el cliente (URI + variables + valores por defecto)"""
+    options = client.options
+    pool = options.pool_options
+    return {
+        "max_pool_size": pool.max_pool_size,
+        "min_pool_size": pool.min_pool_size,
+        "max_connecting": pool.max_connecting,
+        "max_idle_time_s": pool.max_idle_time_seconds,
+        "wait_queue_timeout_s": pool.wait_queue_timeout,
+        "connect_timeout_s": pool.connect_timeout,
+        "socket_timeout_s": pool.socket_timeout,
+        "server_selection_timeout_s": options.server_selection_timeout,
+        "compressors": list(pool._compression_settings.compressors or []),
+        "retry_writes": options.retry_writes,
+        "appname": pool.metadata.get("application", {}).get("name"),
+        "write_concern": options.write_concern.document,
+        "read_preference": options.read_preference.document,
+    }
+
+
+def topology(client) -> Dict[str, Dict[str, Any]]:
+    """Tipo y RTT de cada servidor conocido, según el monitor del driver"""
+    description = client.topology_description
+    return {
+        f"{host}:{port}": {
+            "type": server.server_type_name,
+            "round_trip_ms": round(server.round_trip_time * 1000, 2) if server.round_trip_time is not None else None,
+        }
+        for (host, port), server in description.server_descriptions().items()
+    }
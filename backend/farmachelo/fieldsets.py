@@ -0,0 +1,67 @@
+"""
+Campos dispersos (``?fields=id,name,price``) llevados hasta la proyección de MongoDB.
+
+``sparse_fields(Model)`` crea una dependencia de FastAPI que valida los nombres
+contra los campos del modelo de respuesta (más los campos calculados que la
+ruta declare en ``extra``) y devuelve un ``FieldSet``:
+
+- ``fieldset.projection(*needed)``: proyección con los campos pedidos más los
+  que la ruta necesita internamente (``None`` si no se pidió ``fields``).
+- ``fieldset.trim(doc)``: quita de la respuesta lo que no se pidió.
+- ``fieldset.wants(name)``: para omitir enriquecimientos (y sus consultas) no
+  solicitados.
+
+Solo se admiten campos de primer nivel; ``id`` se incluye siempre.
+"""
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Type
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+
+
+class FieldSet:
+    def __init__(self, names: Optional[FrozenSet[str]] = None):
+        self.names = names
+
+    @property
+    def sparse(self) -> bool:
+        return self.names is not None
+
+    def wants(self, name: str) -> bool:
+        return self.names is None or name in self.names
+
+    def projection(self, *needed: str, stored: Optional[Iterable[str]] = None) -> Optional[Dict[str, int]]:
+        """``stored`` limita a los campos que existen en la colección (descarta los calculados)"""
+        if self.names is None:
+            return None
+        names = self.names if stored is None else self.names & frozenset(stored)
+        return {"_id": 0, **{name: 1 for name in sorted(names | frozenset(needed))}}
+
+    def trim(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        if self.names is None:
+            return document
+        return {key: value for key, value in document.items() if key in self.names}
+
+
+ALL_FIELDS = FieldSet()
+
+
+def parse_fields(value: Optional[str], allowed: FrozenSet[str], always: Iterable[str] = ("id",)) -> FieldSet:
+    if not value:
+        return ALL_FIELDS
+    names = frozenset(name.strip() for name in value.split(",") if name.strip())
+    unknown = names - allowed
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(sorted(unknown))}")
+    return FieldSet(names | (frozenset(always) & allowed))
+
+
+def sparse_fields(model: Type[BaseModel], extra: Iterable[str] = (), always: Iterable[str] = ("id",)) -> Callable[..., FieldSet]:
+    allowed = frozenset(model.model_fields) | frozenset(extra)
+    always = tuple(always)
+    description = f"Campos a devolver, separados por comas: {', '.join(sorted(allowed))}"
+
+    def dependency(fields: Optional[str] = Query(None, description=description)) -> FieldSet:
+        return parse_fields(fields, allowed, always)
+
+    return dependency
@@ -0,0 +1,260 @@
+"""
+Puntaje de fraude por velocidad para el flujo de pagos.
+
+Cada dimensión (email, tarjeta y IP) mantiene en memoria ventanas deslizantes
+con cubetas en anillo (conteo y suma de montos). El puntaje se calcula sin tocar
+la base de datos; periódicamente los incrementos locales se vuelcan a MongoDB y
+se releen los totales de los demás workers, solo para las claves que este worker
+tiene en memoria. Una clave nueva se carga de MongoDB (``load``) la primera vez
+que se puntúa, así la memoria y el tráfico crecen con la actividad del worker y
+no con el total de tarjetas, IPs y usuarios.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ALLOW = "allow"
+FLAG = "flag"
+REJECT = "reject"
+
+
+class SlidingWindow:
+    """Ventana deslizante de ``n_buckets`` cubetas de ``bucket_seconds`` en un anillo"""
+
+    __slots__ = ("bucket_seconds", "n_buckets", "_epochs", "_counts", "_amounts")
+
+    def __init__(self, bucket_seconds: int, n_buckets: int):
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = n_buckets
+        self._epochs = [-1] * n_buckets
+        self._counts = [0] * n_buckets
+        self._amounts = [0.0] * n_buckets
+
+    def epoch(self, now: float) -> int:
+        return int(now // self.bucket_seconds)
+
+    def _slot(self, epoch: int) -> int:
+        slot = epoch % self.n_buckets
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._counts[slot] = 0
+            self._amounts[slot] = 0.0
+        return slot
+
+    def add(self, now: float, amount: float, count: int = 1) -> None:
+        slot = self._slot(self.epoch(now))
+        self._counts[slot] += count
+        self._amounts[slot] += amount
+
+    def set_bucket(self, epoch: int, count: int, amount: float, now: float) -> None:
+        """Fija el valor absoluto de una cubeta (usado al sincronizar con MongoDB)"""
+        if epoch <= self.epoch(now) - self.n_buckets:
+            return
+        slot = self._slot(epoch)
+        self._counts[slot] = count
+        self._amounts[slot] = amount
+
+    def totals(self, now: float) -> Tuple[int, float]:
+        oldest = self.epoch(now) - self.n_buckets
+        count = 0
+        amount = 0.0
+        for slot, epoch in enumerate(self._epochs):
+            if epoch > oldest:
+                count += self._counts[slot]
+                amount += self._amounts[slot]
+        return count, amount
+
+    def is_empty(self, now: float) -> bool:
+        oldest = self.epoch(now) - self.n_buckets
+        return all(epoch <= oldest for epoch in self._epochs)
+
+
+@dataclass(frozen=True)
+class VelocityLimit:
+    max_count: int
+    max_amount: float
+    weight: int
+
+
+@dataclass
+class FraudDecision:
+    score: int
+    action: str
+    reasons: List[str] = field(default_factory=list)
+
+
+class VelocityGuard:
+    """Ventanas por dimensión, reglas de puntaje y sincronización con MongoDB"""
+
+    collection_name = "fraud_velocity"
+    refresh_batch = 500
+
+    def __init__(
+        self,
+        limits: Dict[str, VelocityLimit],
+        window_seconds: int = 600,
+        bucket_seconds: int = 30,
+        flag_score: int = 40,
+        reject_score: int = 80,
+    ):
+        self.limits = limits
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = max(1, window_seconds // bucket_seconds)
+        self.flag_score = flag_score
+        self.reject_score = reject_score
+        self._windows: Dict[Tuple[str, str], SlidingWindow] = {}
+        self._pending: Dict[Tuple[str, str, int], List[float]] = {}
+
+    @classmethod
+    def from_env(cls) -> "VelocityGuard":
+        env = os.environ.get
+        return cls(
+            limits={
+                "email": VelocityLimit(int(env("FRAUD_EMAIL_MAX_PAYMENTS", 5)), float(env("FRAUD_EMAIL_MAX_AMOUNT", 2000000)), 30),
+                "card": VelocityLimit(int(env("FRAUD_CARD_MAX_PAYMENTS", 3)), float(env("FRAUD_CARD_MAX_AMOUNT", 2000000)), 40),
+                "ip": VelocityLimit(int(env("FRAUD_IP_MAX_PAYMENTS", 10)), float(env("FRAUD_IP_MAX_AMOUNT", 5000000)), 30),
+            },
+            window_seconds=int(env("FRAUD_WINDOW_SECONDS", 600)),
+            bucket_seconds=int(env("FRAUD_BUCKET_SECONDS", 30)),
+            flag_score=int(env("FRAUD_FLAG_SCORE", 40)),
+            reject_score=int(env("FRAUD_REJECT_SCORE", 80)),
+        )
+
+    def _window(self, dimension: str, key: str) -> SlidingWindow:
+        window = self._windows.get((dimension, key))
+        if window is None:
+            window = self._windows[(dimension, key)] = SlidingWindow(self.bucket_seconds, self.n_buckets)
+        return window
+
+    def assess(
+        self,
+        amount: float,
+        email: Optional[str] = None,
+        card: Optional[str] = None,
+        ip: Optional[str] = None,
+        now: Optional[float] = None,
+    ) -> FraudDecision:
+        """
+        Calcula el puntaje del intento (incluyéndolo en los totales) y lo registra
+        en las ventanas, sea cual sea la decisión.
+        """
+        now = time.time() if now is None else now
+        score = 0
+        reasons = []
+        for dimension, key in (("email", email), ("card", card), ("ip", ip)):
+            if not key:
+                continue
+            limit = self.limits.get(dimension)
+            window = self._window(dimension, key)
+            if limit is not None:
+                count, total = window.totals(now)
+                if count + 1 > limit.max_count:
+                    score += limit.weight
+                    reasons.append(f"{dimension}_velocity")
+                if total + amount > limit.max_amount:
+                    score += limit.weight
+                    reasons.append(f"{dimension}_amount")
+            window.add(now, amount)
+            pending = self._pending.setdefault((dimension, key, window.epoch(now)), [0, 0.0])
+            pending[0] += 1
+            pending[1] += amount
+
+        score = min(score, 100)
+        if score >= self.reject_score:
+            action = REJECT
+        elif score >= self.flag_score:
+            action = FLAG
+        else:
+            action = ALLOW
+        return FraudDecision(score=score, action=action, reasons=reasons)
+
+    async def ensure_indexes(self, db) -> None:
+        await db[self.collection_name].create_index("expires_at", expireAfterSeconds=0)
+        await db[self.collection_name].create_index([("dimension", 1), ("key", 1), ("epoch", 1)])
+
+    async def _refresh(self, db, keys: List[Tuple[str, str]], now: float) -> None:
+        """Recarga de MongoDB las cubetas recientes de ``keys`` (dimensión, clave)"""
+        oldest = int(now // self.bucket_seconds) - self.n_buckets
+        by_dimension: Dict[str, List[str]] = {}
+        for dimension, key in keys:
+            by_dimension.setdefault(dimension, []).append(key)
+        for dimension, dimension_keys in by_dimension.items():
+            for i in range(0, len(dimension_keys), self.refresh_batch):
+                query = {"dimension": dimension, "key": {"$in": dimension_keys[i:i + self.refresh_batch]}, "epoch": {"$gt": oldest}}
+                async for doc in db[self.collection_name].find(query, {"expires_at": 0}):
+                    key, epoch = doc["key"], doc["epoch"]
+                    # Los intentos registrados durante el volcado aún no están en MongoDB
+                    unsynced = self._pending.get((dimension, key, epoch), (0, 0.0))
+                    self._window(dimension, key).set_bucket(
+                        epoch, doc["count"] + unsynced[0], doc["amount"] + unsynced[1], now
+                    )
+
+    async def load(
+        self,
+        db,
+        email: Optional[str] = None,
+        card: Optional[str] = None,
+        ip: Optional[str] = None,
+        now: Optional[float] = None,
+    ) -> None:
+        """Trae de MongoDB las claves que este worker aún no tiene en memoria (antes de ``assess``)"""
+        now = time.time() if now is None else now
+        missing = [
+            (dimension, key) for dimension, key in (("email", email), ("card", card), ("ip", ip))
+            if key and (dimension, key) not in self._windows
+        ]
+        if missing:
+            await self._refresh(db, missing, now)
+
+    async def sync(self, db, now: Optional[float] = None) -> None:
+        """Vuelca los incrementos locales y recarga los totales de las claves en memoria"""
+        now = time.time() if now is None else now
+        collection = db[self.collection_name]
+
+        pending, self._pending = self._pending, {}
+        if pending:
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.window_seconds + self.bucket_seconds)
+            operations = [
+                UpdateOne(
+                    {"_id": f"{dimension}:{key}:{epoch}"},
+                    {
+                        "$inc": {"count": count, "amount": amount},
+                        "$setOnInsert": {"dimension": dimension, "key": key, "epoch": epoch, "expires_at": expires_at},
+                    },
+                    upsert=True,
+                )
+                for (dimension, key, epoch), (count, amount) in pending.items()
+            ]
+            try:
+                await collection.bulk_write(operations, ordered=False)
+            except Exception:
+                # Reintentar en la próxima sincronización sin perder los incrementos
+                for bucket, (count, amount) in pending.items():
+                    merged = self._pending.setdefault(bucket, [0, 0.0])
+                    merged[0] += count
+                    merged[1] += amount
+                raise
+
+        # Las claves sin actividad en la ventana se olvidan; si vuelven, ``load`` las trae
+        for window_key in [k for k, w in self._windows.items() if w.is_empty(now)]:
+            del self._windows[window_key]
+        await self._refresh(db, list(self._windows), now)
+
+    async def run_sync_loop(self, db, interval: float = 5.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error syncing fraud velocity counters: {str(e)}")
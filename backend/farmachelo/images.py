@@ -0,0 +1,164 @@
+"""
+Derivados de imágenes de producto (miniatura, tarjeta, detalle) en JPEG/PNG y WebP.
+
+Las variantes se generan con Pillow en un pool de procesos (el redimensionado
+es CPU puro y bloquearía el event loop) y se guardan junto al original en el
+almacén de ``farmachelo.uploads`` como ``<sha256>-<ancho>w.<ext>``; como el
+nombre depende del contenido, regenerar es idempotente y barato. Con un
+backend remoto (GridFS, S3) el original se copia a ``uploads/.derive``, se
+renderiza ahí y las variantes se suben al backend.
+
+En el documento del producto quedan:
+
+- ``image_variants``: ``{"thumb": {"width", "height", "src", "webp"}, ...}``
+- ``image_srcset``: ``{"src": "url 160w, url 400w, ...", "webp": "..."}``,
+  listo para ``<img srcset>`` / ``<source type="image/webp" srcset>``.
+
+Las imágenes remotas (``image_url`` http/https, p. ej. Unsplash) se descargan
+una vez a ``uploads/.remote-cache`` y se importan al almacén antes de derivar.
+``IMAGE_WORKERS`` fija el tamaño del pool (2 por defecto).
+
+El pool usa ``spawn``: los hijos no heredan los hilos de Motor ni el estado
+del loop, pero cada uno reimporta el ``__main__`` del padre como
+``__mp_main__``. Por eso ``python server.py`` no ejecuta la app como
+``__main__``: cede el control a ``farmachelo.launcher`` antes de importar
+nada, y los hijos solo cargan el lanzador y este módulo.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from farmachelo import uploads
+
+DERIVATIVE_WIDTHS = {"thumb": 160, "card": 400, "detail": 1000}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+STORED_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+
+
+def render_derivatives(source: str, out_dir: str, basename: str, url_prefix: str) -> Dict[str, Dict[str, Any]]:
+    """Se ejecuta en un proceso del pool: genera (o reutiliza) las variantes de ``source``"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        fallback_ext, fallback_format, fallback_options = (
+            ("png", "PNG", {"optimize": True}) if has_alpha
+            else ("jpg", "JPEG", {"quality": JPEG_QUALITY, "optimize": True, "progressive": True})
+        )
+
+        variants: Dict[str, Dict[str, Any]] = {}
+        for name, max_width in DERIVATIVE_WIDTHS.items():
+            # No se amplían imágenes más pequeñas que el tamaño pedido
+            width = min(max_width, image.width)
+            height = max(1, round(image.height * width / image.width))
+            resized = None
+            entry: Dict[str, Any] = {"width": width, "height": height}
+            for key, ext, image_format, options in (
+                ("src", fallback_ext, fallback_format, fallback_options),
+                ("webp", "webp", "WEBP", {"quality": WEBP_QUALITY, "method": 4}),
+            ):
+                filename = f"{basename}-{width}w.{ext}"
+                path = os.path.join(out_dir, filename)
+                if not os.path.exists(path):
+                    if resized is None:
+                        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                    temp_path = f"{path}.{os.getpid()}.tmp"
+                    resized.save(temp_path, image_format, **options)
+                    os.replace(temp_path, path)
+                entry[key] = f"{url_prefix}/{filename}"
+            variants[name] = entry
+    return variants
+
+
+def build_srcset(variants: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    srcset = {}
+    for key in ("src", "webp"):
+        seen = {}
+        for entry in sorted(variants.values(), key=lambda entry: entry["width"]):
+            seen.setdefault(entry["width"], entry[key])
+        srcset[key] = ", ".join(f"{url} {width}w" for width, url in seen.items())
+    return srcset
+
+
+class ImagePipeline:
+    def __init__(self, store: uploads.ContentAddressedStore, workers: Optional[int] = None):
+        self.store = store
+        self.workers = workers or int(os.environ.get("IMAGE_WORKERS", 2))
+        self.remote_cache = store.root / ".remote-cache"
+        self.work_dir = store.root / ".derive"
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: ver el docstring del módulo (los hijos no importan la app)
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def local_filename(self, image_url: Optional[str]) -> Optional[str]:
+        """Nombre en el almacén si ``image_url`` apunta a un original subido"""
+        filename = self.store.filename_for_url(image_url)
+        if filename is None or not STORED_NAME.match(filename) or await self.store.blobs.stat(filename) is None:
+            return None
+        return filename
+
+    async def _render(self, source: Path, out_dir: Path, basename: str) -> Dict[str, Dict[str, Any]]:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor(), render_derivatives, str(source), str(out_dir), basename, self.store.url_base,
+        )
+
+    async def derive(self, filename: str) -> Dict[str, Any]:
+        """Campos ``image_variants``/``image_srcset`` para un original del almacén"""
+        basename = filename.rsplit(".", 1)[0]
+        local_root = self.store.blobs.local_root
+        if local_root is not None:
+            variants = await self._render(local_root / filename, local_root, basename)
+        else:
+            work_dir = self.work_dir / basename
+            source = work_dir / filename
+            try:
+                await self.store.blobs.fetch_to(filename, source)
+                variants = await self._render(source, work_dir, basename)
+                for entry in variants.values():
+                    for key, content_type in (("src", None), ("webp", "image/webp")):
+                        name = entry[key].rsplit("/", 1)[-1]
+                        content_type = content_type or ("image/png" if name.endswith(".png") else "image/jpeg")
+                        await self.store.blobs.put_file(name, work_dir / name, content_type)
+            finally:
+                await asyncio.to_thread(shutil.rmtree, work_dir, True)
+        return {"image_variants": variants, "image_srcset": build_srcset(variants)}
+
+    async def fields_for_url(self, image_url: Optional[str]) -> Dict[str, Any]:
+        """Variantes para un ``image_url`` local; vacío si no es un original subido"""
+        filename = await self.local_filename(image_url)
+        if filename is None:
+            return {}
+        return await self.derive(filename)
+
+    async def fetch_remote(self, url: str, http) -> str:
+        """Descarga (con caché local por URL) e importa al almacén; devuelve el nombre almacenado"""
+        cached = self.remote_cache / hashlib.sha256(url.encode()).hexdigest()
+        if not cached.exists():
+            self.remote_cache.mkdir(parents=True, exist_ok=True)
+            temp_path = cached.with_suffix(f".{os.getpid()}.tmp")
+            async with http.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(temp_path, "wb") as handle:
+                    async for chunk in response.aiter_bytes(uploads.CHUNK_SIZE):
+                        await asyncio.to_thread(handle.write, chunk)
+            os.replace(temp_path, cached)
+        stored = await self.store.import_path(cached)
+        return stored.filename
@@ -0,0 +1,55 @@
+"""
+Índices de MongoDB para las formas de consulta que usa ``server.py``.
+
+Se aplican al arrancar (``lifespan``) y con ``python -m farmachelo.manage
+ensure-indexes``. ``create_index`` es idempotente si la definición no cambia.
+"""
+from typing import Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_1"),
+        IndexModel([("email", ASCENDING)], name="email_1"),
+    ],
+    "admin_users": [
+        IndexModel([("id", ASCENDING)], name="id_1"),
+        IndexModel([("email", ASCENDING)], name="email_1"),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], name="id_1"),
+        IndexModel([("active", ASCENDING), ("category", ASCENDING)], name="active_1_category_1"),
+    ],
+    "carts": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_1"),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], name="id_1"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_1_created_at_-1"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_1_created_at_-1"),
+        IndexModel([("created_at", DESCENDING)], name="created_at_-1"),
+    ],
+    "prescription_uploads": [
+        IndexModel([("id", ASCENDING)], name="id_1"),
+        # Las sesiones de subida abandonadas caducan solas
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "payment_transactions": [
+        IndexModel([("transaction_id", ASCENDING)], name="transaction_id_1"),
+    ],
+    "invoices": [
+        IndexModel([("id", ASCENDING)], name="id_1"),
+        IndexModel([("user_id", ASCENDING), ("issue_date", DESCENDING)], name="user_id_1_issue_date_-1"),
+        IndexModel([("status", ASCENDING), ("issue_date", DESCENDING)], name="status_1_issue_date_-1"),
+        IndexModel([("issue_date", DESCENDING)], name="issue_date_-1"),
+        IndexModel([("payment_transaction_id", ASCENDING)], name="payment_transaction_id_1"),
+    ],
+}
+
+
+async def ensure_indexes(db) -> List[Tuple[str, List[str]]]:
+    created = []
+    for collection, models in INDEXES.items():
+        created.append((collection, await db[collection].create_indexes(models)))
+    return created
@@ -0,0 +1,115 @@
+"""
+Respuestas JSON rápidas para listados.
+
+FastAPI valida el valor devuelto contra ``response_model`` y lo serializa con
+``jsonable_encoder`` + ``json.dumps``; si el handler ya construyó un modelo por
+documento, cada elemento se valida dos veces. Aquí:
+
+- ``list_response(Model, docs)`` valida la lista una sola vez con un
+  ``TypeAdapter(List[Model])`` cacheado y serializa con ``orjson``.
+- ``list_response(Model, docs, trusted=True)`` no valida: toma los campos del
+  modelo de cada documento (rellenando los ausentes con su valor por defecto) y
+  los serializa directamente. Solo si todos los que escriben la colección
+  guardan los tipos del modelo; en ``server.py`` es opcional
+  (``RESPONSE_VALIDATION=trusted``).
+- ``fields`` (ver ``farmachelo.fieldsets``) restringe la salida a un
+  subconjunto de campos; en modo validado se usa un submodelo con solo esos
+  campos, cacheado por combinación.
+
+``orjson`` maneja ``datetime`` de forma nativa (ISO 8601, igual que FastAPI) y
+``ObjectId`` se serializa como cadena. Al devolver un ``Response`` FastAPI omite
+su propia validación; ``response_model`` sigue sirviendo para OpenAPI.
+"""
+from functools import lru_cache
+from typing import Any, FrozenSet, Iterable, List, Optional, Tuple, Type
+
+import orjson
+from bson import ObjectId
+from pydantic import BaseModel, TypeAdapter, create_model
+from pydantic_core import PydanticUndefined
+from starlette.responses import Response
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+@lru_cache(maxsize=256)
+def partial_model(model: Type[BaseModel], names: FrozenSet[str]) -> Type[BaseModel]:
+    """Submodelo con solo ``names`` (mismos tipos y valores por defecto)"""
+    fields = {name: (field.annotation, field) for name, field in model.model_fields.items() if name in names}
+    return create_model(f"{model.__name__}Fields", **fields)
+
+
+@lru_cache(maxsize=256)
+def _model_defaults(model: Type[BaseModel], names: Optional[FrozenSet[str]] = None) -> Tuple[Tuple[str, bool, Any], ...]:
+    """(campo, es_factory, valor por defecto) en el orden del modelo"""
+    fields = []
+    for name, field in model.model_fields.items():
+        if names is not None and name not in names:
+            continue
+        if field.default_factory is not None:
+            fields.append((name, True, field.default_factory))
+        else:
+            fields.append((name, False, None if field.default is PydanticUndefined else field.default))
+    return tuple(fields)
+
+
+def trusted_dicts(model: Type[BaseModel], documents: Iterable[dict], fields: Optional[FrozenSet[str]] = None) -> List[dict]:
+    fields = _model_defaults(model, fields)
+    result = []
+    for document in documents:
+        item = {}
+        for name, is_factory, default in fields:
+            if name in document:
+                item[name] = document[name]
+            else:
+                item[name] = default() if is_factory else default
+        result.append(item)
+    return result
+
+
+def serialize_list(model: Type[BaseModel], documents: List[dict], trusted: bool = False, fields: Optional[FrozenSet[str]] = None) -> List[dict]:
+    if fields is not None:
+        fields = frozenset(fields) & frozenset(model.model_fields)
+    if trusted:
+        return trusted_dicts(model, documents, fields)
+    adapter = list_adapter(model if fields is None else partial_model(model, fields))
+    return adapter.dump_python(adapter.validate_python(documents))
+
+
+def list_response(model: Type[BaseModel], documents: List[dict], trusted: bool = False, fields: Optional[FrozenSet[str]] = None, status_code: int = 200) -> Response:
+    return FastJSONResponse(serialize_list(model, documents, trusted, fields), status_code=status_code)
+
+
+def model_response(model: Type[BaseModel], document: dict, trusted: bool = False, fields: Optional[FrozenSet[str]] = None, status_code: int = 200) -> Response:
+    return FastJSONResponse(serialize_list(model, [document], trusted, fields)[0], status_code=status_code)
+
+
+def model_projection(model: Type[BaseModel]) -> dict:
+    """Proyección de MongoDB con solo los campos del modelo (sin ``_id``)"""
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
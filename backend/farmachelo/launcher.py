@@ -0,0 +1,379 @@
+"""
+Lanzador de producción: varios workers uvicorn compartiendo un socket (pre-fork).
+
+    python server.py                            (equivale a la línea siguiente)
+    python -m farmachelo.launcher [server:app]
+
+- El proceso maestro abre el socket, importa la app (``PRELOAD_APP=on``) y
+  congela el heap (``gc.freeze``) antes de hacer fork, así los workers
+  comparten las páginas de código y datos en copy-on-write.
+- Los hooks de arranque que deben ejecutarse una sola vez (índices:
+  ``startup_once`` del módulo) corren en un proceso aparte antes de crear los
+  workers; el ``lifespan`` de cada worker los omite (``startup_done()``). Sin
+  lanzador (``uvicorn server:app``, TestClient) el ``lifespan`` los ejecuta
+  como siempre. Las tareas únicas que siguen en segundo plano (datos de
+  ejemplo y administrador por defecto) las lanza solo el worker 0.
+- ``SIGHUP``: reinicio escalonado. Se arranca un worker nuevo, se espera a
+  que acepte conexiones y solo entonces el viejo recibe ``SIGTERM`` (uvicorn
+  deja de aceptar y drena las conexiones abiertas durante
+  ``GRACEFUL_TIMEOUT``). Con la app precargada se reinician los procesos, no
+  el código; ``PRELOAD_APP=off`` importa la app en cada worker y un ``SIGHUP``
+  aplica el código nuevo.
+- Un worker que muere se reemplaza; si cae nada más arrancar se espera con
+  backoff exponencial (máx. 30 s) para no entrar en un bucle de fork.
+- ``SIGTERM``/``SIGINT``: apagado ordenado de todos los workers.
+
+Variables (``backend/.env``): ``HOST`` (0.0.0.0), ``PORT`` (8000),
+``WORKERS`` (``auto``: una por CPU disponible según afinidad y cuota de
+cgroup, limitado por ``WORKERS_MAX`` y por memoria con ``WORKER_MEMORY_MB``),
+``PRELOAD_APP`` (on), ``GRACEFUL_TIMEOUT`` (30), ``WORKER_BOOT_TIMEOUT`` (60),
+``BACKLOG`` (2048), ``KEEPALIVE_TIMEOUT`` (5) y ``ACCESS_LOG`` (on).
+"""
+import asyncio
+import gc
+import importlib
+import logging
+import math
+import os
+import select
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from farmachelo import logs
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+STARTUP_DONE_ENV = "FARMACHELO_STARTUP_DONE"
+WORKER_ID_ENV = "FARMACHELO_WORKER_ID"
+CRASH_WINDOW = 5.0
+MAX_BACKOFF = 30.0
+
+
+def startup_done() -> bool:
+    """True en los workers del lanzador: los hooks de una sola vez ya se ejecutaron"""
+    return os.environ.get(STARTUP_DONE_ENV) == "1"
+
+
+def worker_id() -> Optional[int]:
+    value = os.environ.get(WORKER_ID_ENV)
+    return int(value) if value else None
+
+
+# ==================== AUTOAJUSTE ====================
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as handle:
+            return handle.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit() -> float:
+    """CPUs utilizables: afinidad del proceso y cuota de cgroup (v2 o v1), la menor"""
+    available = float(len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1)
+    quota = None
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        limit, _, period = cpu_max.partition(" ")
+        if limit != "max" and period:
+            quota = int(limit) / int(period)
+    else:
+        limit, period = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+    return min(available, quota) if quota else available
+
+
+def memory_limit() -> Optional[int]:
+    """Límite de memoria del cgroup en bytes, si lo hay"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read(path)
+        if value and value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def autotune_workers() -> Tuple[int, str]:
+    """(workers, motivo) según ``WORKERS``/CPU/memoria"""
+    configured = os.environ.get("WORKERS", os.environ.get("WEB_CONCURRENCY", "auto"))
+    if configured != "auto":
+        return max(1, int(configured)), "WORKERS"
+    # App asíncrona: un worker por CPU basta para saturarla; más solo añade cambios de contexto
+    cpus = cpu_limit()
+    workers, reason = max(1, math.ceil(cpus)), f"{cpus:g} CPU"
+    memory = memory_limit()
+    per_worker = int(float(os.environ.get("WORKER_MEMORY_MB", 256)) * 1024 * 1024)
+    if memory and per_worker and memory * 0.8 // per_worker < workers:
+        workers, reason = max(1, int(memory * 0.8 // per_worker)), f"memoria {memory // (1024 * 1024)} MB"
+    maximum = os.environ.get("WORKERS_MAX")
+    if maximum and int(maximum) < workers:
+        workers, reason = int(maximum), "WORKERS_MAX"
+    return workers, reason
+
+
+# ==================== MAESTRO ====================
+
+def load_target(target: str) -> Tuple[Any, Any]:
+    """``modulo:atributo`` → (módulo, app)"""
+    module_name, _, attribute = target.partition(":")
+    module = importlib.import_module(module_name)
+    return module, getattr(module, attribute or "app")
+
+
+class Worker:
+    def __init__(self, pid: int, worker_id: int, ready_fd: int):
+        self.pid = pid
+        self.worker_id = worker_id
+        self.ready_fd = ready_fd
+        self.started = time.monotonic()
+        self.retiring = False
+
+
+class Launcher:
+    def __init__(self, target: str = "server:app", app=None, startup_once: Optional[Callable[[], Awaitable[None]]] = None,
+                 host: Optional[str] = None, port: Optional[int] = None, workers: Optional[int] = None,
+                 preload: Optional[bool] = None):
+        self.target = target
+        self.app = app
+        self.startup_once = startup_once
+        self.host = host or os.environ.get("HOST", "0.0.0.0")
+        self.port = port or int(os.environ.get("PORT", 8000))
+        if workers:
+            self.workers, reason = workers, "argumento"
+        else:
+            self.workers, reason = autotune_workers()
+        self.workers_reason = reason
+        self.preload = preload if preload is not None else os.environ.get("PRELOAD_APP", "on") != "off"
+        self.graceful_timeout = float(os.environ.get("GRACEFUL_TIMEOUT", 30))
+        self.boot_timeout = float(os.environ.get("WORKER_BOOT_TIMEOUT", 60))
+        self.backlog = int(os.environ.get("BACKLOG", 2048))
+        self.keepalive = int(os.environ.get("KEEPALIVE_TIMEOUT", 5))
+        self.access_log = os.environ.get("ACCESS_LOG", "on") != "off"
+        self.socket: Optional[socket.socket] = None
+        self.children: Dict[int, Worker] = {}
+        self.next_worker_id = 0
+        self.backoff = 0.0
+        self.last_crash = 0.0
+        self.stopping = False
+        self.reload_requested = False
+
+    # ---- preparación ----
+
+    def bind(self) -> socket.socket:
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        sock.set_inheritable(True)
+        return sock
+
+    def preload_app(self) -> None:
+        if self.app is None:
+            module, self.app = load_target(self.target)
+            self.startup_once = self.startup_once or getattr(module, "startup_once", None)
+        # Lo importado hasta aquí no se toca más: fuera del GC para no ensuciar páginas compartidas
+        gc.collect()
+        gc.freeze()
+
+    def run_startup_once(self) -> None:
+        """Ejecuta ``startup_once`` en un proceso hijo (su propio loop y cliente) y espera"""
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                startup = self.startup_once
+                if startup is None and not self.preload:
+                    # Sin precarga el maestro no importa la app: lo hace este hijo
+                    startup = getattr(load_target(self.target)[0], "startup_once", None)
+                if startup is not None:
+                    asyncio.run(startup())
+            except BaseException:
+                logger.exception("Startup hooks failed")
+                code = 1
+            finally:
+                logs.stop_listener()
+            os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise SystemExit("Startup hooks failed; not starting workers")
+        os.environ[STARTUP_DONE_ENV] = "1"
+
+    # ---- workers ----
+
+    def spawn(self) -> Worker:
+        read_fd, write_fd = os.pipe()
+        worker_id = self.next_worker_id
+        self.next_worker_id += 1
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                self._worker_main(worker_id, write_fd)
+            except BaseException:
+                logger.exception(f"Worker {worker_id} crashed")
+                code = 1
+            finally:
+                logs.stop_listener()
+            os._exit(code)
+        os.close(write_fd)
+        worker = Worker(pid, worker_id, read_fd)
+        self.children[pid] = worker
+        logger.info(f"Started worker {worker_id} (pid {pid})")
+        return worker
+
+    def _worker_main(self, worker_id: int, ready_fd: int) -> None:
+        import uvicorn
+
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        os.environ[WORKER_ID_ENV] = str(worker_id)
+        app = self.app if self.preload else load_target(self.target)[1]
+        config = uvicorn.Config(
+            app,
+            lifespan="on",
+            log_config=None,
+            access_log=self.access_log,
+            timeout_keep_alive=self.keepalive,
+            timeout_graceful_shutdown=int(self.graceful_timeout),
+        )
+        config.setup_event_loop()
+        server = uvicorn.Server(config)
+
+        async def serve() -> None:
+            task = asyncio.create_task(server.serve(sockets=[self.socket]))
+            while not server.started and not task.done():
+                await asyncio.sleep(0.05)
+            if server.started:
+                # Avisar al maestro: el lifespan terminó y el worker acepta conexiones
+                os.write(ready_fd, b"R")
+            os.close(ready_fd)
+            await task
+
+        asyncio.run(serve())
+
+    def wait_ready(self, worker: Worker) -> bool:
+        deadline = time.monotonic() + self.boot_timeout
+        while time.monotonic() < deadline and worker.pid in self.children:
+            readable, _, _ = select.select([worker.ready_fd], [], [], 0.2)
+            if readable:
+                return os.read(worker.ready_fd, 1) == b"R"
+            self.reap()
+        return False
+
+    def retire(self, worker: Worker) -> None:
+        """SIGTERM (drenaje en uvicorn) y SIGKILL si no sale en ``GRACEFUL_TIMEOUT``"""
+        worker.retiring = True
+        self._signal(worker.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while worker.pid in self.children and time.monotonic() < deadline:
+            time.sleep(0.1)
+            self.reap()
+        if worker.pid in self.children:
+            logger.warning(f"Worker {worker.worker_id} did not drain in time; killing")
+            self._signal(worker.pid, signal.SIGKILL)
+
+    @staticmethod
+    def _signal(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.children.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.ready_fd)
+            if not worker.retiring and not self.stopping:
+                code = os.waitstatus_to_exitcode(status)
+                logger.error(f"Worker {worker.worker_id} (pid {pid}) exited unexpectedly with {code}")
+                if time.monotonic() - worker.started < CRASH_WINDOW:
+                    self.backoff = min(MAX_BACKOFF, self.backoff * 2 or 1.0)
+                else:
+                    self.backoff = 0.0
+                self.last_crash = time.monotonic()
+
+    def rolling_restart(self) -> None:
+        logger.info(f"Rolling restart of {len(self.children)} workers")
+        for worker in list(self.children.values()):
+            if self.stopping or worker.pid not in self.children:
+                continue
+            replacement = self.spawn()
+            if not self.wait_ready(replacement):
+                logger.error("Replacement worker failed to boot; keeping the current workers")
+                if replacement.pid in self.children:
+                    self.retire(replacement)
+                return
+            self.retire(worker)
+        logger.info("Rolling restart complete")
+
+    # ---- bucle principal ----
+
+    def _on_signal(self, signum, frame) -> None:
+        if signum == signal.SIGHUP:
+            self.reload_requested = True
+        else:
+            self.stopping = True
+
+    def run(self) -> int:
+        self.socket = self.bind()
+        logger.info(f"Listening on {self.host}:{self.port} with {self.workers} workers ({self.workers_reason})")
+        if self.preload:
+            self.preload_app()
+        self.run_startup_once()
+
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._on_signal)
+
+        while not self.stopping:
+            self.reap()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            missing = self.workers - sum(1 for worker in self.children.values() if not worker.retiring)
+            if missing > 0 and time.monotonic() - self.last_crash >= self.backoff:
+                for _ in range(missing):
+                    self.spawn()
+            time.sleep(0.2)
+
+        logger.info("Shutting down workers...")
+        for worker in list(self.children.values()):
+            worker.retiring = True
+            self._signal(worker.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            time.sleep(0.1)
+            self.reap()
+        for worker in list(self.children.values()):
+            self._signal(worker.pid, signal.SIGKILL)
+        self.socket.close()
+        return 0
+
+
+def main(argv=None) -> int:
+    load_dotenv(BACKEND_DIR / ".env")
+    sys.path.insert(0, str(BACKEND_DIR))
+    args = (argv if argv is not None else sys.argv[1:]) or ["server:app"]
+    logs.setup_logging(logging.INFO)
+    return Launcher(args[0]).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Generador de carga asíncrono de lazo abierto para la API de Farmachelo.
+
+    python -m farmachelo.loadtest --base-url http://localhost:8000 --duration 60 \\
+        --start-rate 5 --end-rate 200 --mix browse=60,cart=25,checkout=10,admin=5 \\
+        --output resultados.json [--compare resultados-anterior.json]
+
+Los escenarios replican el frontend: catálogo y búsqueda, carrito, pago y el
+panel de administración (``/admin/orders`` y ``/admin/orders/stats``). Las
+llegadas siguen una tasa que sube linealmente de ``--start-rate`` a
+``--end-rate`` sin esperar a que terminen las anteriores, y la latencia del
+primer paso se mide desde el instante programado para no ocultar colas
+(coordinated omission).
+
+El resultado es JSON con throughput y p50/p95/p99 por endpoint, junto con los
+histogramas (estilo HDR) para poder compararlos entre commits.
+
+Nota: todo el tráfico sale de una misma IP; sube ``FRAUD_IP_MAX_PAYMENTS`` en el
+``.env`` del servidor para que el escenario de pago no termine rechazado. Los
+pagos rechazados (200 con ``success: false``) se reportan aparte, en
+``POST /api/payments/process [rejected]`` y como resultado ``rejected`` del
+escenario ``checkout``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+SEARCH_TERMS = ["para", "ibu", "vita", "jarabe", "500", "crema", "amox"]
+
+
+class LatencyHistogram:
+    """
+    Histograma log-lineal al estilo HDR en microsegundos: valores < 128 son
+    exactos y a partir de ahí cada potencia de dos se divide en 64 cubetas
+    (~1.6% de error relativo).
+    """
+
+    SUB_BUCKETS = 128
+    HALF = 64
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.sum = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    @classmethod
+    def index_for(cls, value: int) -> int:
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 7
+        return cls.SUB_BUCKETS + (shift - 1) * cls.HALF + ((value >> shift) - cls.HALF)
+
+    @classmethod
+    def value_for(cls, index: int) -> int:
+        """Valor más alto equivalente a la cubeta"""
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift = (index - cls.SUB_BUCKETS) // cls.HALF + 1
+        sub = (index - cls.SUB_BUCKETS) % cls.HALF + cls.HALF
+        return ((sub + 1) << shift) - 1
+
+    def record(self, microseconds: float) -> None:
+        value = max(0, int(microseconds))
+        index = self.index_for(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def percentile(self, pct: float) -> int:
+        if not self.total:
+            return 0
+        target = max(1, int(round(self.total * pct / 100.0)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.value_for(index), self.max)
+        return self.max
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.total,
+            "min": self.min or 0,
+            "max": self.max,
+            "mean": self.sum / self.total if self.total else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "buckets": {str(index): count for index, count in sorted(self.counts.items())},
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses: Dict[str, int] = {}
+        self.errors = 0
+
+    def as_dict(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "requests": self.latency.total,
+            "errors": self.errors,
+            "throughput_rps": self.latency.total / elapsed if elapsed else 0.0,
+            "statuses": self.statuses,
+            "latency_us": self.latency.as_dict(),
+        }
+
+
+def _payment_rejected(response: httpx.Response) -> bool:
+    """El pago responde 200 también cuando lo rechaza (fraude, monto, tarjeta)"""
+    try:
+        return response.json().get("success") is False
+    except ValueError:
+        return False
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, admin_email: str, admin_password: str, users: int, seed: int):
+        self.client = client
+        self.admin_email = admin_email
+        self.admin_password = admin_password
+        self.user_count = users
+        self.rng = random.Random(seed)
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.scenarios: Dict[str, Dict[str, int]] = {}
+        self.user_tokens: List[str] = []
+        self.admin_token: Optional[str] = None
+        self.product_ids: List[str] = []
+
+    async def request(self, label: str, method: str, url: str, due: Optional[float] = None, token: Optional[str] = None,
+                      rejected: Optional[Callable[[httpx.Response], bool]] = None, **kwargs) -> Optional[httpx.Response]:
+        """
+        ``rejected``: para respuestas 200 que son un rechazo de negocio (p. ej. un pago
+        con ``success: false``); se cuentan en ``"<label> [rejected]"`` para no mezclar
+        su latencia con la de los éxitos.
+        """
+        stats = self.endpoints.setdefault(label, EndpointStats())
+        headers = {"Authorization": f"Bearer {token}"} if token else None
+        start = time.perf_counter() if due is None else due
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            stats.errors += 1
+            stats.latency.record((time.perf_counter() - start) * 1e6)
+            return None
+        if response.status_code == 200 and rejected is not None and rejected(response):
+            stats = self.endpoints.setdefault(f"{label} [rejected]", EndpointStats())
+        stats.latency.record((time.perf_counter() - start) * 1e6)
+        stats.statuses[str(response.status_code)] = stats.statuses.get(str(response.status_code), 0) + 1
+        if response.status_code >= 400:
+            stats.errors += 1
+        return response
+
+    # ==================== SETUP ====================
+
+    async def setup(self) -> None:
+        response = await self.client.post("/api/admin/login", json={"email": self.admin_email, "password": self.admin_password})
+        if response.status_code == 200:
+            self.admin_token = response.json()["token"]
+
+        run_id = uuid.uuid4().hex[:8]
+        for i in range(self.user_count):
+            response = await self.client.post("/api/auth/register", json={
+                "email": f"load-{run_id}-{i}@loadtest.farmachelo.com",
+                "password": "loadtest123",
+                "name": f"Load Test {i}",
+            })
+            if response.status_code == 200:
+                self.user_tokens.append(response.json()["token"])
+
+        response = await self.client.get("/api/products")
+        if response.status_code == 200:
+            self.product_ids = [p["id"] for p in response.json()]
+        if not self.product_ids:
+            raise RuntimeError("No hay productos en el catálogo; genera datos antes de la prueba")
+
+    # ==================== ESCENARIOS ====================
+
+    async def browse(self, due: float) -> None:
+        await self.request("GET /api/products", "GET", "/api/products", due=due)
+        await self.request("GET /api/products?search", "GET", "/api/products", params={"search": self.rng.choice(SEARCH_TERMS)})
+        await self.request("GET /api/products/{product_id}", "GET", f"/api/products/{self.rng.choice(self.product_ids)}")
+
+    async def cart(self, due: float) -> None:
+        token = self.rng.choice(self.user_tokens)
+        product_id = self.rng.choice(self.product_ids)
+        await self.request("POST /api/cart/items", "POST", "/api/cart/items", due=due, token=token,
+                           json={"product_id": product_id, "quantity": 1})
+        await self.request("PUT /api/cart/items/{product_id}", "PUT", f"/api/cart/items/{product_id}", token=token,
+                           json={"quantity": self.rng.randint(1, 4)})
+        await self.request("GET /api/cart", "GET", "/api/cart", token=token)
+
+    async def checkout(self, due: float) -> Optional[str]:
+        token = self.rng.choice(self.user_tokens)
+        await self.request("POST /api/cart/items", "POST", "/api/cart/items", due=due, token=token,
+                           json={"product_id": self.rng.choice(self.product_ids), "quantity": 1})
+        response = await self.request("GET /api/cart", "GET", "/api/cart", token=token)
+        if response is None or response.status_code != 200:
+            return None
+        amount = sum(item["price"] * item["quantity"] for item in response.json()["items"])
+        response = await self.request("POST /api/payments/process", "POST", "/api/payments/process", token=token, json={
+            "email": "loadtest@farmachelo.com",
+            "card": {
+                "cardNumber": "4111111111111111",
+                "expiryDate": "12/30",
+                "cvv": "123",
+                "cardholderName": "Load Test",
+                "country": "CO",
+            },
+            "amount": amount,
+        }, rejected=_payment_rejected)
+        return "rejected" if response is not None and response.status_code == 200 and _payment_rejected(response) else None
+
+    async def admin(self, due: float) -> None:
+        await self.request("GET /api/admin/orders", "GET", "/api/admin/orders", due=due, token=self.admin_token)
+        await self.request("GET /api/admin/orders/stats", "GET", "/api/admin/orders/stats", token=self.admin_token)
+
+    # ==================== LAZO ABIERTO ====================
+
+    async def _run_scenario(self, name: str, due: float) -> None:
+        counters = self.scenarios.setdefault(name, {"started": 0, "completed": 0, "failed": 0})
+        counters["started"] += 1
+        try:
+            # Un escenario puede devolver otro resultado en lugar de "completed" (p. ej. "rejected")
+            outcome = await getattr(self, name)(due) or "completed"
+            counters[outcome] = counters.get(outcome, 0) + 1
+        except Exception:
+            counters["failed"] += 1
+
+    async def run(self, mix: Dict[str, float], duration: float, start_rate: float, end_rate: float, max_in_flight: int) -> Dict[str, Any]:
+        if "admin" in mix and not self.admin_token:
+            mix = {k: v for k, v in mix.items() if k != "admin"}
+        if not self.user_tokens:
+            mix = {k: v for k, v in mix.items() if k not in ("cart", "checkout")}
+        names, weights = list(mix), list(mix.values())
+
+        tasks = set()
+        dropped = 0
+        started = time.perf_counter()
+        next_arrival = 0.0
+        while next_arrival < duration:
+            delay = started + next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(tasks) >= max_in_flight:
+                dropped += 1
+            else:
+                task = asyncio.create_task(self._run_scenario(self.rng.choices(names, weights)[0], started + next_arrival))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            rate = start_rate + (end_rate - start_rate) * (next_arrival / duration)
+            next_arrival += self.rng.expovariate(max(rate, 1e-6))
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        return {
+            "duration_s": elapsed,
+            "dropped_arrivals": dropped,
+            "scenarios": self.scenarios,
+            "endpoints": {label: stats.as_dict(elapsed) for label, stats in sorted(self.endpoints.items())},
+        }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("browse", "cart", "checkout", "admin"):
+            raise argparse.ArgumentTypeError(f"Escenario desconocido: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def print_summary(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    print(f"{'endpoint':<36} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>6}")
+    for label, stats in report["endpoints"].items():
+        latency = stats["latency_us"]
+        line = (f"{label:<36} {stats['throughput_rps']:8.1f} {latency['p50'] / 1e3:8.2f} "
+                f"{latency['p95'] / 1e3:8.2f} {latency['p99'] / 1e3:8.2f} {stats['errors']:6d}")
+        previous = (baseline or {}).get("endpoints", {}).get(label)
+        if previous and previous["latency_us"]["p99"]:
+            change = (latency["p99"] - previous["latency_us"]["p99"]) / previous["latency_us"]["p99"] * 100
+            line += f"  p99 {change:+.1f}%"
+        print(line)
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        test = LoadTest(client, args.admin_email, args.admin_password, args.users, args.seed)
+        started_at = datetime.now(timezone.utc)
+        await test.setup()
+        result = await test.run(args.mix, args.duration, args.start_rate, args.end_rate, args.max_in_flight)
+
+    return {
+        "commit": _git_commit(),
+        "started_at": started_at.isoformat(),
+        "config": {
+            "base_url": args.base_url,
+            "duration": args.duration,
+            "start_rate": args.start_rate,
+            "end_rate": args.end_rate,
+            "mix": args.mix,
+            "users": args.users,
+            "seed": args.seed,
+        },
+        **result,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m farmachelo.loadtest", description="Prueba de carga de lazo abierto")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=60.0, help="Segundos de generación de llegadas")
+    parser.add_argument("--start-rate", type=float, default=5.0, help="Escenarios por segundo al inicio")
+    parser.add_argument("--end-rate", type=float, default=100.0, help="Escenarios por segundo al final")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("browse=60,cart=25,checkout=10,admin=5"))
+    parser.add_argument("--users", type=int, default=20, help="Cuentas de cliente a registrar")
+    parser.add_argument("--admin-email", default="admin@farmachelo.com")
+    parser.add_argument("--admin-password", default="admin123")
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--compare", type=Path, default=None, help="Resultados previos para comparar p99")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(main_async(args))
+    baseline = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+    print_summary(report, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"💾 Resultados en {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Logging no bloqueante y estructurado.
+
+Los handlers de la app solo encolan registros (``QueueHandler``); un
+``QueueListener`` en un hilo aparte los formatea como JSON y los escribe en
+stderr, así el event loop nunca espera por E/S de logs.
+
+- Cada registro incluye el ``request_id`` de la petición en curso (tomado de
+  ``X-Request-ID`` o generado por ``RequestIdMiddleware``).
+- ``LOG_SAMPLING`` fija tasas de muestreo por logger para niveles por debajo de
+  WARNING, p. ej. ``LOG_SAMPLING=server.cart=0.05,farmachelo=0.5``.
+- Los argumentos estilo ``logger.info("... %s", obj)`` se formatean en el hilo
+  del listener, no en el del event loop. Pasar valores que no se muten después.
+- ``LOG_FORMAT=text`` conserva el formato de texto anterior.
+- Tras un ``fork`` (workers del lanzador) el hijo arranca su propio listener:
+  los hilos no se heredan.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("farmachelo_request_id", default=None)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+_RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Descarta una fracción de los registros < WARNING según el prefijo del logger"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Prefijos más largos primero para que el más específico gane
+        self.rates: Tuple[Tuple[str, float], ...] = tuple(sorted(rates.items(), key=lambda item: -len(item[0])))
+        self._cache: Dict[str, float] = {}
+
+    def rate_for(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = next((r for prefix, r in self.rates if name == prefix or name.startswith(prefix + ".")), 1.0)
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Encola el registro sin formatear el mensaje (el listener lo hace)"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Los tracebacks referencian frames vivos: se formatean aquí
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    rates = {}
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        name, _, rate = part.partition("=")
+        rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+def setup_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """Configura el logger raíz con cola + listener (idempotente)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(sys.stderr)
+    if os.environ.get("LOG_FORMAT", "json") == "text":
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    queue_handler = LazyQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(parse_sampling(os.environ.get("LOG_SAMPLING", ""))))
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_listener)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_listener_in_child)
+    return _listener
+
+
+def _restart_listener_in_child() -> None:
+    """El hilo del listener no sobrevive al fork: cola y listener nuevos en el hijo"""
+    global _listener
+    if _listener is None:
+        return
+    fresh = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            handler.queue = fresh
+    _listener = logging.handlers.QueueListener(fresh, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_listener() -> None:
+    """Vacía la cola y detiene el listener (antes de ``os._exit`` en un hijo)"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+class RequestIdMiddleware:
+    """Middleware ASGI: propaga ``X-Request-ID`` (o genera uno) al contexto y a la respuesta"""
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = next((v.decode("latin-1") for k, v in scope["headers"] if k == self.header), None) or uuid.uuid4().hex
+        request_id = request_id[:64]
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (self.header, request_id.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,485 @@
+"""
+CLI de administración de Farmachelo.
+
+    python -m farmachelo.manage bootstrap
+    python -m farmachelo.manage create-admin [--email ...] [--password ...] [--name ...]
+    python -m farmachelo.manage verify [--email ...] [--password ...]
+    python -m farmachelo.manage import-users usuarios.csv [--batch-size 1000] [--concurrency 4]
+    python -m farmachelo.manage import-products productos.ndjson [--restart]
+    python -m farmachelo.manage generate-data --orders 10000000 [--seed 42] [--drop]
+    python -m farmachelo.manage ensure-indexes
+    python -m farmachelo.manage backfill-images [--force] [--concurrency 4]
+    python -m farmachelo.manage migrate-blobs [--namespace uploads]
+
+Lee la configuración de ``backend/.env`` (MONGO_URL, DB_NAME y las opciones
+``MONGO_*`` de ``farmachelo.database``). Las importaciones
+leen el archivo en streaming, escriben lotes con ``bulk_write`` (upserts
+idempotentes) manteniendo varios lotes en vuelo y guardan el último offset
+confirmado en ``import_checkpoints`` para poder reanudar.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import mimetypes
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from farmachelo import bootstrap, database
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(BACKEND_DIR / '.env')
+
+DEFAULT_ADMIN_EMAIL = bootstrap.DEFAULT_ADMIN_EMAIL
+DEFAULT_ADMIN_PASSWORD = bootstrap.DEFAULT_ADMIN_PASSWORD
+PRODUCT_ID_NAMESPACE = bootstrap.PRODUCT_ID_NAMESPACE
+hash_password = bootstrap.hash_password
+
+
+def get_database():
+    config = database.MongoConfig.from_env()
+    client = config.client()
+    return client, client[config.db_name]
+
+
+# ==================== ADMIN ====================
+
+async def create_admin(email: str, password: str, name: str) -> bool:
+    client, db = get_database()
+    try:
+        if not await bootstrap.ensure_admin(db, email, password, name):
+            print(f"✅ Admin ya existe en la base de datos: {email}")
+            return False
+        print("✅ Admin creado exitosamente!")
+        print(f"📧 Email: {email}")
+        return True
+    finally:
+        client.close()
+
+
+async def run_bootstrap() -> Dict[str, Any]:
+    client, db = get_database()
+    try:
+        return await bootstrap.bootstrap(db)
+    finally:
+        client.close()
+
+
+async def verify_admin(email: str, password: str) -> bool:
+    client, db = get_database()
+    try:
+        collections = await db.list_collection_names()
+        print("📦 Colecciones en la base de datos:", collections)
+
+        admin = await db.admin_users.find_one({"email": email})
+        if not admin:
+            print("❌ Admin user not found")
+            return False
+
+        print("✅ Admin user found!")
+        print(f"📧 Email: {admin['email']}")
+        print(f"👤 Name: {admin.get('name')}")
+        print(f"🔑 Is admin: {admin.get('is_admin', False)}")
+        if hash_password(password) == admin.get("password"):
+            print("✅ Password verification: SUCCESS")
+            return True
+        print("❌ Password verification: FAILED")
+        return False
+    finally:
+        client.close()
+
+
+async def create_indexes() -> None:
+    from farmachelo import indexes
+
+    client, db = get_database()
+    try:
+        for collection, names in await indexes.ensure_indexes(db):
+            print(f"🗂️  {collection}: {', '.join(names)}")
+    finally:
+        client.close()
+
+
+# ==================== IMÁGENES ====================
+
+async def backfill_images(force: bool, concurrency: int) -> Tuple[int, int]:
+    """Genera derivados para productos con imagen; las remotas pasan por la caché local"""
+    import httpx
+
+    from farmachelo import blobstore, images, uploads
+
+    client, db = get_database()
+    store = uploads.ContentAddressedStore.from_env(
+        BACKEND_DIR / "uploads", blobstore.from_env("uploads", BACKEND_DIR, db, public=True))
+    pipeline = images.ImagePipeline(store, workers=concurrency)
+    query: Dict[str, Any] = {"image_url": {"$nin": [None, ""]}}
+    if not force:
+        query["image_variants"] = None
+    # Productor/consumidor acotado: en memoria solo hay ``workers`` productos en
+    # proceso y otros tantos en cola, sin importar el tamaño del catálogo
+    workers = concurrency * 2
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers)
+    done, failed = 0, 0
+
+    async def process(product: Dict[str, Any], http) -> None:
+        nonlocal done, failed
+        url = product["image_url"]
+        try:
+            filename = await pipeline.local_filename(url)
+            if filename is None and url.startswith(("http://", "https://")):
+                filename = await pipeline.fetch_remote(url, http)
+            if filename is None:
+                print(f"⚠️  {product['id']}: imagen no encontrada ({url})")
+                failed += 1
+                return
+            fields = await pipeline.derive(filename)
+            await db.products.update_one({"id": product["id"]}, {"$set": fields})
+            done += 1
+        except Exception as e:
+            print(f"❌ {product['id']}: {e}")
+            failed += 1
+
+    async def worker(http) -> None:
+        while True:
+            product = await queue.get()
+            if product is None:
+                return
+            await process(product, http)
+
+    try:
+        async with httpx.AsyncClient(timeout=30, follow_redirects=True) as http:
+            consumers = [asyncio.create_task(worker(http)) for _ in range(workers)]
+            try:
+                async for product in db.products.find(query, {"_id": 0, "id": 1, "image_url": 1}, batch_size=workers * 4):
+                    await queue.put(product)
+                for _ in consumers:
+                    await queue.put(None)
+                await asyncio.gather(*consumers)
+            finally:
+                for consumer in consumers:
+                    consumer.cancel()
+    finally:
+        pipeline.shutdown()
+        await store.blobs.close()
+        client.close()
+    return done, failed
+
+
+async def migrate_blobs(namespace: str) -> Tuple[int, int]:
+    """Copia los archivos locales de ``namespace`` al backend de BLOB_BACKEND (las URLs /uploads siguen valiendo)"""
+    from farmachelo import blobstore, static
+
+    source_dir = BACKEND_DIR / namespace
+    client, db = get_database()
+    blobs = blobstore.from_env(namespace, BACKEND_DIR, db, public=namespace == "uploads")
+    copied, skipped = 0, 0
+    try:
+        if blobs.local_root is not None and blobs.local_root.resolve() == source_dir.resolve():
+            print(f"ℹ️  BLOB_BACKEND=local: {source_dir} ya es el backend")
+            return 0, 0
+        for path in sorted(source_dir.iterdir()) if source_dir.is_dir() else []:
+            if not path.is_file() or not static.safe_name(path.name):
+                continue
+            content_type = mimetypes.guess_type(path.name)[0]
+            if await blobs.put_file(path.name, path, content_type):
+                copied += 1
+            else:
+                skipped += 1
+    finally:
+        await blobs.close()
+        client.close()
+    return copied, skipped
+
+
+# ==================== IMPORTS ====================
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "si", "sí")
+
+
+def user_operation(row: Dict[str, Any]) -> UpdateOne:
+    email = str(row["email"]).strip().lower()
+    now = datetime.now(timezone.utc)
+    fields = {
+        "email": email,
+        "name": str(row["name"]).strip(),
+        "phone": row.get("phone") or None,
+        "address": row.get("address") or None,
+        "is_admin": False,
+    }
+    if row.get("password"):
+        fields["password"] = hash_password(str(row["password"]))
+    return UpdateOne(
+        {"email": email},
+        {"$set": fields, "$setOnInsert": {"id": row.get("id") or str(uuid.uuid4()), "is_verified": False, "created_at": now}},
+        upsert=True,
+    )
+
+
+def product_operation(row: Dict[str, Any]) -> UpdateOne:
+    name = str(row["name"]).strip()
+    # Id determinista por nombre para que reanudar una importación no duplique productos
+    product_id = row.get("id") or str(uuid.uuid5(PRODUCT_ID_NAMESPACE, name))
+    fields = {
+        "name": name,
+        "description": str(row.get("description") or ""),
+        "price": float(row["price"]),
+        "category": row.get("category") or None,
+        "stock": int(row.get("stock") or 0),
+        "image_url": row.get("image_url") or None,
+        "requires_prescription": _parse_bool(row.get("requires_prescription", False)),
+        "active": _parse_bool(row.get("active", True)),
+    }
+    return UpdateOne(
+        {"id": product_id},
+        {"$set": fields, "$setOnInsert": {"id": product_id, "created_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+IMPORTS: Dict[str, Tuple[str, str, Callable[[Dict[str, Any]], UpdateOne]]] = {
+    "users": ("users", "email", user_operation),
+    "products": ("products", "id", product_operation),
+}
+
+
+def iter_rows(path: Path, file_format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Lee CSV o NDJSON fila por fila sin cargar el archivo completo"""
+    file_format = file_format or ("csv" if path.suffix.lower() == ".csv" else "ndjson")
+    with open(path, newline="", encoding="utf-8") as fh:
+        if file_format == "csv":
+            yield from csv.DictReader(fh)
+        else:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+class ImportProgress:
+    """Offset confirmado contiguo con varios lotes en vuelo"""
+
+    def __init__(self, start_offset: int):
+        self.committed_offset = start_offset
+        self.completed: Dict[int, int] = {}
+        self.written = 0
+        self.skipped = 0
+        self.started_at = time.perf_counter()
+
+    def complete(self, start: int, end: int) -> bool:
+        """Marca un lote como escrito; devuelve True si el offset confirmado avanzó"""
+        self.completed[start] = end
+        advanced = False
+        while self.committed_offset in self.completed:
+            self.committed_offset = self.completed.pop(self.committed_offset)
+            advanced = True
+        return advanced
+
+    def report(self, final: bool = False) -> None:
+        elapsed = time.perf_counter() - self.started_at
+        rate = self.written / elapsed if elapsed > 0 else 0.0
+        end = "\n" if final else "\r"
+        print(f"📥 offset={self.committed_offset} escritos={self.written} omitidos={self.skipped} {rate:,.0f} filas/s", end=end, flush=True)
+
+
+async def import_file(
+    kind: str,
+    path: Path,
+    file_format: Optional[str] = None,
+    batch_size: int = 1000,
+    concurrency: int = 4,
+    restart: bool = False,
+    progress_interval: float = 2.0,
+) -> ImportProgress:
+    collection_name, key_field, build_operation = IMPORTS[kind]
+    client, db = get_database()
+    collection = db[collection_name]
+    checkpoint_id = f"{kind}:{path.resolve()}"
+    try:
+        await collection.create_index(key_field)
+        checkpoint = None if restart else await db.import_checkpoints.find_one({"_id": checkpoint_id})
+        start_offset = checkpoint["offset"] if checkpoint else 0
+        if start_offset:
+            print(f"↪️  Reanudando {kind} desde la fila {start_offset}")
+
+        progress = ImportProgress(start_offset)
+        in_flight = asyncio.Semaphore(concurrency)
+        tasks = set()
+        errors: List[BaseException] = []
+        last_report = time.perf_counter()
+
+        def batch_done(task: asyncio.Task) -> None:
+            tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+        def start_batch(start: int, end: int, operations: List[UpdateOne]) -> None:
+            task = asyncio.create_task(write_batch(start, end, operations))
+            tasks.add(task)
+            task.add_done_callback(batch_done)
+
+        async def drain() -> None:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if errors:
+                raise errors[0]
+
+        async def write_batch(start: int, end: int, operations: List[UpdateOne]) -> None:
+            try:
+                if operations:
+                    await collection.bulk_write(operations, ordered=False)
+                progress.written += len(operations)
+                if progress.complete(start, end):
+                    await db.import_checkpoints.update_one(
+                        {"_id": checkpoint_id},
+                        {"$set": {"offset": progress.committed_offset, "updated_at": datetime.now(timezone.utc)}},
+                        upsert=True,
+                    )
+            finally:
+                in_flight.release()
+
+        operations: List[UpdateOne] = []
+        batch_start = start_offset
+        batch_end = start_offset
+        for offset, row in enumerate(iter_rows(path, file_format)):
+            if offset < start_offset:
+                continue
+            batch_end = offset + 1
+            try:
+                operations.append(build_operation(row))
+            except (KeyError, TypeError, ValueError):
+                progress.skipped += 1
+            if batch_end - batch_start >= batch_size:
+                await in_flight.acquire()
+                start_batch(batch_start, batch_end, operations)
+                operations, batch_start = [], batch_end
+                if time.perf_counter() - last_report >= progress_interval:
+                    progress.report()
+                    last_report = time.perf_counter()
+                # Propagar errores de lotes ya terminados sin esperar al final
+                if errors:
+                    await drain()
+
+        # Solo si se leyó alguna fila después del último lote (un archivo vacío no escribe nada)
+        if batch_end > batch_start:
+            await in_flight.acquire()
+            start_batch(batch_start, batch_end, operations)
+        await drain()
+        progress.report(final=True)
+        return progress
+    finally:
+        client.close()
+
+
+# ==================== CLI ====================
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m farmachelo.manage", description="Administración de Farmachelo")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("bootstrap", help="Productos de muestra (si el catálogo está vacío) y admin por defecto")
+
+    create = commands.add_parser("create-admin", help="Crear un administrador")
+    create.add_argument("--email", default=DEFAULT_ADMIN_EMAIL)
+    create.add_argument("--password", default=DEFAULT_ADMIN_PASSWORD)
+    create.add_argument("--name", default="Administrador Principal")
+
+    verify = commands.add_parser("verify", help="Verificar conexión y credenciales de un administrador")
+    verify.add_argument("--email", default=DEFAULT_ADMIN_EMAIL)
+    verify.add_argument("--password", default=DEFAULT_ADMIN_PASSWORD)
+
+    commands.add_parser("ensure-indexes", help="Crear los índices que usan las rutas de la API")
+
+    backfill = commands.add_parser("backfill-images", help="Generar derivados de las imágenes de producto")
+    backfill.add_argument("--force", action="store_true", help="Regenerar también los productos que ya tienen variantes")
+    backfill.add_argument("--concurrency", type=int, default=2, help="Procesos de redimensionado")
+
+    migrate = commands.add_parser("migrate-blobs", help="Copiar los archivos locales al backend de BLOB_BACKEND")
+    migrate.add_argument("--namespace", choices=["uploads", "prescriptions"], default="uploads")
+
+    for kind in IMPORTS:
+        importer = commands.add_parser(f"import-{kind}", help=f"Importar {kind} desde CSV o NDJSON")
+        importer.add_argument("path", type=Path)
+        importer.add_argument("--format", choices=["csv", "ndjson"], default=None)
+        importer.add_argument("--batch-size", type=int, default=1000)
+        importer.add_argument("--concurrency", type=int, default=4)
+        importer.add_argument("--restart", action="store_true", help="Ignorar el checkpoint y empezar desde la fila 0")
+
+    generate = commands.add_parser("generate-data", help="Generar un dataset sintético determinista")
+    generate.add_argument("--seed", type=int, default=42)
+    generate.add_argument("--users", type=int, default=10000)
+    generate.add_argument("--products", type=int, default=2000)
+    generate.add_argument("--orders", type=int, default=100000)
+    generate.add_argument("--days", type=int, default=365)
+    generate.add_argument("--workers", type=int, default=0, help="Procesos de escritura (0 = número de CPUs)")
+    generate.add_argument("--batch-size", type=int, default=5000)
+    generate.add_argument("--drop", action="store_true", help="Eliminar las colecciones antes de generar")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "bootstrap":
+        result = asyncio.run(run_bootstrap())
+        print(f"✅ {result['products']} productos de muestra creados, admin por defecto {'creado' if result['admin_created'] else 'ya existía'}")
+        return 0
+    if args.command == "create-admin":
+        asyncio.run(create_admin(args.email, args.password, args.name))
+        return 0
+    if args.command == "verify":
+        return 0 if asyncio.run(verify_admin(args.email, args.password)) else 1
+
+    if args.command == "ensure-indexes":
+        asyncio.run(create_indexes())
+        return 0
+    if args.command == "backfill-images":
+        done, failed = asyncio.run(backfill_images(args.force, max(1, args.concurrency)))
+        print(f"✅ {done} productos con derivados, {failed} con errores")
+        return 1 if failed else 0
+    if args.command == "migrate-blobs":
+        copied, skipped = asyncio.run(migrate_blobs(args.namespace))
+        print(f"✅ {copied} archivos copiados, {skipped} ya estaban en el backend")
+        return 0
+    if args.command == "generate-data":
+        from farmachelo import synthetic
+
+        config = synthetic.GeneratorConfig(
+            seed=args.seed, users=args.users, products=args.products, orders=args.orders, days=args.days
+        )
+        # Mismas opciones MONGO_* que el resto de comandos (pool, timeouts, compresión)
+        mongo = database.MongoConfig.from_env()
+        result = synthetic.generate(
+            config,
+            mongo.url,
+            mongo.db_name,
+            workers=args.workers,
+            batch_size=max(1, args.batch_size),
+            drop=args.drop,
+            mongo_options=mongo.options,
+        )
+        print(f"✅ {result['documents']:,} documentos en {result['seconds']:.1f}s ({result['docs_per_second']:,.0f} docs/s)")
+        return 0
+
+    kind = args.command[len("import-"):]
+    asyncio.run(import_file(
+        kind,
+        args.path,
+        file_format=args.format,
+        batch_size=max(1, args.batch_size),
+        concurrency=max(1, args.concurrency),
+        restart=args.restart,
+    ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
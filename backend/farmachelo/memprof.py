@@ -0,0 +1,181 @@
+"""
+Perfilado de memoria con ``tracemalloc``.
+
+- ``MemoryProfiler`` arranca/detiene ``tracemalloc``, guarda snapshots en
+  memoria (los últimos ``MEMORY_SNAPSHOTS_KEEP``) y compara dos de ellos
+  agrupando por archivo o por línea.
+- ``AllocationTrackingMiddleware`` mide, mientras ``tracemalloc`` está activo,
+  el pico de memoria asignada durante cada petición. Las que superan
+  ``MEMORY_ALERT_MB`` (50 por defecto) quedan registradas con la ruta y los
+  parámetros de consulta.
+
+El pico de ``tracemalloc`` es global al proceso: si otra petición corre a la
+vez, el reporte lo marca como ``concurrent`` y el valor es una cota superior.
+``MEMORY_TRACING=on`` arranca ``tracemalloc`` junto con la app.
+"""
+import logging
+import os
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY = ("lineno", "filename", "traceback")
+# Ruido del propio tracemalloc y del sistema de imports
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _stat_dict(stat) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    entry = {
+        "file": frame.filename,
+        "line": frame.lineno,
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        entry["count_diff"] = stat.count_diff
+    if len(stat.traceback) > 1:
+        entry["traceback"] = stat.traceback.format()
+    return entry
+
+
+class MemoryProfiler:
+    def __init__(self, keep_snapshots: int = 10, alert_bytes: int = 50 * 1024 * 1024, keep_alerts: int = 100):
+        self.keep_snapshots = keep_snapshots
+        self.alert_bytes = alert_bytes
+        self.snapshots: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.alerts: Deque[Dict[str, Any]] = deque(maxlen=keep_alerts)
+        # ruta -> [peticiones medidas, pico máximo, alertas]
+        self.route_peaks: Dict[str, List[int]] = {}
+        self.in_flight = 0
+        self.started = 0
+        self._next_id = 1
+
+    @classmethod
+    def from_env(cls) -> "MemoryProfiler":
+        return cls(
+            keep_snapshots=int(os.environ.get("MEMORY_SNAPSHOTS_KEEP", 10)),
+            alert_bytes=int(float(os.environ.get("MEMORY_ALERT_MB", 50)) * 1024 * 1024),
+        )
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+    def status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": self.tracing,
+            "frames": tracemalloc.get_traceback_limit(),
+            "current_mb": round(current / 1024 / 1024, 2),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+            "tracemalloc_overhead_mb": round(tracemalloc.get_tracemalloc_memory() / 1024 / 1024, 2),
+            "alert_threshold_mb": round(self.alert_bytes / 1024 / 1024, 2),
+            "snapshots": [
+                {"id": snapshot_id, "taken_at": entry["taken_at"], "label": entry["label"]}
+                for snapshot_id, entry in self.snapshots.items()
+            ],
+        }
+
+    def take_snapshot(self, label: Optional[str] = None) -> int:
+        """Bloqueante (recorre todas las asignaciones): llamar fuera del event loop"""
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        snapshot_id = self._next_id
+        self._next_id += 1
+        self.snapshots[snapshot_id] = {"snapshot": snapshot, "taken_at": time.time(), "label": label}
+        while len(self.snapshots) > self.keep_snapshots:
+            self.snapshots.popitem(last=False)
+        return snapshot_id
+
+    def top(self, snapshot_id: int, group_by: str = "lineno", limit: int = 25) -> Optional[List[Dict[str, Any]]]:
+        entry = self.snapshots.get(snapshot_id)
+        if entry is None:
+            return None
+        return [_stat_dict(stat) for stat in entry["snapshot"].statistics(group_by)[:limit]]
+
+    def diff(self, old_id: int, new_id: int, group_by: str = "lineno", limit: int = 25) -> Optional[List[Dict[str, Any]]]:
+        old, new = self.snapshots.get(old_id), self.snapshots.get(new_id)
+        if old is None or new is None:
+            return None
+        stats = new["snapshot"].compare_to(old["snapshot"], group_by)
+        return [_stat_dict(stat) for stat in stats[:limit]]
+
+    def record(self, scope, peak_growth: int, net_growth: int, concurrent: bool) -> None:
+        route = scope.get("route")
+        route_path = f"{scope['method']} {getattr(route, 'path', None) or '<unmatched>'}"
+        stats = self.route_peaks.setdefault(route_path, [0, 0, 0])
+        stats[0] += 1
+        stats[1] = max(stats[1], peak_growth)
+        if peak_growth < self.alert_bytes:
+            return
+        stats[2] += 1
+        self.alerts.append({
+            "route": route_path,
+            "path": scope["path"],
+            "query_params": dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))),
+            "peak_mb": round(peak_growth / 1024 / 1024, 2),
+            "retained_mb": round(net_growth / 1024 / 1024, 2),
+            "concurrent": concurrent,
+            "at": time.time(),
+        })
+        logger.warning(f"High allocation peak on {route_path}: {peak_growth / 1024 / 1024:.1f}MB (query: {scope.get('query_string', b'').decode('latin-1')})")
+
+    def report(self) -> Dict[str, Any]:
+        routes = [
+            {"route": route, "requests": requests, "max_peak_mb": round(peak / 1024 / 1024, 2), "alerts": alerts}
+            for route, (requests, peak, alerts) in self.route_peaks.items()
+        ]
+        return {
+            "alert_threshold_mb": round(self.alert_bytes / 1024 / 1024, 2),
+            "routes": sorted(routes, key=lambda entry: -entry["max_peak_mb"]),
+            "alerts": list(reversed(self.alerts)),
+        }
+
+
+class AllocationTrackingMiddleware:
+    """Middleware ASGI: pico de asignación por petición mientras tracemalloc está activo"""
+
+    def __init__(self, app, profiler: MemoryProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracemalloc.is_tracing():
+            await self.app(scope, receive, send)
+            return
+
+        profiler = self.profiler
+        concurrent = profiler.in_flight > 0
+        if not concurrent:
+            tracemalloc.reset_peak()
+        sequence = profiler.started
+        profiler.started += 1
+        profiler.in_flight += 1
+        start, _ = tracemalloc.get_traced_memory()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.in_flight -= 1
+            # Otra petición empezó o sigue en curso: el pico puede incluir sus asignaciones
+            concurrent = concurrent or profiler.in_flight > 0 or profiler.started != sequence + 1
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                profiler.record(scope, max(0, peak - start), current - start, concurrent)
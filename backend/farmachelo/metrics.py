@@ -0,0 +1,277 @@
+"""
+Métricas en formato de exposición de Prometheus (texto 0.0.4).
+
+Implementación mínima sin dependencias: contadores, gauges e histogramas con
+cubetas fijas, un middleware ASGI por ruta, medición del lag del event loop y
+listeners de pymongo para tiempos de comandos, operaciones por colección y
+espera al obtener conexiones del pool.
+
+Las métricas HTTP se actualizan desde el hilo del event loop; las de MongoDB
+llegan desde los hilos del executor de Motor y se protegen con un lock.
+"""
+import asyncio
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), lock: Optional[threading.Lock] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = lock
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        if self._lock is None:
+            self._values[labels] = self._values.get(labels, 0) + amount
+        else:
+            with self._lock:
+                self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        self._values[labels] = value
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS, lock=None):
+        super().__init__(name, documentation, labelnames, lock)
+        self.buckets = tuple(buckets)
+        # labels -> [conteo por cubeta..., cubeta +Inf, suma]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def _observe(self, labels: Tuple[str, ...], value: float) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        if self._lock is None:
+            self._observe(labels, value)
+        else:
+            with self._lock:
+                self._observe(labels, value)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+_mongo_lock = threading.Lock()
+
+http_request_duration = registry.register(Histogram(
+    "farmachelo_http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", ("method", "route")))
+http_requests_total = registry.register(Counter(
+    "farmachelo_http_requests_total", "Peticiones HTTP por ruta y código de estado", ("method", "route", "status")))
+http_requests_in_flight = registry.register(Gauge(
+    "farmachelo_http_requests_in_flight", "Peticiones HTTP en curso"))
+event_loop_lag = registry.register(Histogram(
+    "farmachelo_event_loop_lag_seconds", "Retraso del event loop respecto al intervalo esperado", buckets=FAST_BUCKETS))
+mongo_command_duration = registry.register(Histogram(
+    "farmachelo_mongodb_command_duration_seconds", "Duración de los comandos de MongoDB", ("command",), buckets=FAST_BUCKETS, lock=_mongo_lock))
+mongo_operations_total = registry.register(Counter(
+    "farmachelo_mongodb_operations_total", "Comandos de MongoDB por colección y resultado", ("collection", "command", "outcome"), lock=_mongo_lock))
+mongo_pool_checkout_wait = registry.register(Histogram(
+    "farmachelo_mongodb_pool_checkout_wait_seconds", "Espera para obtener una conexión del pool", buckets=FAST_BUCKETS, lock=_mongo_lock))
+mongo_pool_connections = registry.register(Gauge(
+    "farmachelo_mongodb_pool_connections", "Conexiones del pool por estado", ("state",), lock=_mongo_lock))
+
+
+# ==================== HTTP ====================
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: latencia, estado y peticiones en curso por plantilla de ruta"""
+
+    def __init__(self, app, exclude_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            http_request_duration.observe((method, route_path), elapsed)
+            http_requests_total.inc((method, route_path, str(status_holder[0])))
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        event_loop_lag.observe((), max(0.0, loop.time() - expected))
+
+
+# ==================== MONGODB ====================
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Duración por comando y operaciones por colección"""
+
+    def __init__(self):
+        self._collections: Dict[Tuple[object, int], str] = {}
+
+    def started(self, event):
+        value = event.command.get(event.command_name)
+        collection = value if isinstance(value, str) else "-"
+        with _mongo_lock:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome: str):
+        with _mongo_lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        mongo_command_duration.observe((event.command_name,), event.duration_micros / 1e6)
+        mongo_operations_total.inc((collection, event.command_name, outcome))
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Espera de checkout y conexiones abiertas/en uso/en espera"""
+
+    def __init__(self):
+        self._checkout_started = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._checkout_started.value = time.perf_counter()
+        mongo_pool_connections.inc(("waiting",))
+
+    def _checkout_done(self):
+        mongo_pool_connections.dec(("waiting",))
+        started = getattr(self._checkout_started, "value", None)
+        if started is not None:
+            mongo_pool_checkout_wait.observe((), time.perf_counter() - started)
+            self._checkout_started.value = None
+
+    def connection_checked_out(self, event):
+        self._checkout_done()
+        mongo_pool_connections.inc(("checked_out",))
+
+    def connection_check_out_failed(self, event):
+        self._checkout_done()
+
+    def connection_checked_in(self, event):
+        mongo_pool_connections.dec(("checked_out",))
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(("open",))
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(("open",))
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+def mongo_event_listeners() -> list:
+    return [MongoCommandMetrics(), MongoPoolMetrics()]
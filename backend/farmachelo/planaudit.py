@@ -0,0 +1,433 @@
+"""
+Auditoría de planes de consulta por ruta contra un mongod local.
+
+    python -m farmachelo.planaudit [--db farmachelo_plan_audit] [--orders 20000] [--max-ratio 10]
+
+1. Genera un dataset sintético pequeño en una base dedicada (``--db``).
+2. Activa el profiler (nivel 2) y ejecuta un escenario por cada ruta de
+   ``api_router`` contra la app en proceso (TestClient con ``lifespan``).
+3. Agrupa las consultas capturadas por ruta y forma, ejecuta ``explain`` en modo
+   ``executionStats`` y falla si algún plan usa ``COLLSCAN`` o examina más de
+   ``--max-ratio`` documentos por documento devuelto.
+
+Sale con código 1 ante cualquier violación o ruta sin escenario, para usarse
+como verificación de regresiones antes de integrar cambios.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import MongoClient
+
+from farmachelo import bootstrap, synthetic
+from farmachelo.querytrace import command_filter, query_shape
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+EXPLAINABLE = ("find", "aggregate", "count", "distinct", "findAndModify", "update", "delete")
+STRIP_FIELDS = ("$db", "lsid", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction", "comment")
+
+
+def _shape(query: Dict[str, Any]) -> str:
+    """Forma de un filtro tal como la agrupa la auditoría"""
+    return repr(query_shape(query))
+
+
+# Recorridos completos aceptados a propósito: (ruta, colección, forma) -> motivo.
+# Con forma None se acepta cualquier consulta de la ruta sobre la colección (rutas
+# que por diseño agregan la colección entera); si no, solo esa forma de filtro,
+# así el resto de consultas de la ruta sigue auditada.
+ALLOWED_SCANS: Dict[Tuple[str, str, Optional[str]], str] = {
+    ("GET /api/admin/invoices/stats", "invoices", None): "Totales sobre toda la colección",
+    ("GET /api/admin/orders/stats", "orders", None): "Conteo total de pedidos",
+    ("GET /api/admin/payments/card-reconciliation", "payment_transactions", None): "Conciliación recorre todas las transacciones",
+    ("GET /api/products", "products", _shape({"active": True, "name": {"$regex": "", "$options": "i"}})):
+        "Búsqueda por regex sin índice de texto",
+}
+
+PNG_1x1 = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+# ==================== ESCENARIOS ====================
+
+class AuditContext:
+    def __init__(self, client):
+        self.client = client
+        self.values: Dict[str, Any] = {}
+
+    def auth(self, role: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.values[role + '_token']}"}
+
+
+def _register(ctx):
+    response = ctx.client.post("/api/auth/register", json={
+        "email": "plan-audit@farmachelo.com", "password": "audit123", "name": "Plan Audit",
+    })
+    if response.status_code == 200:
+        ctx.values["user_token"] = response.json()["token"]
+    return response
+
+
+def _login(ctx):
+    response = ctx.client.post("/api/auth/login", json={"email": "plan-audit@farmachelo.com", "password": "audit123"})
+    ctx.values.setdefault("user_token", response.json().get("token"))
+    return response
+
+
+def _admin_login(ctx):
+    response = ctx.client.post("/api/admin/login", json={
+        "email": bootstrap.DEFAULT_ADMIN_EMAIL, "password": bootstrap.DEFAULT_ADMIN_PASSWORD,
+    })
+    ctx.values["admin_token"] = response.json()["token"]
+    return response
+
+
+def _products(ctx):
+    response = ctx.client.get("/api/products")
+    ctx.values["product_id"] = response.json()[0]["id"]
+    ctx.client.get("/api/products", params={"category": "vitamins"})
+    ctx.client.get("/api/products", params={"search": "para"})
+    # Producto con receta para los escenarios de subida de recetas
+    prescription = ctx.client.get("/api/products", params={"category": "prescription"}).json()
+    ctx.values["prescription_product_id"] = prescription[0]["id"] if prescription else "missing"
+    return response
+
+
+def _add_cart_item(ctx):
+    return ctx.client.post("/api/cart/items", headers=ctx.auth("user"), json={"product_id": ctx.values["product_id"], "quantity": 2})
+
+
+def _process_payment(ctx):
+    cart = ctx.client.get("/api/cart", headers=ctx.auth("user")).json()
+    amount = sum(item["price"] * item["quantity"] for item in cart["items"])
+    response = ctx.client.post("/api/payments/process", headers=ctx.auth("user"), json={
+        "email": "plan-audit@farmachelo.com",
+        "card": {"cardNumber": "4111111111111111", "expiryDate": "12/30", "cvv": "123", "cardholderName": "Plan Audit", "country": "CO"},
+        "amount": amount,
+    })
+    body = response.json()
+    ctx.values["transaction_id"] = body.get("transactionId")
+    ctx.values["order_id"] = body.get("invoiceId")
+    return response
+
+
+def _create_invoice(ctx):
+    response = ctx.client.post("/api/invoices", headers=ctx.auth("user"), json={
+        "order_id": ctx.values["order_id"], "payment_transaction_id": ctx.values["transaction_id"],
+    })
+    if response.status_code == 200:
+        ctx.values["invoice_id"] = response.json()["invoice"]["id"]
+    return response
+
+
+def _create_product(ctx):
+    response = ctx.client.post("/api/admin/products", headers=ctx.auth("admin"), json={
+        "name": "Producto auditoría", "description": "Temporal", "price": 1000, "stock": 1,
+    })
+    ctx.values["new_product_id"] = response.json()["id"]
+    return response
+
+
+def _delete_cart_item(ctx):
+    response = ctx.client.delete(f"/api/cart/items/{ctx.values['product_id']}", headers=ctx.auth("user"))
+    # Dejar el carrito con un producto para el escenario de pago
+    _add_cart_item(ctx)
+    return response
+
+
+def _create_prescription_upload(ctx):
+    # El producto con receta tiene que estar en el carrito
+    ctx.client.post("/api/cart/items", headers=ctx.auth("user"),
+                    json={"product_id": ctx.values["prescription_product_id"], "quantity": 1})
+    response = ctx.client.post("/api/prescriptions/uploads", headers=ctx.auth("user"), json={
+        "product_id": ctx.values["prescription_product_id"], "filename": "receta.png", "size": len(PNG_1x1),
+    })
+    ctx.values["upload_id"] = response.json().get("id", "missing") if response.status_code == 201 else "missing"
+    return response
+
+
+def _upload_prescription_chunk(ctx):
+    checksum = base64.b64encode(hashlib.sha256(PNG_1x1).digest()).decode()
+    return ctx.client.patch(f"/api/prescriptions/uploads/{ctx.values['upload_id']}", content=PNG_1x1, headers={
+        **ctx.auth("user"), "Content-Type": "application/offset+octet-stream",
+        "Upload-Offset": "0", "Upload-Checksum": f"sha256 {checksum}",
+    })
+
+
+def _complete_prescription_upload(ctx):
+    response = ctx.client.post(f"/api/prescriptions/uploads/{ctx.values['upload_id']}/complete", headers=ctx.auth("user"))
+    key = response.json()["upload"]["prescription_file"] if response.status_code == 200 else None
+    ctx.values["prescription_key"] = key or "missing"
+    return response
+
+
+def _download_prescription(ctx):
+    key = ctx.values["prescription_key"]
+    response = ctx.client.get(f"/api/admin/prescriptions/{key}", headers=ctx.auth("admin"))
+    (BACKEND_DIR / "prescriptions" / key).unlink(missing_ok=True)
+    return response
+
+
+def _admin_list(path: str):
+    def scenario(ctx):
+        response = ctx.client.get(path, headers=ctx.auth("admin"))
+        ctx.client.get(path, headers=ctx.auth("admin"), params={"status": "paid"})
+        return response
+    return scenario
+
+
+def _upload_image(ctx):
+    response = ctx.client.post("/api/admin/upload-image", headers=ctx.auth("admin"),
+                               files={"file": ("audit.png", PNG_1x1, "image/png")})
+    if response.status_code == 200:
+        uploaded = BACKEND_DIR / response.json()["image_url"].lstrip("/")
+        uploaded.unlink(missing_ok=True)
+    return response
+
+
+def _list_profiles(ctx):
+    # Un perfil capturado con X-Profile para el escenario de descarga
+    profiled = ctx.client.get("/api/", headers={**ctx.auth("admin"), "X-Profile": "sample"})
+    ctx.values["profile_id"] = profiled.headers.get("x-profile-id", "missing")
+    return ctx.client.get("/api/admin/profiles", headers=ctx.auth("admin"))
+
+
+def _memory_snapshots(ctx):
+    # Dos snapshots para el escenario de diferencia
+    ids = []
+    for label in ("audit-before", "audit-after"):
+        response = ctx.client.post("/api/admin/diagnostics/memory/snapshots", headers=ctx.auth("admin"),
+                                   params={"label": label, "limit": 5})
+        ids.append(response.json().get("id", 0) if response.status_code == 200 else 0)
+    ctx.values["memory_snapshots"] = ids
+    return response
+
+
+SCENARIOS: List[Tuple[str, Callable[[AuditContext], Any]]] = [
+    ("GET /api/", lambda ctx: ctx.client.get("/api/")),
+    ("POST /api/auth/register", _register),
+    ("POST /api/auth/login", _login),
+    ("GET /api/auth/me", lambda ctx: ctx.client.get("/api/auth/me", headers=ctx.auth("user"))),
+    ("POST /api/admin/login", _admin_login),
+    ("POST /api/admin/register", lambda ctx: ctx.client.post("/api/admin/register", json={
+        "email": "plan-audit-admin@farmachelo.com", "password": "audit123", "name": "Audit Admin"})),
+    ("GET /api/products", _products),
+    ("GET /api/products/{product_id}", lambda ctx: ctx.client.get(f"/api/products/{ctx.values['product_id']}")),
+    ("GET /api/cart", lambda ctx: ctx.client.get("/api/cart", headers=ctx.auth("user"))),
+    ("POST /api/cart/items", _add_cart_item),
+    ("PUT /api/cart/items/{product_id}", lambda ctx: ctx.client.put(
+        f"/api/cart/items/{ctx.values['product_id']}", headers=ctx.auth("user"), json={"quantity": 3})),
+    ("DELETE /api/cart/items/{product_id}", _delete_cart_item),
+    ("POST /api/payments/validate-card", lambda ctx: ctx.client.post("/api/payments/validate-card", json={
+        "cardNumber": "4111111111111111", "expiryDate": "12/30", "cvv": "123"})),
+    ("POST /api/payments/checkout", lambda ctx: ctx.client.post("/api/payments/checkout", headers=ctx.auth("user"), json={
+        "cart_items": [], "origin_url": "http://localhost:3000"})),
+    ("POST /api/payments/process", _process_payment),
+    ("POST /api/invoices", _create_invoice),
+    ("GET /api/invoices", lambda ctx: ctx.client.get("/api/invoices", headers=ctx.auth("user"))),
+    ("GET /api/invoices/{invoice_id}", lambda ctx: ctx.client.get(
+        f"/api/invoices/{ctx.values.get('invoice_id', 'missing')}", headers=ctx.auth("user"))),
+    ("GET /api/invoices/by-transaction/{transaction_id}", lambda ctx: ctx.client.get(
+        f"/api/invoices/by-transaction/{ctx.values['transaction_id']}", headers=ctx.auth("user"))),
+    ("GET /api/orders", lambda ctx: ctx.client.get("/api/orders", headers=ctx.auth("user"))),
+    ("POST /api/prescriptions/uploads", _create_prescription_upload),
+    ("PATCH /api/prescriptions/uploads/{upload_id}", _upload_prescription_chunk),
+    ("HEAD /api/prescriptions/uploads/{upload_id}", lambda ctx: ctx.client.head(
+        f"/api/prescriptions/uploads/{ctx.values['upload_id']}", headers=ctx.auth("user"))),
+    ("GET /api/prescriptions/uploads/{upload_id}", lambda ctx: ctx.client.get(
+        f"/api/prescriptions/uploads/{ctx.values['upload_id']}", headers=ctx.auth("user"))),
+    ("POST /api/prescriptions/uploads/{upload_id}/complete", _complete_prescription_upload),
+    ("GET /api/admin/invoices", _admin_list("/api/admin/invoices")),
+    ("GET /api/admin/invoices/stats", lambda ctx: ctx.client.get("/api/admin/invoices/stats", headers=ctx.auth("admin"))),
+    ("GET /api/admin/orders", _admin_list("/api/admin/orders")),
+    ("GET /api/admin/orders/stats", lambda ctx: ctx.client.get("/api/admin/orders/stats", headers=ctx.auth("admin"))),
+    ("GET /api/admin/orders/{order_id}", lambda ctx: ctx.client.get(
+        f"/api/admin/orders/{ctx.values['order_id']}", headers=ctx.auth("admin"))),
+    ("PUT /api/admin/orders/{order_id}/status", lambda ctx: ctx.client.put(
+        f"/api/admin/orders/{ctx.values['order_id']}/status", headers=ctx.auth("admin"), json={"status": "processing"})),
+    ("POST /api/admin/payments/validate-cards", lambda ctx: ctx.client.post(
+        "/api/admin/payments/validate-cards", headers=ctx.auth("admin"), json={"card_numbers": ["4111111111111111"]})),
+    ("GET /api/admin/payments/card-reconciliation", lambda ctx: ctx.client.get(
+        "/api/admin/payments/card-reconciliation", headers=ctx.auth("admin"))),
+    ("POST /api/admin/products", _create_product),
+    ("PUT /api/admin/products/{product_id}", lambda ctx: ctx.client.put(
+        f"/api/admin/products/{ctx.values['new_product_id']}", headers=ctx.auth("admin"), json={"stock": 5})),
+    ("DELETE /api/admin/products/{product_id}", lambda ctx: ctx.client.delete(
+        f"/api/admin/products/{ctx.values['new_product_id']}", headers=ctx.auth("admin"))),
+    ("POST /api/admin/upload-image", _upload_image),
+    ("GET /api/admin/prescriptions/{key}", _download_prescription),
+    ("GET /api/admin/diagnostics/stalls", lambda ctx: ctx.client.get("/api/admin/diagnostics/stalls", headers=ctx.auth("admin"))),
+    ("DELETE /api/admin/diagnostics/stalls", lambda ctx: ctx.client.delete("/api/admin/diagnostics/stalls", headers=ctx.auth("admin"))),
+    ("GET /api/admin/profiles", _list_profiles),
+    ("GET /api/admin/profiles/{profile_id}", lambda ctx: ctx.client.get(
+        f"/api/admin/profiles/{ctx.values['profile_id']}", headers=ctx.auth("admin"))),
+    ("GET /api/admin/diagnostics/memory", lambda ctx: ctx.client.get("/api/admin/diagnostics/memory", headers=ctx.auth("admin"))),
+    ("POST /api/admin/diagnostics/memory/start", lambda ctx: ctx.client.post(
+        "/api/admin/diagnostics/memory/start", headers=ctx.auth("admin"), json={"frames": 1})),
+    ("POST /api/admin/diagnostics/memory/snapshots", _memory_snapshots),
+    ("GET /api/admin/diagnostics/memory/snapshots/{old_id}/diff/{new_id}", lambda ctx: ctx.client.get(
+        "/api/admin/diagnostics/memory/snapshots/{}/diff/{}".format(*ctx.values["memory_snapshots"]),
+        headers=ctx.auth("admin"), params={"limit": 5})),
+    ("GET /api/admin/diagnostics/memory/peaks", lambda ctx: ctx.client.get(
+        "/api/admin/diagnostics/memory/peaks", headers=ctx.auth("admin"))),
+    ("POST /api/admin/diagnostics/memory/stop", lambda ctx: ctx.client.post(
+        "/api/admin/diagnostics/memory/stop", headers=ctx.auth("admin"))),
+    ("GET /api/admin/diagnostics/db-pool", lambda ctx: ctx.client.get("/api/admin/diagnostics/db-pool", headers=ctx.auth("admin"))),
+    ("DELETE /api/admin/diagnostics/db-pool/peaks", lambda ctx: ctx.client.delete(
+        "/api/admin/diagnostics/db-pool/peaks", headers=ctx.auth("admin"))),
+    ("GET /api/admin/diagnostics/admission", lambda ctx: ctx.client.get(
+        "/api/admin/diagnostics/admission", headers=ctx.auth("admin"))),
+    ("POST /api/admin/logout", lambda ctx: ctx.client.post("/api/admin/logout", headers=ctx.auth("admin"))),
+]
+
+
+# ==================== EXPLAIN ====================
+
+def _walk(value: Any) -> Iterator[Tuple[str, Any]]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield key, item
+            yield from _walk(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _walk(item)
+
+
+def explain_command(entry: Dict[str, Any]) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """Reconstruye el comando explicable a partir de una entrada de system.profile"""
+    collection = entry["ns"].split(".", 1)[1]
+    command = {k: v for k, v in entry.get("command", {}).items() if k not in STRIP_FIELDS}
+    if entry["op"] == "update":
+        command = {"update": collection, "updates": [command]}
+    elif entry["op"] == "remove":
+        command = {"delete": collection, "deletes": [command]}
+    if not command:
+        return None
+    command_name = next(iter(command))
+    if command_name not in EXPLAINABLE:
+        return None
+    return collection, command_name, command
+
+
+def audit_plan(explain: Dict[str, Any], max_ratio: float) -> List[str]:
+    problems = []
+    stages = {item for key, item in _walk(explain) if key == "stage"}
+    if "COLLSCAN" in stages:
+        problems.append("COLLSCAN")
+    for key, stats in _walk(explain):
+        if key == "executionStats" and isinstance(stats, dict) and "totalDocsExamined" in stats:
+            examined, returned = stats["totalDocsExamined"], stats.get("nReturned", 0)
+            if examined > max_ratio * max(returned, 1):
+                problems.append(f"examina {examined} documentos para devolver {returned}")
+            break
+    return problems
+
+
+async def _ensure_admin(mongo_url: str, db_name: str) -> None:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(mongo_url)
+    try:
+        await bootstrap.ensure_admin(
+            client[db_name], bootstrap.DEFAULT_ADMIN_EMAIL, bootstrap.DEFAULT_ADMIN_PASSWORD, bootstrap.DEFAULT_ADMIN_NAME)
+    finally:
+        client.close()
+
+
+def run_audit(mongo_url: str, db_name: str, orders: int, max_ratio: float) -> int:
+    os.environ["MONGO_URL"] = mongo_url
+    os.environ["DB_NAME"] = db_name
+    os.environ.setdefault("QUERY_BUDGET_MODE", "warn")
+    # Sin bootstrap en segundo plano: sus consultas se atribuirían al escenario en curso
+    os.environ["BOOTSTRAP"] = "off"
+
+    print(f"🧪 Generando dataset en {db_name}...")
+    config = synthetic.GeneratorConfig(users=max(100, orders // 10), products=500, orders=orders)
+    synthetic.generate(config, mongo_url, db_name, drop=True)
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    from fastapi.testclient import TestClient
+    import server
+
+    mongo = MongoClient(mongo_url)
+    db = mongo[db_name]
+    for name in ("admin_users", "carts", "import_checkpoints"):
+        db.drop_collection(name)
+    # El admin de los escenarios existe antes de la app (no depende del bootstrap)
+    asyncio.run(_ensure_admin(mongo_url, db_name))
+
+    failures: List[str] = []
+    declared = {f"{method} {route.path}" for route in server.api_router.routes for method in route.methods}
+    for missing in sorted(declared - {name for name, _ in SCENARIOS}):
+        failures.append(f"{missing}: sin escenario de auditoría")
+
+    with TestClient(server.app, raise_server_exceptions=False) as client:
+        db.command("profile", 0)
+        db.drop_collection("system.profile")
+        db.command("profile", 2)
+        ctx = AuditContext(client)
+        last_ts = None
+        try:
+            for route_name, scenario in SCENARIOS:
+                response = scenario(ctx)
+                status = getattr(response, "status_code", "?")
+                query = {"ns": {"$regex": f"^{db_name}\\.(?!system\\.)"}}
+                if last_ts is not None:
+                    query["ts"] = {"$gt": last_ts}
+                entries = list(db.system.profile.find(query).sort("ts", 1))
+                if entries:
+                    last_ts = entries[-1]["ts"]
+
+                seen = set()
+                checked = 0
+                for entry in entries:
+                    built = explain_command(entry)
+                    if built is None:
+                        continue
+                    collection, command_name, command = built
+                    shape = (collection, command_name, repr(query_shape(command_filter(command_name, command))))
+                    if shape in seen:
+                        continue
+                    seen.add(shape)
+                    checked += 1
+                    plan = db.command({"explain": command, "verbosity": "executionStats"})
+                    for problem in audit_plan(plan, max_ratio):
+                        reason = (ALLOWED_SCANS.get((route_name, collection, shape[2]))
+                                  or ALLOWED_SCANS.get((route_name, collection, None)))
+                        if reason:
+                            print(f"   ⚠️  {route_name}: {command_name} {collection} {problem} (permitido: {reason})")
+                        else:
+                            failures.append(f"{route_name}: {command_name} {collection} {shape[2]} -> {problem}")
+                print(f"🔎 {route_name} [{status}] {checked} formas de consulta")
+        finally:
+            db.command("profile", 0)
+    mongo.close()
+
+    if failures:
+        print("\n❌ Violaciones de plan de consulta:")
+        for failure in failures:
+            print(f"   - {failure}")
+        return 1
+    print("\n✅ Todas las rutas usan índices")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m farmachelo.planaudit", description="Auditoría de planes de consulta")
+    parser.add_argument("--mongo-url", default=os.environ.get("PLAN_AUDIT_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="farmachelo_plan_audit")
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--max-ratio", type=float, default=10.0, help="Máximo de documentos examinados por documento devuelto")
+    args = parser.parse_args(argv)
+    return run_audit(args.mongo_url, args.db, args.orders, args.max_ratio)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
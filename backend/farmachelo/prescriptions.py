@@ -0,0 +1,288 @@
+"""
+Subidas reanudables de recetas por bloques (protocolo al estilo tus).
+
+1. ``POST /api/prescriptions/uploads`` crea la sesión (producto, nombre,
+   tamaño) y devuelve ``chunk_size`` y ``chunk_count``.
+2. Cada bloque se envía con ``PATCH /api/prescriptions/uploads/{id}``, cuerpo
+   ``application/offset+octet-stream`` y los encabezados ``Upload-Offset``
+   (múltiplo de ``chunk_size``) y ``Upload-Checksum: sha256 <base64>``. Los
+   bloques pueden llegar en cualquier orden y en paralelo; uno con checksum
+   incorrecto responde 460 y no cuenta como recibido.
+3. ``HEAD`` devuelve ``Upload-Offset`` (bytes contiguos desde el inicio) y
+   ``GET`` la lista de bloques que faltan, para reanudar tras un corte.
+4. ``POST .../complete`` valida el tipo (imagen o PDF), publica el archivo en
+   el backend de recetas y lo asocia al ítem del carrito.
+
+Cada bloque se acumula en memoria (como mucho ``chunk_size``), se verifica
+y solo entonces se escribe con ``pwrite`` en su posición final de un archivo
+disperso preasignado, así el ensamblado no vuelve a leer ni a copiar nada.
+Antes de escribir, el bloque se reserva en MongoDB con su hash (``claims``):
+un reintento con otro contenido nunca pisa bytes ya escritos. El nombre del blob es el SHA-256 de los hashes de los bloques (árbol de
+un nivel), calculable sin releer el archivo. El archivo parcial vive en el
+disco local (``prescriptions/.partial``): con varios hosts hace falta afinidad
+de sesión o un volumen compartido.
+
+Variables: ``PRESCRIPTION_CHUNK_KB`` (1024), ``PRESCRIPTION_MAX_MB`` (20),
+``PRESCRIPTION_UPLOAD_TTL_HOURS`` (24).
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from farmachelo import blobstore
+from farmachelo.uploads import UploadRejected, sniff_image
+
+ALLOWED_TYPES = ("image/jpeg", "image/png", "image/webp", "image/heic", "application/pdf")
+CHECKSUM_MISMATCH = 460  # Código de tus para "Checksum Mismatch"
+
+
+def sniff_prescription(head: bytes) -> Optional[tuple]:
+    """(extensión, tipo MIME) de una receta: imagen, HEIC de móvil o PDF"""
+    if head.startswith(b"%PDF-"):
+        return "pdf", "application/pdf"
+    if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        return "heic", "image/heic"
+    return sniff_image(head)
+
+
+def parse_checksum(header: Optional[str]) -> bytes:
+    """``Upload-Checksum: sha256 <base64>`` → digest"""
+    algorithm, _, value = (header or "").strip().partition(" ")
+    if algorithm.lower() != "sha256":
+        raise UploadRejected(400, "Upload-Checksum debe ser 'sha256 <base64>'")
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except ValueError:
+        raise UploadRejected(400, "Upload-Checksum no es base64 válido")
+    if len(digest) != 32:
+        raise UploadRejected(400, "Upload-Checksum no es un SHA-256")
+    return digest
+
+
+def received_offset(session: Dict[str, Any]) -> int:
+    """Bytes contiguos recibidos desde el inicio (el ``Upload-Offset`` de tus)"""
+    chunks = session.get("chunks", {})
+    index = 0
+    while str(index) in chunks:
+        index += 1
+    return min(index * session["chunk_size"], session["size"])
+
+
+def missing_chunks(session: Dict[str, Any]) -> List[int]:
+    chunks = session.get("chunks", {})
+    return [index for index in range(session["chunk_count"]) if str(index) not in chunks]
+
+
+def public_view(session: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": session["id"],
+        "product_id": session["product_id"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "chunk_count": session["chunk_count"],
+        "offset": received_offset(session),
+        "missing": missing_chunks(session),
+        "status": session["status"],
+        "prescription_file": session.get("blob_key"),
+        "expires_at": session["expires_at"],
+    }
+
+
+class ResumableUploads:
+    def __init__(self, collection, blobs: blobstore.BlobStore, root: Path, chunk_size: int = 1024 * 1024,
+                 max_bytes: int = 20 * 1024 * 1024, ttl: timedelta = timedelta(hours=24)):
+        self.collection = collection
+        self.blobs = blobs
+        self.partial_dir = Path(root) / ".partial"
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    @classmethod
+    def from_env(cls, collection, blobs: blobstore.BlobStore, root: Path) -> "ResumableUploads":
+        return cls(
+            collection,
+            blobs,
+            root,
+            chunk_size=int(float(os.environ.get("PRESCRIPTION_CHUNK_KB", 1024)) * 1024),
+            max_bytes=int(float(os.environ.get("PRESCRIPTION_MAX_MB", 20)) * 1024 * 1024),
+            ttl=timedelta(hours=float(os.environ.get("PRESCRIPTION_UPLOAD_TTL_HOURS", 24))),
+        )
+
+    def _partial_path(self, upload_id: str) -> Path:
+        return self.partial_dir / upload_id
+
+    def _allocate(self, upload_id: str, size: int) -> None:
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._partial_path(upload_id), "wb") as handle:
+            # Archivo disperso del tamaño final: cada bloque va a su posición
+            handle.truncate(size)
+
+    async def create(self, user_id: str, product_id: str, filename: str, size: int) -> Dict[str, Any]:
+        if size <= 0:
+            raise UploadRejected(400, "Archivo vacío")
+        if size > self.max_bytes:
+            raise UploadRejected(413, f"El archivo supera el máximo de {self.max_bytes // (1024 * 1024)} MB")
+        now = datetime.now(timezone.utc)
+        session = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "product_id": product_id,
+            "filename": os.path.basename(filename)[:200],
+            "size": size,
+            "chunk_size": self.chunk_size,
+            "chunk_count": -(-size // self.chunk_size),
+            "chunks": {},
+            "claims": {},
+            "status": "open",
+            "created_at": now,
+            "expires_at": now + self.ttl,
+        }
+        await asyncio.to_thread(self._allocate, session["id"], size)
+        await self.collection.insert_one(dict(session))
+        return session
+
+    async def get(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        session = await self.collection.find_one({"id": upload_id, "user_id": user_id}, {"_id": 0})
+        if session is None or session["expires_at"].replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+            raise UploadRejected(404, "Sesión de subida no encontrada o expirada")
+        return session
+
+    def _write_at(self, upload_id: str, data: bytes, offset: int) -> None:
+        try:
+            fd = os.open(self._partial_path(upload_id), os.O_WRONLY)
+        except FileNotFoundError:
+            # La sesión se creó en otro host o el parcial se purgó
+            raise UploadRejected(410, "El archivo parcial ya no existe en este servidor; crea una nueva sesión")
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.pwrite(fd, view, offset + len(data) - len(view)):]
+        finally:
+            os.close(fd)
+
+    async def write_chunk(self, session: Dict[str, Any], offset: int, body: AsyncIterator[bytes],
+                          checksum: bytes) -> Dict[str, Any]:
+        """Verifica un bloque y solo entonces lo escribe en su posición final y lo marca como recibido"""
+        if session["status"] != "open":
+            raise UploadRejected(409, "La subida ya se completó")
+        index, remainder = divmod(offset, session["chunk_size"])
+        if remainder or not 0 <= index < session["chunk_count"]:
+            raise UploadRejected(409, f"Upload-Offset debe ser múltiplo de {session['chunk_size']} y menor que {session['size']}")
+        expected = min(session["chunk_size"], session["size"] - offset)
+        received = session.get("chunks", {}).get(str(index))
+        if received is not None:
+            # Los bloques confirmados no cambian: un reintento igual no se relee ni se reescribe
+            if received != checksum.hex():
+                raise UploadRejected(409, f"El bloque {index} ya se recibió con otro contenido")
+            return session
+
+        # El bloque (como mucho chunk_size) se acumula y verifica antes de tocar el archivo:
+        # un envío truncado o corrupto no pisa bytes que otro envío ya escribió
+        data = bytearray()
+        async for piece in body:
+            if len(data) + len(piece) > expected:
+                raise UploadRejected(413, f"El bloque supera los {expected} bytes esperados")
+            data += piece
+        if len(data) != expected:
+            raise UploadRejected(400, f"Bloque incompleto: {len(data)} de {expected} bytes")
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != checksum.hex():
+            raise UploadRejected(CHECKSUM_MISMATCH, "El checksum del bloque no coincide")
+
+        # Reserva atómica del bloque con su hash: de dos envíos distintos en paralelo solo escribe
+        # el primero; el mismo contenido se reescribe sin riesgo (y repara un envío que cayó entre
+        # la reserva y el pwrite). ``chunks`` se marca después, con los bytes ya en el archivo.
+        claimed = await self.collection.find_one_and_update(
+            {"id": session["id"], "status": "open",
+             "$or": [{f"claims.{index}": {"$exists": False}}, {f"claims.{index}": digest}]},
+            {"$set": {f"claims.{index}": digest}},
+            projection={"_id": 0, "status": 1},
+        )
+        if claimed is None:
+            current = await self.collection.find_one({"id": session["id"]}, {"_id": 0, "status": 1})
+            if current is None or current["status"] != "open":
+                raise UploadRejected(409, "La subida ya se completó")
+            raise UploadRejected(409, f"El bloque {index} ya se recibió con otro contenido")
+        await asyncio.to_thread(self._write_at, session["id"], data, offset)
+
+        update: Dict[str, Any] = {f"chunks.{index}": digest}
+        if index == 0:
+            detected = sniff_prescription(bytes(data[:64]))
+            update["detected"] = list(detected) if detected else None
+        updated = await self.collection.find_one_and_update(
+            {"id": session["id"], "status": "open"},
+            {"$set": update},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated is None:
+            raise UploadRejected(409, "La subida ya se completó")
+        return updated
+
+    @staticmethod
+    def content_key(session: Dict[str, Any], extension: str) -> str:
+        """SHA-256 de (tamaño de bloque + hashes de bloque): identifica el contenido sin releerlo"""
+        digest = hashlib.sha256(f"{session['chunk_size']}:{session['size']}:".encode())
+        for index in range(session["chunk_count"]):
+            digest.update(bytes.fromhex(session["chunks"][str(index)]))
+        return f"{digest.hexdigest()}.{extension}"
+
+    @staticmethod
+    def _sync_file(path: Path) -> None:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    async def complete(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        """Publica el archivo ensamblado en el backend; devuelve la sesión con ``blob_key``"""
+        if session["status"] == "complete":
+            return session
+        missing = missing_chunks(session)
+        if missing:
+            raise UploadRejected(409, f"Faltan {len(missing)} bloques: {missing[:20]}")
+        detected = session.get("detected")
+        if not detected or detected[1] not in ALLOWED_TYPES:
+            raise UploadRejected(415, "Tipo de archivo no permitido: sube una foto (JPEG, PNG, WebP, HEIC) o un PDF")
+        extension, content_type = detected
+        key = self.content_key(session, extension)
+        partial = self._partial_path(session["id"])
+        if not partial.exists():
+            raise UploadRejected(410, "El archivo parcial ya no existe en este servidor; crea una nueva sesión")
+        await asyncio.to_thread(self._sync_file, partial)
+        await self.blobs.put_file(key, partial, content_type)
+        updated = await self.collection.find_one_and_update(
+            {"id": session["id"]},
+            {"$set": {"status": "complete", "blob_key": key, "content_type": content_type,
+                      "completed_at": datetime.now(timezone.utc)}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        await asyncio.to_thread(partial.unlink, True)
+        return updated
+
+    def prune(self) -> int:
+        """Borra archivos parciales abandonados (más viejos que el TTL); las sesiones caducan por índice TTL"""
+        if not self.partial_dir.is_dir():
+            return 0
+        cutoff = time.time() - self.ttl.total_seconds()
+        removed = 0
+        for path in self.partial_dir.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
@@ -0,0 +1,227 @@
+"""
+Perfilado de CPU bajo demanda, por petición.
+
+Una petición con encabezado ``X-Profile`` y token de administrador se ejecuta
+bajo un perfilador:
+
+- ``X-Profile: sample`` (por defecto): un hilo muestrea cada
+  ``PROFILE_SAMPLE_INTERVAL_MS`` la pila del hilo del event loop mientras la
+  tarea en curso es la de esta petición. Produce pilas colapsadas
+  (``frame;frame;frame N``), listas para flamegraph.pl/speedscope.
+  La resolución real está limitada por ``sys.getswitchinterval()`` (5 ms):
+  el hilo muestreador necesita el GIL para leer la pila.
+- ``X-Profile: cprofile``: perfilador determinista (``cProfile``) con salida
+  ``pstats``. Mide todo lo que corre en el loop mientras dura la petición,
+  incluidas otras peticiones concurrentes.
+
+Solo se perfila una petición a la vez y como máximo ``PROFILE_MAX_PER_MINUTE``
+por minuto; el resto se atiende normalmente sin perfilar. Los perfiles se
+guardan en memoria (los últimos ``PROFILE_KEEP``) y la respuesta incluye
+``X-Profile-Id`` para consultarlos en ``/api/admin/profiles/{id}``.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE = "sample"
+CPROFILE = "cprofile"
+MODES = (SAMPLE, CPROFILE)
+
+
+class Profile:
+    def __init__(self, mode: str, method: str, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.created_at = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.collapsed: str = ""
+        self.pstats: str = ""
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "created_at": self.created_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": self.samples,
+        }
+
+
+class RateLimiter:
+    """Ventana deslizante de un minuto, global para todo el proceso"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._events: Deque[float] = deque()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        while self._events and now - self._events[0] > 60:
+            self._events.popleft()
+        if len(self._events) >= self.per_minute:
+            return False
+        self._events.append(now)
+        return True
+
+
+class StackSampler:
+    """Muestrea la pila del hilo del loop mientras corre la tarea indicada"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, task: asyncio.Task, interval: float):
+        self.loop = loop
+        self.task = task
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                if asyncio.current_task(self.loop) is not self.task:
+                    continue
+            except RuntimeError:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    def __init__(self, per_minute: int = 6, keep: int = 50, sample_interval: float = 0.001):
+        self.limiter = RateLimiter(per_minute)
+        self.sample_interval = sample_interval
+        self.keep = keep
+        self.profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._busy = False
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        return cls(
+            per_minute=int(os.environ.get("PROFILE_MAX_PER_MINUTE", 6)),
+            keep=int(os.environ.get("PROFILE_KEEP", 50)),
+            sample_interval=float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 1)) / 1000,
+        )
+
+    def acquire(self) -> bool:
+        if self._busy or not self.limiter.allow():
+            return False
+        self._busy = True
+        return True
+
+    def release(self) -> None:
+        self._busy = False
+
+    def store(self, profile: Profile) -> None:
+        self.profiles[profile.id] = profile
+        while len(self.profiles) > self.keep:
+            self.profiles.popitem(last=False)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [profile.summary() for profile in reversed(self.profiles.values())]
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        return self.profiles.get(profile_id)
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI: perfila peticiones con ``X-Profile`` autorizadas"""
+
+    header = b"x-profile"
+
+    def __init__(self, app, profiler: Profiler, authorize: Callable[[dict], Awaitable[bool]]):
+        self.app = app
+        self.profiler = profiler
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = next((v.decode("latin-1").strip().lower() for k, v in scope["headers"] if k == self.header), None)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        mode = mode if mode in MODES else SAMPLE
+        if not await self.authorize(scope) or not self.profiler.acquire():
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self._profile(mode, scope, receive, send)
+        finally:
+            self.profiler.release()
+
+    async def _profile(self, mode: str, scope, receive, send):
+        profile = Profile(mode, scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        sampler = None
+        cprofiler = None
+        if mode == SAMPLE:
+            sampler = StackSampler(asyncio.get_running_loop(), asyncio.current_task(), self.profiler.sample_interval)
+            sampler.start()
+        else:
+            cprofiler = cProfile.Profile()
+            cprofiler.enable()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration = time.perf_counter() - start
+            if sampler is not None:
+                sampler.stop()
+                profile.samples = sum(sampler.stacks.values())
+                profile.collapsed = sampler.collapsed()
+            else:
+                cprofiler.disable()
+                output = io.StringIO()
+                stats = pstats.Stats(cprofiler, stream=output)
+                profile.samples = stats.total_calls
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(80)
+                profile.pstats = output.getvalue()
+            route = scope.get("route")
+            profile.route = getattr(route, "path", None)
+            self.profiler.store(profile)
+            logger.info(f"Profiled {profile.method} {profile.path} ({mode}, {profile.duration * 1000:.1f}ms) as {profile.id}")
@@ -0,0 +1,175 @@
+"""
+Contabilidad de consultas a MongoDB por petición.
+
+Un ``ContextVar`` guarda el ``QueryTracker`` de la petición en curso; Motor
+copia el contexto al ejecutar pymongo en su executor, así que el
+``CommandListener`` puede atribuir cada comando a la petición que lo originó.
+
+Al terminar la petición se emite un encabezado ``Server-Timing`` con el total y
+el desglose por colección, y se registra una advertencia cuando la misma forma
+de consulta se repite más de ``QUERY_REPEAT_WARN_THRESHOLD`` veces (N+1).
+
+Las rutas pueden declarar un presupuesto con ``@query_budget(n)``. Con
+``QUERY_BUDGET_MODE=raise`` (modo de pruebas) exceder el presupuesto lanza
+``QueryBudgetExceeded``; con ``warn`` solo se registra.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Comandos que no cuentan como consultas nuevas (continuaciones de cursor)
+CURSOR_COMMANDS = frozenset({"getMore", "killCursors"})
+# Comandos internos del driver que no interesan por petición
+IGNORED_COMMANDS = frozenset({"hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue"})
+
+current_tracker: ContextVar[Optional["QueryTracker"]] = ContextVar("farmachelo_query_tracker", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries: int) -> Callable:
+    """Declara cuántas consultas puede emitir una ruta (incluyendo sus dependencias)"""
+    def decorator(endpoint):
+        endpoint.__query_budget__ = max_queries
+        return endpoint
+    return decorator
+
+
+def query_shape(value: Any) -> Any:
+    """Estructura del filtro sin valores concretos: {"id": "?"}, {"$in": "?"}..."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        # Los pipelines y operadores lógicos conservan su estructura; los arreglos de valores no
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+    return "?"
+
+
+def command_filter(command_name: str, command: Dict[str, Any]) -> Any:
+    if command_name in ("find", "count"):
+        return command.get("filter", command.get("query", {}))
+    if command_name == "aggregate":
+        return command.get("pipeline", [])
+    if command_name == "findAndModify":
+        return command.get("query", {})
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or [{}]
+        return statements[0].get("q", {})
+    if command_name == "distinct":
+        return {"key": command.get("key"), "query": command.get("query", {})}
+    return {}
+
+
+class QueryTracker:
+    """Consultas, tiempo y formas repetidas de una petición"""
+
+    def __init__(self):
+        self.queries = 0
+        self.round_trips = 0
+        self.duration = 0.0
+        self.by_collection: Dict[str, list] = {}
+        self.shapes: Counter = Counter()
+        self._inflight: Dict[Tuple[Any, int], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, key: Tuple[Any, int], command_name: str, command: Dict[str, Any]) -> None:
+        value = command.get(command_name)
+        collection = value if isinstance(value, str) else "-"
+        with self._lock:
+            self._inflight[key] = collection
+            if command_name not in CURSOR_COMMANDS:
+                self.queries += 1
+                self.shapes[(collection, command_name, repr(query_shape(command_filter(command_name, command))))] += 1
+
+    def finished(self, key: Tuple[Any, int], duration: float) -> None:
+        with self._lock:
+            collection = self._inflight.pop(key, "-")
+            self.round_trips += 1
+            self.duration += duration
+            stats = self.by_collection.setdefault(collection, [0, 0.0])
+            stats[0] += 1
+            stats[1] += duration
+
+    def server_timing(self) -> str:
+        parts = [f'db;dur={self.duration * 1000:.2f};desc="{self.queries} queries, {self.round_trips} round trips"']
+        for collection, (count, duration) in sorted(self.by_collection.items()):
+            parts.append(f'db-{collection};dur={duration * 1000:.2f};desc="{count}"')
+        return ", ".join(parts)
+
+    def repeated_shapes(self, threshold: int):
+        return [(shape, count) for shape, count in self.shapes.items() if count >= threshold]
+
+
+class QueryTrackingListener(monitoring.CommandListener):
+    def started(self, event):
+        tracker = current_tracker.get()
+        if tracker is not None and event.command_name not in IGNORED_COMMANDS:
+            tracker.started((event.connection_id, event.request_id), event.command_name, event.command)
+
+    def _finish(self, event):
+        tracker = current_tracker.get()
+        if tracker is not None and event.command_name not in IGNORED_COMMANDS:
+            tracker.finished((event.connection_id, event.request_id), event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+
+class QueryAccountingMiddleware:
+    """Middleware ASGI: Server-Timing, detección de N+1 y presupuestos por ruta"""
+
+    def __init__(self, app, repeat_threshold: Optional[int] = None, budget_mode: Optional[str] = None):
+        self.app = app
+        self.repeat_threshold = repeat_threshold or int(os.environ.get("QUERY_REPEAT_WARN_THRESHOLD", 5))
+        self.budget_mode = budget_mode or os.environ.get("QUERY_BUDGET_MODE", "warn")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracker = QueryTracker()
+        token = current_tracker.set(tracker)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                app_timing = f'app;dur={(time.perf_counter() - start) * 1000:.2f}'
+                headers.append((b"server-timing", f"{tracker.server_timing()}, {app_timing}".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_tracker.reset(token)
+        self._check(scope, tracker)
+
+    def _check(self, scope, tracker: QueryTracker) -> None:
+        route = scope.get("route")
+        route_path = getattr(route, "path", scope["path"])
+        for (collection, command_name, shape), count in tracker.repeated_shapes(self.repeat_threshold):
+            logger.warning(f"Repeated query shape on {scope['method']} {route_path}: {count}x {command_name} {collection} {shape}")
+
+        budget = getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+        if budget is None or tracker.queries <= budget or self.budget_mode == "off":
+            return
+        message = f"{scope['method']} {route_path} issued {tracker.queries} queries (budget {budget})"
+        if self.budget_mode == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,183 @@
+"""
+Detector de bloqueos del event loop.
+
+Una corrutina actualiza un latido cada ``interval`` segundos; un hilo
+vigilante comprueba el latido y, cuando el loop lleva más de ``threshold`` sin
+avanzar, captura la pila del hilo del loop en ese instante (el código síncrono
+que lo está bloqueando) junto con la ruta de la petición en curso. Al volver el
+latido se cierra el bloqueo con su duración total.
+
+Los bloqueos se agregan por (ruta, frame de la app más profundo) y se exponen
+en ``GET /api/admin/diagnostics/stalls``. ``LOOP_STALL_THRESHOLD_MS`` (100 por
+defecto) fija el umbral y ``LOOP_WATCHDOG=off`` desactiva el vigilante.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from farmachelo import metrics
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = str(Path(__file__).resolve().parent.parent)
+STACK_LIMIT = 40
+
+loop_stalls_total = metrics.registry.register(metrics.Counter(
+    "farmachelo_event_loop_stalls_total", "Bloqueos del event loop por encima del umbral", ("route",)))
+loop_stall_duration = metrics.registry.register(metrics.Histogram(
+    "farmachelo_event_loop_stall_seconds", "Duración de los bloqueos del event loop"))
+
+
+def _is_app_frame(filename: str) -> bool:
+    return filename.startswith(APP_ROOT) and "site-packages" not in filename and f"{os.sep}venv{os.sep}" not in filename
+
+
+class StallReport:
+    """Bloqueos agregados de una ruta en un mismo punto del código"""
+
+    def __init__(self, route: str, location: str, stack: List[str]):
+        self.route = route
+        self.location = location
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_seen = 0.0
+        self.stack = stack
+
+    def add(self, duration: float, stack: List[str]) -> None:
+        self.count += 1
+        self.total += duration
+        self.last_seen = time.time()
+        if duration >= self.max:
+            self.max = duration
+            self.stack = stack
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "route": self.route,
+            "location": self.location,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "last_seen": self.last_seen,
+            "stack": self.stack,
+        }
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.1, interval: float = 0.02, max_reports: int = 500):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_reports = max_reports
+        self.reports: Dict[Tuple[str, str], StallReport] = {}
+        # Tareas en curso -> scope ASGI, para atribuir el bloqueo a una ruta
+        self.active: Dict[asyncio.Task, dict] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._beat = 0.0
+        self._pending: Optional[Tuple[float, str, str, List[str]]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "LoopWatchdog":
+        return cls(threshold=float(os.environ.get("LOOP_STALL_THRESHOLD_MS", 100)) / 1000)
+
+    @property
+    def enabled(self) -> bool:
+        return os.environ.get("LOOP_WATCHDOG", "on") != "off"
+
+    async def run(self) -> None:
+        """Latido del loop; arranca el hilo vigilante mientras está activo"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                self._beat = time.perf_counter()
+                await asyncio.sleep(self.interval)
+        finally:
+            self._stop.set()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            stalled_for = time.perf_counter() - beat - self.interval
+            pending = self._pending
+            if pending is not None and pending[0] != beat:
+                # El loop volvió a latir: el bloqueo terminó
+                self._record(pending, beat - pending[0] - self.interval)
+                self._pending = None
+            elif pending is None and stalled_for > self.threshold:
+                self._pending = (beat, *self._capture())
+
+    def _capture(self) -> Tuple[str, str, List[str]]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.extract_stack(frame, limit=STACK_LIMIT) if frame is not None else []
+        app_frames = [entry for entry in stack if _is_app_frame(entry.filename)]
+        culprit = app_frames[-1] if app_frames else (stack[-1] if stack else None)
+        location = f"{os.path.relpath(culprit.filename, APP_ROOT)}:{culprit.lineno} {culprit.name}" if culprit else "-"
+        return self._current_route(), location, traceback.format_list(stack)
+
+    def _current_route(self) -> str:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return "-"
+        scope = self.active.get(task)
+        if scope is None:
+            return "<background>"
+        route = scope.get("route")
+        return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+    def _record(self, pending: Tuple[float, str, str, List[str]], duration: float) -> None:
+        _, route, location, stack = pending
+        with self._lock:
+            report = self.reports.get((route, location))
+            if report is None:
+                if len(self.reports) >= self.max_reports:
+                    return
+                report = self.reports[(route, location)] = StallReport(route, location, stack)
+            report.add(duration, stack)
+        loop_stalls_total.inc((route,))
+        loop_stall_duration.observe((), duration)
+        logger.warning(f"Event loop blocked {duration * 1000:.0f}ms in {route} at {location}")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            reports = [report.as_dict() for report in self.reports.values()]
+        return sorted(reports, key=lambda report: -report["total_ms"])
+
+    def reset(self) -> None:
+        with self._lock:
+            self.reports.clear()
+
+
+class StallAttributionMiddleware:
+    """Middleware ASGI: registra qué tarea atiende cada petición para el vigilante"""
+
+    def __init__(self, app, watchdog: LoopWatchdog):
+        self.app = app
+        self.watchdog = watchdog
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        self.watchdog.active[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.watchdog.active.pop(task, None)
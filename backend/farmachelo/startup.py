@@ -0,0 +1,94 @@
+"""
+Fases del arranque y compuerta de readiness.
+
+``server.py`` importa este módulo antes que nada y marca el final de cada fase:
+
+- ``interpreter``: desde que el proceso existe hasta la primera línea de la app
+  (lectura de ``/proc``; solo Linux);
+- ``imports``: importaciones de ``server.py``;
+- ``app``: modelos, rutas y middlewares;
+- ``lifespan``: arranque del worker antes de aceptar tráfico;
+- ``warmup``: precalentamiento en segundo plano (ping a MongoDB, snapshot del
+  catálogo, serializadores). ``/ready`` responde 503 hasta que termina.
+
+Cada fase queda en ``farmachelo_startup_phase_seconds`` y en ``/health``; al
+abrir la compuerta se registra un resumen. ``benchmarks/bench_startup.py``
+comprueba el arranque en frío contra un presupuesto.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from farmachelo import metrics
+
+logger = logging.getLogger(__name__)
+
+startup_phase_seconds = metrics.registry.register(metrics.Gauge(
+    "farmachelo_startup_phase_seconds", "Duración de cada fase del arranque", ("phase",)))
+
+
+def process_age() -> Optional[float]:
+    """Segundos desde que arrancó el proceso (``/proc/self/stat`` + ``/proc/uptime``)"""
+    try:
+        with open("/proc/self/stat") as handle:
+            # El nombre del ejecutable va entre paréntesis y puede tener espacios
+            fields = handle.read().rpartition(")")[2].split()
+        with open("/proc/uptime") as handle:
+            uptime = float(handle.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupPhases:
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self._last = time.perf_counter()
+        interpreter = process_age()
+        if interpreter is not None:
+            self._record("interpreter", interpreter)
+
+    def _record(self, name: str, seconds: float) -> None:
+        self.phases[name] = seconds
+        startup_phase_seconds.set(seconds, (name,))
+
+    def mark(self, name: str) -> float:
+        """Cierra la fase ``name`` (desde la marca anterior)"""
+        now = time.perf_counter()
+        seconds = now - self._last
+        self._last = now
+        self._record(name, seconds)
+        return seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Mide un bloque por separado (p. ej. el lifespan de un worker recién forkeado)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - started)
+
+    def open_gate(self) -> None:
+        self.ready = True
+        logger.info(f"Ready after startup: {self.describe()}")
+
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def describe(self) -> str:
+        parts = [f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items()]
+        return f"{', '.join(parts)} (total {self.total() * 1000:.0f}ms)"
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "ready": self.ready,
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "total_ms": round(self.total() * 1000, 1),
+        }
+
+
+phases = StartupPhases()
@@ -0,0 +1,351 @@
+"""
+Servicio de ``/uploads``: validadores, caché inmutable, rangos y sidecars precomprimidos.
+
+``UploadsApp`` es una app ASGI registrada como ruta ``/uploads/{filename}``
+(sin la inyección de dependencias ni la validación de FastAPI):
+
+- Solo sirve nombres planos del almacén: sin separadores, sin ``..`` y sin
+  archivos ocultos (``.tmp``, ``.remote-cache``) ni temporales ``*.tmp``.
+- Los nombres direccionados por contenido (``<sha256>.<ext>`` y sus derivados
+  ``<sha256>-<ancho>w.<ext>``) llevan un ``ETag`` fuerte tomado del propio
+  nombre y ``Cache-Control: public, max-age=31536000, immutable``. El resto
+  (subidas antiguas) un ``ETag`` de mtime/tamaño y ``no-cache``.
+- ``If-None-Match``/``If-Modified-Since`` responden 304; ``Range`` de un solo
+  intervalo responde 206 (o 416), respetando ``If-Range``.
+- Si existen ``<archivo>.br``/``.zst``/``.gz`` se sirven según
+  ``Accept-Encoding`` (p. ej. SVG precomprimidos en el despliegue).
+- Los blobs se leen del backend de ``farmachelo.blobstore``; con S3 se
+  responde 307 a una URL firmada y el bucket atiende rangos y validadores.
+- Un LRU de ``stat`` (``STATIC_CACHE_ENTRIES``, 2048) evita consultar el backend en
+  cada petición y guarda en memoria los archivos pequeños
+  (``STATIC_MEMORY_FILE_KB``, 256 KB; ``STATIC_MEMORY_MB`` en total, 64). Las
+  entradas mutables se revalidan tras ``STATIC_STAT_TTL`` segundos (2).
+"""
+import mimetypes
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+from farmachelo import blobstore, compression, metrics
+
+IMMUTABLE_CACHE_CONTROL = b"public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = b"public, no-cache"
+CONTENT_ADDRESSED = re.compile(r"^([0-9a-f]{64}(?:-\d+w)?)\.[a-z0-9]+$")
+SIDECARS = (("br", ".br"), ("zstd", ".zst"), ("gzip", ".gz"))
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+static_requests_total = metrics.registry.register(metrics.Counter(
+    "farmachelo_static_requests_total", "Respuestas de /uploads por estado", ("status",)))
+static_cache_total = metrics.registry.register(metrics.Counter(
+    "farmachelo_static_cache_total", "Consultas al caché de stat/contenido de /uploads", ("result",)))
+
+
+@dataclass
+class Representation:
+    key: str
+    size: int
+    mtime: float
+    body: Optional[bytes] = None
+
+
+@dataclass
+class StaticEntry:
+    content_type: str
+    etag: str
+    last_modified: str
+    mtime: float
+    immutable: bool
+    checked: float
+    identity: Representation
+    encoded: Dict[str, Representation] = field(default_factory=dict)
+
+    @property
+    def memory(self) -> int:
+        return sum(len(r.body) for r in (self.identity, *self.encoded.values()) if r.body is not None)
+
+
+def safe_name(filename: str) -> bool:
+    """Nombre plano servible del almacén (nada oculto, temporal ni fuera de la raíz)"""
+    return (
+        bool(filename)
+        and not filename.startswith(".")
+        and not filename.endswith(".tmp")
+        and "/" not in filename
+        and "\\" not in filename
+        and "\x00" not in filename
+    )
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(inicio, fin inclusivo) de un ``Range`` de un solo intervalo; ValueError si no es satisfacible.
+
+    None si el encabezado no aplica (otra unidad, varios intervalos o mal
+    formado): se responde el archivo completo, como permite RFC 9110.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = (part.strip() for part in spec.strip().partition("-"))
+    if not dash:
+        return None
+    if not first:
+        if not last.isdigit():
+            return None
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("rango vacío")
+        return max(0, size - length), size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start = int(first)
+    if last and start > int(last):
+        return None
+    if start >= size:
+        raise ValueError("rango fuera del archivo")
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+class StaticCache:
+    """LRU de entradas ``stat`` + cuerpos pequeños en memoria"""
+
+    def __init__(self, max_entries: int, memory_file_bytes: int, memory_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.memory_file_bytes = memory_file_bytes
+        self.memory_bytes = memory_bytes
+        self.ttl = ttl
+        self.memory = 0
+        self._entries: "OrderedDict[str, StaticEntry]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "StaticCache":
+        return cls(
+            max_entries=int(os.environ.get("STATIC_CACHE_ENTRIES", 2048)),
+            memory_file_bytes=int(float(os.environ.get("STATIC_MEMORY_FILE_KB", 256)) * 1024),
+            memory_bytes=int(float(os.environ.get("STATIC_MEMORY_MB", 64)) * 1024 * 1024),
+            ttl=float(os.environ.get("STATIC_STAT_TTL", 2)),
+        )
+
+    def get(self, filename: str) -> Optional[StaticEntry]:
+        entry = self._entries.get(filename)
+        if entry is None:
+            return None
+        if not entry.immutable and time.monotonic() - entry.checked > self.ttl:
+            self.discard(filename)
+            return None
+        self._entries.move_to_end(filename)
+        return entry
+
+    def put(self, filename: str, entry: StaticEntry) -> None:
+        self.discard(filename)
+        for representation in (entry.identity, *entry.encoded.values()):
+            if representation.body is not None and self.memory + len(representation.body) > self.memory_bytes:
+                representation.body = None
+            elif representation.body is not None:
+                self.memory += len(representation.body)
+        self._entries[filename] = entry
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.memory -= evicted.memory
+
+    def discard(self, filename: str) -> None:
+        entry = self._entries.pop(filename, None)
+        if entry is not None:
+            self.memory -= entry.memory
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.memory = 0
+
+
+class UploadsApp:
+    """App ASGI que sirve los archivos del almacén de subidas"""
+
+    def __init__(self, blobs: blobstore.BlobStore, cache: Optional[StaticCache] = None):
+        self.blobs = blobs
+        self.cache = cache or StaticCache.from_env()
+
+    # ---- búsqueda en el backend ----
+
+    async def _representation(self, key: str) -> Optional[Representation]:
+        info = await self.blobs.stat(key)
+        if info is None:
+            return None
+        body = None
+        if info.size <= self.cache.memory_file_bytes:
+            body = b"".join([chunk async for chunk in self.blobs.read(key)])
+        return Representation(key, len(body) if body is not None else info.size, info.mtime, body)
+
+    async def _load(self, filename: str) -> Optional[StaticEntry]:
+        identity = await self._representation(filename)
+        if identity is None:
+            return None
+        mtime = identity.mtime
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        match = CONTENT_ADDRESSED.match(filename)
+        if match:
+            etag = f'"{match.group(1)}"'
+        else:
+            etag = f'"{int(mtime * 1_000_000):x}-{identity.size:x}"'
+        encoded = {}
+        for encoding, suffix in SIDECARS:
+            sidecar = await self._representation(filename + suffix)
+            if sidecar is not None:
+                encoded[encoding] = sidecar
+        return StaticEntry(
+            content_type=content_type,
+            etag=etag,
+            last_modified=formatdate(mtime, usegmt=True),
+            mtime=mtime,
+            immutable=match is not None,
+            checked=time.monotonic(),
+            identity=identity,
+            encoded=encoded,
+        )
+
+    async def lookup(self, filename: str) -> Optional[StaticEntry]:
+        entry = self.cache.get(filename)
+        if entry is not None:
+            static_cache_total.inc(("hit",))
+            return entry
+        static_cache_total.inc(("miss",))
+        entry = await self._load(filename)
+        if entry is not None:
+            self.cache.put(filename, entry)
+        return entry
+
+    # ---- ASGI ----
+
+    async def __call__(self, scope, receive, send):
+        method = scope["method"]
+        filename = scope["path_params"]["filename"]
+        if not safe_name(filename):
+            await self._send_json(send, 404, b'{"detail":"File not found"}')
+            return
+        if self.blobs.redirects:
+            # S3: el cliente descarga directamente del bucket con una URL firmada
+            location = await self.blobs.presigned_url(filename)
+            static_requests_total.inc(("307",))
+            await send({"type": "http.response.start", "status": 307, "headers": [
+                (b"location", location.encode()),
+                (b"cache-control", f"private, max-age={max(0, self.blobs.presign_seconds - 60)}".encode()),
+                (b"content-length", b"0"),
+            ]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        entry = await self.lookup(filename)
+        if entry is None:
+            await self._send_json(send, 404, b'{"detail":"File not found"}')
+            return
+
+        headers = {}
+        for key, value in scope["headers"]:
+            if key in (b"if-none-match", b"if-modified-since", b"range", b"if-range", b"accept-encoding"):
+                headers[key] = value.decode("latin-1")
+
+        encoding = None
+        if entry.encoded and b"range" not in headers:
+            encoding = compression.negotiate(headers.get(b"accept-encoding", ""), entry.encoded)
+        representation = entry.encoded[encoding] if encoding else entry.identity
+        etag = entry.etag if encoding is None else f'{entry.etag[:-1]}-{encoding}"'
+
+        response_headers: List[Tuple[bytes, bytes]] = [
+            (b"etag", etag.encode()),
+            (b"last-modified", entry.last_modified.encode()),
+            (b"cache-control", IMMUTABLE_CACHE_CONTROL if entry.immutable else MUTABLE_CACHE_CONTROL),
+            (b"accept-ranges", b"bytes"),
+        ]
+        if entry.encoded:
+            response_headers.append((b"vary", b"Accept-Encoding"))
+
+        if self._not_modified(headers, etag, entry):
+            await self._send_empty(send, 304, response_headers)
+            return
+
+        response_headers.append((b"content-type", entry.content_type.encode()))
+        if encoding is not None:
+            response_headers.append((b"content-encoding", encoding.encode()))
+
+        start, end, status = 0, representation.size - 1, 200
+        range_header = headers.get(b"range")
+        if range_header and self._if_range_matches(headers.get(b"if-range"), etag, entry):
+            try:
+                requested = parse_range(range_header, representation.size)
+            except ValueError:
+                response_headers.append((b"content-range", f"bytes */{representation.size}".encode()))
+                response_headers.append((b"content-length", b"0"))
+                await self._send_empty(send, 416, response_headers)
+                return
+            if requested is not None:
+                start, end = requested
+                status = 206
+                response_headers.append((b"content-range", f"bytes {start}-{end}/{representation.size}".encode()))
+
+        length = max(0, end - start + 1)
+        response_headers.append((b"content-length", str(length).encode()))
+        static_requests_total.inc((str(status),))
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        if method == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+        elif representation.body is not None:
+            await send({"type": "http.response.body", "body": representation.body[start:end + 1]})
+        else:
+            await self._stream(send, representation.key, start, length)
+
+    @staticmethod
+    def _not_modified(headers: Dict[bytes, str], etag: str, entry: StaticEntry) -> bool:
+        if_none_match = headers.get(b"if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            # Comparación débil (RFC 9110 §13.1.2)
+            return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+        if_modified_since = headers.get(b"if-modified-since")
+        if if_modified_since:
+            try:
+                return int(entry.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def _if_range_matches(if_range: Optional[str], etag: str, entry: StaticEntry) -> bool:
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith(('"', "W/")):
+            # If-Range exige comparación fuerte
+            return if_range == etag
+        return if_range == entry.last_modified
+
+    async def _stream(self, send, key: str, start: int, length: int) -> None:
+        remaining = length
+        async for chunk in self.blobs.read(key, start, length):
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # El blob se truncó mientras se enviaba
+            await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def _send_empty(send, status: int, headers) -> None:
+        static_requests_total.inc((str(status),))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def _send_json(send, status: int, body: bytes) -> None:
+        static_requests_total.inc((str(status),))
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,372 @@
+"""
+Generador determinista de datos sintéticos a gran escala.
+
+Produce usuarios, productos, carritos, pedidos en todos los estados,
+transacciones de pago y facturas con la misma forma que escribe ``server.py``.
+Las distribuciones intentan parecerse a producción: popularidad de productos
+tipo Zipf, estacionalidad (temporada de gripe, diciembre, fines de semana y
+horas pico) y una mezcla de clientes recurrentes.
+
+Los pedidos se generan en fragmentos de tamaño fijo, cada uno con su propia
+semilla derivada, así que el resultado no depende del número de procesos. Cada
+proceso inserta sus fragmentos con ``insert_many`` sin orden.
+"""
+import bisect
+import itertools
+import math
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+ORDER_STATUSES = ["pending", "paid", "processing", "shipped", "delivered", "cancelled"]
+ORDER_STATUS_WEIGHTS = [0.05, 0.15, 0.10, 0.15, 0.50, 0.05]
+INVOICED_STATUSES = {"paid", "processing", "shipped", "delivered"}
+CATEGORIES = ["over_counter", "prescription", "vitamins", "personal_care", "baby", "first_aid"]
+CARD_TYPES = ["Visa", "Mastercard", "Amex", "Diners Club", "Codensa"]
+CITIES = ["Bogotá", "Medellín", "Cali", "Barranquilla", "Cartagena", "Bucaramanga", "Pereira"]
+PRODUCT_NAMES = [
+    "Paracetamol", "Ibuprofeno", "Naproxeno", "Loratadina", "Omeprazol", "Amoxicilina", "Losartán",
+    "Metformina", "Acetaminofén", "Vitamina C", "Vitamina D3", "Complejo B", "Suero oral", "Diclofenaco",
+    "Cetirizina", "Azitromicina", "Atorvastatina", "Salbutamol", "Clotrimazol", "Ranitidina",
+]
+PRESENTATIONS = ["100mg", "200mg", "250mg", "400mg", "500mg", "1g", "jarabe 120ml", "crema 30g", "x30 tabletas"]
+FIRST_NAMES = ["Ana", "Carlos", "Luisa", "Andrés", "María", "Juan", "Valentina", "Santiago", "Camila", "Felipe"]
+LAST_NAMES = ["Gómez", "Rodríguez", "Martínez", "López", "García", "Pérez", "Hernández", "Ramírez", "Torres"]
+
+# Peso relativo por mes (1..12): temporada respiratoria y compras de diciembre
+MONTH_WEIGHTS = [1.3, 1.2, 1.1, 1.2, 1.0, 0.9, 0.9, 0.9, 1.0, 1.1, 1.2, 1.5]
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 1.1, 1.3, 0.8]
+HOUR_WEIGHTS = [0.1] * 6 + [0.5, 0.9, 1.2, 1.3, 1.3, 1.2, 1.4, 1.3, 1.1, 1.0, 1.0, 1.1, 1.4, 1.6, 1.5, 1.1, 0.6, 0.3]
+MAX_SEASONAL_WEIGHT = max(MONTH_WEIGHTS) * max(WEEKDAY_WEIGHTS) * max(HOUR_WEIGHTS)
+
+
+@dataclass
+class GeneratorConfig:
+    seed: int = 42
+    users: int = 10000
+    products: int = 2000
+    orders: int = 100000
+    cart_ratio: float = 0.3
+    repeat_buyer_share: float = 0.2
+    repeat_order_share: float = 0.6
+    zipf_s: float = 1.1
+    days: int = 365
+    end: datetime = datetime(2025, 12, 31, tzinfo=timezone.utc)
+    shard_size: int = 20000
+
+    @property
+    def start(self) -> datetime:
+        return self.end - timedelta(days=self.days)
+
+
+def _namespace(config: GeneratorConfig) -> uuid.UUID:
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"farmachelo-synthetic:{config.seed}")
+
+
+def user_id(config: GeneratorConfig, index: int) -> str:
+    return str(uuid.uuid5(_namespace(config), f"user:{index}"))
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+# ==================== DISTRIBUCIONES ====================
+
+class ZipfSampler:
+    """Muestreo de índices [0, n) con probabilidad proporcional a 1/(k+1)^s"""
+
+    def __init__(self, n: int, s: float):
+        weights = [1.0 / math.pow(k + 1, s) for k in range(n)]
+        self.cumulative = list(itertools.accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def sample(self, rng: random.Random) -> int:
+        return bisect.bisect_left(self.cumulative, rng.random() * self.total)
+
+
+def seasonal_timestamp(rng: random.Random, start: datetime, span_seconds: float) -> datetime:
+    """Muestreo por rechazo con pesos de mes, día de la semana y hora"""
+    while True:
+        ts = start + timedelta(seconds=rng.random() * span_seconds)
+        weight = MONTH_WEIGHTS[ts.month - 1] * WEEKDAY_WEIGHTS[ts.weekday()] * HOUR_WEIGHTS[ts.hour]
+        if rng.random() * MAX_SEASONAL_WEIGHT <= weight:
+            return ts
+
+
+# ==================== DOCUMENTOS ====================
+
+def generate_products(config: GeneratorConfig) -> List[Dict[str, Any]]:
+    rng = random.Random(f"{config.seed}:products")
+    products = []
+    for i in range(config.products):
+        base = rng.choice(PRODUCT_NAMES)
+        category = rng.choice(CATEGORIES)
+        products.append({
+            "id": _uuid(rng),
+            "name": f"{base} {rng.choice(PRESENTATIONS)} #{i}",
+            "description": f"{base} - producto sintético para pruebas de carga",
+            "price": float(rng.randrange(3000, 250000, 500)),
+            "category": category,
+            "stock": rng.randint(0, 500),
+            "image_url": None,
+            "requires_prescription": category == "prescription",
+            "active": rng.random() > 0.03,
+            "created_at": config.start - timedelta(days=rng.randint(1, 365)),
+        })
+    return products
+
+
+def generate_users(config: GeneratorConfig, lo: int, hi: int) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(f"{config.seed}:users:{lo}")
+    for i in range(lo, hi):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield {
+            "id": user_id(config, i),
+            "email": f"user{i}@synthetic.farmachelo.com",
+            "name": f"{first} {last}",
+            # sha256("password123"), igual que hash_password en server.py
+            "password": "ef92b778bafe771e89245b89ecbc08a44a4e166c06659911881f383d4473e94f",
+            "phone": f"+57 3{rng.randint(0, 99):02d} {rng.randint(1000000, 9999999)}",
+            "address": f"Calle {rng.randint(1, 200)} #{rng.randint(1, 99)}-{rng.randint(1, 99)}, {rng.choice(CITIES)}",
+            "is_verified": rng.random() < 0.8,
+            "is_admin": False,
+            "created_at": config.start - timedelta(days=rng.randint(0, 730)),
+        }
+
+
+def generate_carts(config: GeneratorConfig, products: List[Dict[str, Any]], lo: int, hi: int) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(f"{config.seed}:carts:{lo}")
+    sampler = ZipfSampler(len(products), config.zipf_s)
+    for i in range(lo, hi):
+        if rng.random() >= config.cart_ratio:
+            continue
+        items = {}
+        for _ in range(rng.randint(1, 5)):
+            product = products[sampler.sample(rng)]
+            items[product["id"]] = {"product_id": product["id"], "quantity": rng.randint(1, 3), "prescription_file": None}
+        yield {
+            "id": _uuid(rng),
+            "user_id": user_id(config, i),
+            "items": list(items.values()),
+            "updated_at": config.end - timedelta(seconds=rng.randint(0, 30 * 86400)),
+        }
+
+
+def _pick_buyer(config: GeneratorConfig, rng: random.Random) -> int:
+    repeat_buyers = max(1, int(config.users * config.repeat_buyer_share))
+    if rng.random() < config.repeat_order_share:
+        return rng.randrange(repeat_buyers)
+    return rng.randrange(config.users)
+
+
+def generate_orders(
+    config: GeneratorConfig, products: List[Dict[str, Any]], lo: int, hi: int
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]]:
+    """Devuelve (pedido, transacción o None, factura o None) para cada índice"""
+    rng = random.Random(f"{config.seed}:orders:{lo}")
+    sampler = ZipfSampler(len(products), config.zipf_s)
+    span = config.days * 86400.0
+    for i in range(lo, hi):
+        buyer = _pick_buyer(config, rng)
+        buyer_id = user_id(config, buyer)
+        created_at = seasonal_timestamp(rng, config.start, span)
+        status = rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0]
+
+        lines: Dict[str, Dict[str, Any]] = {}
+        for _ in range(min(1 + int(rng.expovariate(0.6)), 10)):
+            product = products[sampler.sample(rng)]
+            line = lines.setdefault(product["id"], {"product": product, "quantity": 0})
+            line["quantity"] += rng.randint(1, 2)
+
+        items = [{"product_id": pid, "quantity": line["quantity"], "prescription_file": None} for pid, line in lines.items()]
+        enriched_items = [{
+            "product_id": pid,
+            "name": line["product"]["name"],
+            "description": line["product"]["description"],
+            "quantity": line["quantity"],
+            "unit_price": line["product"]["price"],
+            "total_price": line["product"]["price"] * line["quantity"],
+            "requires_prescription": line["product"]["requires_prescription"],
+        } for pid, line in lines.items()]
+        subtotal = sum(item["total_price"] for item in enriched_items)
+        tax_amount = subtotal * 0.19
+
+        stamp = created_at.strftime('%Y%m%d_%H%M%S')
+        order_id = f"ORD_{stamp}_{rng.getrandbits(32):08x}"
+        order = {
+            "id": order_id,
+            "user_id": buyer_id,
+            "items": items,
+            "total_amount": subtotal,
+            "status": status,
+            "payment_session_id": None,
+            "created_at": created_at,
+        }
+
+        transaction = invoice = None
+        if status in INVOICED_STATUSES:
+            transaction_id = f"TXN_{stamp}_{rng.getrandbits(32):08x}"
+            paid_at = created_at + timedelta(seconds=rng.randint(5, 600))
+            customer_info = {
+                "name": f"Cliente {buyer}",
+                "email": f"user{buyer}@synthetic.farmachelo.com",
+                "phone": "",
+                "address": "",
+                "identification": "",
+            }
+            order.update({
+                "payment_session_id": transaction_id,
+                "invoice_number": f"{i + 1:08d}",
+                "invoice_date": paid_at,
+                "enriched_items": enriched_items,
+                "subtotal": subtotal,
+                "tax_amount": tax_amount,
+                "discount_amount": 0.0,
+                "total_amount": subtotal + tax_amount,
+                "currency": "COP",
+                "payment_method": "card",
+                "payment_transaction_id": transaction_id,
+                "customer_info": customer_info,
+                "shipping_info": customer_info,
+                "invoice_notes": "Gracias por su compra en Farmachelo",
+            })
+            transaction = {
+                "id": _uuid(rng),
+                "transaction_id": transaction_id,
+                "email": customer_info["email"],
+                "user_id": buyer_id,
+                "amount": subtotal,
+                "currency": "COP",
+                "card_last_four": f"{rng.randint(0, 9999):04d}",
+                "card_type": rng.choice(CARD_TYPES),
+                "status": "completed",
+                "order_id": order_id,
+                "created_at": paid_at,
+            }
+            invoice = {
+                "id": _uuid(rng),
+                "order_id": order_id,
+                "user_id": buyer_id,
+                "invoice_number": f"FAC-{paid_at.strftime('%Y%m')}-{i + 1:08d}",
+                "issue_date": paid_at,
+                "due_date": paid_at + timedelta(days=30),
+                "items": enriched_items,
+                "subtotal": subtotal,
+                "tax_amount": tax_amount,
+                "discount_amount": 0.0,
+                "total_amount": subtotal + tax_amount,
+                "currency": "COP",
+                "status": "paid",
+                "payment_method": "card",
+                "payment_transaction_id": transaction_id,
+                "customer_info": customer_info,
+                "shipping_info": customer_info,
+                "notes": "Gracias por su compra en Farmachelo",
+            }
+        yield order, transaction, invoice
+
+
+# ==================== ESCRITURA ====================
+
+def _insert_batches(collection, docs, batch_size: int) -> int:
+    written = 0
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+def _write_shard(mongo_url: str, db_name: str, config_dict: Dict[str, Any], kind: str, lo: int, hi: int, batch_size: int,
+                 mongo_options: Optional[Dict[str, Any]] = None) -> int:
+    from pymongo import MongoClient
+
+    config = GeneratorConfig(**config_dict)
+    client = MongoClient(mongo_url, **{**(mongo_options or {}), "w": 1})
+    try:
+        db = client[db_name]
+        if kind == "users":
+            return _insert_batches(db.users, generate_users(config, lo, hi), batch_size)
+
+        products = generate_products(config)
+        if kind == "carts":
+            return _insert_batches(db.carts, generate_carts(config, products, lo, hi), batch_size)
+
+        written = 0
+        orders, transactions, invoices = [], [], []
+        for order, transaction, invoice in generate_orders(config, products, lo, hi):
+            orders.append(order)
+            if transaction:
+                transactions.append(transaction)
+                invoices.append(invoice)
+            if len(orders) >= batch_size:
+                for collection, docs in ((db.orders, orders), (db.payment_transactions, transactions), (db.invoices, invoices)):
+                    if docs:
+                        collection.insert_many(docs, ordered=False)
+                        written += len(docs)
+                orders, transactions, invoices = [], [], []
+        for collection, docs in ((db.orders, orders), (db.payment_transactions, transactions), (db.invoices, invoices)):
+            if docs:
+                collection.insert_many(docs, ordered=False)
+                written += len(docs)
+        return written
+    finally:
+        client.close()
+
+
+def generate(
+    config: GeneratorConfig,
+    mongo_url: str,
+    db_name: str,
+    workers: int = 0,
+    batch_size: int = 5000,
+    drop: bool = False,
+    mongo_options: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Genera e inserta el dataset completo; devuelve documentos escritos y docs/s.
+    ``mongo_options`` son las opciones del driver (``MongoConfig.options``).
+    """
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo_url, **(mongo_options or {}))
+    try:
+        db = client[db_name]
+        if drop:
+            for name in ("users", "products", "carts", "orders", "payment_transactions", "invoices"):
+                db.drop_collection(name)
+        started = time.perf_counter()
+        written = _insert_batches(db.products, generate_products(config), batch_size)
+    finally:
+        client.close()
+
+    shards = []
+    for kind, total in (("users", config.users), ("carts", config.users), ("orders", config.orders)):
+        shards.extend((kind, lo, min(lo + config.shard_size, total)) for lo in range(0, total, config.shard_size))
+
+    config_dict = asdict(config)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(_write_shard, mongo_url, db_name, config_dict, kind, lo, hi, batch_size, mongo_options)
+            for kind, lo, hi in shards
+        ]
+        for future in as_completed(futures):
+            written += future.result()
+            elapsed = time.perf_counter() - started
+            print(f"🧪 {written:,} documentos  {written / elapsed:,.0f} docs/s", end="\r", flush=True)
+
+    elapsed = time.perf_counter() - started
+    print()
+    return {"documents": written, "seconds": elapsed, "docs_per_second": written / elapsed if elapsed else 0.0}
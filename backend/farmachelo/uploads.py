@@ -0,0 +1,240 @@
+"""
+Subida de archivos: streaming por bloques, límites, SHA-256 y almacén direccionado por contenido.
+
+``ContentAddressedStore.save_upload`` lee el ``UploadFile`` por bloques, los
+escribe y hashea fuera del event loop en un temporal local (``.tmp``), valida
+el tipo por sus bytes mágicos (no por la extensión del cliente) y al terminar
+lo publica como ``<sha256>.<ext>`` en el backend de ``farmachelo.blobstore``
+(enlace atómico en disco, GridFS o S3). Si ese contenido ya existía se
+descarta el temporal y se devuelve la URL existente.
+
+``UploadSizeLimitMiddleware`` corta antes de que Starlette procese el
+multipart: rechaza por ``Content-Length`` y cuenta los bytes recibidos cuando el
+cliente no lo envía.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from starlette.exceptions import HTTPException
+
+from farmachelo import blobstore
+
+CHUNK_SIZE = 256 * 1024
+# Margen para los encabezados del multipart sobre el tamaño del archivo
+MULTIPART_OVERHEAD = 64 * 1024
+
+# (firma, desplazamiento, extensión, tipo MIME)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", 0, "jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", 0, "png", "image/png"),
+    (b"GIF87a", 0, "gif", "image/gif"),
+    (b"GIF89a", 0, "gif", "image/gif"),
+    (b"WEBP", 8, "webp", "image/webp"),
+    (b"ftypavif", 4, "avif", "image/avif"),
+)
+DEFAULT_ALLOWED_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+
+
+class UploadRejected(ValueError):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class StoredFile:
+    sha256: str
+    filename: str
+    size: int
+    content_type: str
+    created: bool
+    url: str
+
+
+def sniff_image(head: bytes) -> Optional[Tuple[str, str]]:
+    """(extensión, tipo MIME) según los bytes mágicos, o None"""
+    for signature, offset, extension, content_type in IMAGE_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if extension == "webp" and head[:4] != b"RIFF":
+                continue
+            return extension, content_type
+    return None
+
+
+class ContentAddressedStore:
+    def __init__(self, root: Path, url_prefix: str = "/uploads", max_bytes: int = 5 * 1024 * 1024,
+                 allowed_types: Iterable[str] = DEFAULT_ALLOWED_TYPES, blobs: Optional[blobstore.BlobStore] = None):
+        # ``root``: disco local para temporales y cachés; los blobs pueden vivir en otro backend
+        self.root = Path(root)
+        self.blobs = blobs or blobstore.LocalBlobStore(self.root)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_bytes = max_bytes
+        self.allowed_types = frozenset(allowed_types)
+        self.tmp_dir = self.root / ".tmp"
+
+    @classmethod
+    def from_env(cls, root: Path, blobs: Optional[blobstore.BlobStore] = None) -> "ContentAddressedStore":
+        allowed = os.environ.get("UPLOAD_ALLOWED_TYPES")
+        return cls(
+            root,
+            max_bytes=int(float(os.environ.get("UPLOAD_MAX_MB", 5)) * 1024 * 1024),
+            allowed_types=allowed.split(",") if allowed else DEFAULT_ALLOWED_TYPES,
+            blobs=blobs,
+        )
+
+    @property
+    def url_base(self) -> str:
+        """Base de las URLs guardadas: pública del bucket si la hay, si no ``/uploads``"""
+        return self.blobs.public_url or self.url_prefix
+
+    def url_for(self, filename: str) -> str:
+        return f"{self.url_base}/{filename}"
+
+    def filename_for_url(self, url: Optional[str]) -> Optional[str]:
+        """Nombre del blob si ``url`` apunta a este almacén"""
+        for base in {self.url_base, self.url_prefix}:
+            if url and url.startswith(base + "/"):
+                return url[len(base) + 1:]
+        return None
+
+    def _open_temp(self):
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.tmp_dir, prefix="upload-")
+        return os.fdopen(fd, "wb"), path
+
+    @staticmethod
+    def _write_chunk(handle, digest, chunk: bytes) -> None:
+        handle.write(chunk)
+        digest.update(chunk)
+
+    @staticmethod
+    def _close(handle) -> None:
+        handle.flush()
+        os.fsync(handle.fileno())
+        handle.close()
+
+    async def _commit(self, handle, temp_path: str, filename: str, content_type: str) -> bool:
+        """Publica el temporal con su nombre definitivo; False si el contenido ya existía"""
+        await asyncio.to_thread(self._close, handle)
+        try:
+            return await self.blobs.put_file(filename, Path(temp_path), content_type)
+        finally:
+            await asyncio.to_thread(self._remove, temp_path)
+
+    @staticmethod
+    def _remove(temp_path: str) -> None:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    @classmethod
+    def _discard(cls, handle, temp_path: str) -> None:
+        handle.close()
+        cls._remove(temp_path)
+
+    async def save_upload(self, upload) -> StoredFile:
+        handle, temp_path = await asyncio.to_thread(self._open_temp)
+        digest = hashlib.sha256()
+        size = 0
+        detected = None
+        try:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if detected is None:
+                    detected = sniff_image(chunk[:64])
+                    if detected is None or detected[1] not in self.allowed_types:
+                        raise UploadRejected(415, "Tipo de archivo no permitido")
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise UploadRejected(413, f"El archivo supera el máximo de {self.max_bytes // (1024 * 1024)} MB")
+                await asyncio.to_thread(self._write_chunk, handle, digest, chunk)
+            if detected is None:
+                raise UploadRejected(400, "Archivo vacío")
+        except BaseException:
+            await asyncio.to_thread(self._discard, handle, temp_path)
+            raise
+        extension, content_type = detected
+        filename = f"{digest.hexdigest()}.{extension}"
+        created = await self._commit(handle, temp_path, filename, content_type)
+        return StoredFile(digest.hexdigest(), filename, size, content_type, created, self.url_for(filename))
+
+    def _copy_local(self, source: Path):
+        handle, temp_path = self._open_temp()
+        digest = hashlib.sha256()
+        size = 0
+        detected = None
+        try:
+            with open(source, "rb") as reader:
+                while True:
+                    chunk = reader.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if detected is None:
+                        detected = sniff_image(chunk[:64])
+                        if detected is None or detected[1] not in self.allowed_types:
+                            raise UploadRejected(415, f"Tipo de archivo no permitido: {source}")
+                    size += len(chunk)
+                    self._write_chunk(handle, digest, chunk)
+            if detected is None:
+                raise UploadRejected(400, f"Archivo vacío: {source}")
+        except BaseException:
+            self._discard(handle, temp_path)
+            raise
+        return handle, temp_path, digest.hexdigest(), size, detected
+
+    async def import_path(self, source: Path) -> StoredFile:
+        """Copia un archivo local al almacén (CLI, imágenes remotas). Sin límite de tamaño"""
+        handle, temp_path, sha256, size, (extension, content_type) = await asyncio.to_thread(self._copy_local, source)
+        filename = f"{sha256}.{extension}"
+        created = await self._commit(handle, temp_path, filename, content_type)
+        return StoredFile(sha256, filename, size, content_type, created, self.url_for(filename))
+
+
+class UploadSizeLimitMiddleware:
+    """Middleware ASGI: 413 para cuerpos mayores que ``max_bytes`` en las rutas indicadas"""
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = next((v for k, v in scope["headers"] if k == b"content-length"), None)
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            # FastAPI relanza las HTTPException surgidas al leer el cuerpo (las demás serían 400)
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Cuerpo de la petición demasiado grande")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send) -> None:
+        body = b'{"detail":"Cuerpo de la petici\\u00f3n demasiado grande"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
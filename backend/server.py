@@ -1,14 +1,25 @@
+if __name__ == "__main__":
+    # python server.py = python -m farmachelo.launcher: la app se importa como módulo ``server``
+    # y ``__main__`` queda en el lanzador, así los procesos spawn (pool de imágenes) reimportan
+    # el lanzador como ``__mp_main__`` y no este módulo con su cliente Motor, logging y middlewares
+    import runpy
+    runpy.run_module("farmachelo.launcher", run_name="__main__", alter_sys=True)
+
+# Primero: mide cuánto tardan las importaciones de abajo (ver farmachelo/startup.py)
+from farmachelo import startup
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 from bson import ObjectId
-from fastapi import File, UploadFile, Form
+import pymongo
+from pymongo.errors import PyMongoError
+from fastapi import File, UploadFile, Form, Header
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from jose import jwt
 import base64
 import secrets
@@ -17,17 +28,36 @@ import logging
 import uuid
 import hashlib
 import json
-import shutil
+import mimetypes
 import secrets
 from contextlib import asynccontextmanager
+from farmachelo import (
+    admission, blobstore, bootstrap, breaker, cards, compression, database, fieldsets, fraud, indexes, jsonresp, logs, memprof, metrics, profiling, querytrace,
+    images, launcher, prescriptions, stalls, static, uploads,
+)
+from farmachelo.querytrace import query_budget
+import asyncio
+
+startup.phases.mark("imports")
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection (usar valores por defecto si no hay .env)
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'farmachelo_web_database')]
+# MongoDB connection: MONGO_URL + opciones MONGO_* (ver farmachelo/database.py)
+mongo_config = database.MongoConfig.from_env()
+mongo_pool_stats = database.PoolStats()
+# Circuit breaker: falla rápido si MongoDB no responde; el catálogo se sirve del snapshot en disco
+db_breaker = breaker.CircuitBreaker.from_env()
+catalog_snapshot = breaker.CatalogSnapshot.from_env(ROOT_DIR)
+client = mongo_config.client(
+    event_listeners=[
+        *metrics.mongo_event_listeners(), querytrace.QueryTrackingListener(), mongo_pool_stats,
+        *breaker.event_listeners(db_breaker),
+    ]
+)
+db = client[mongo_config.db_name]
+# Clases de operación: carrito w:1, pagos majority, analítica secondaryPreferred
+workloads = database.Workloads(db, database.workloads_from_env())
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'farmachelo-secret-key-2025')
@@ -37,6 +67,44 @@ JWT_EXPIRATION_HOURS = 24
 # Stripe Configuration
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
 
+# Datos iniciales (productos de muestra, admin por defecto): "background" u "off" (manage bootstrap)
+BOOTSTRAP_MODE = os.environ.get('BOOTSTRAP', 'background')
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get('WARMUP_TIMEOUT_SECONDS', 5))
+
+# Fraud scoring (ventanas de velocidad en memoria, sincronizadas con MongoDB)
+fraud_guard = fraud.VelocityGuard.from_env()
+FRAUD_SYNC_SECONDS = float(os.environ.get('FRAUD_SYNC_SECONDS', 5))
+
+# Listados de productos y facturas: se validan por defecto porque también los
+# escriben como dicts manage import-products, el generador sintético y el
+# bootstrap. RESPONSE_VALIDATION=trusted los serializa sin revalidar cuando
+# todos los escritores guardan los tipos del modelo
+TRUST_DB_DOCUMENTS = os.environ.get('RESPONSE_VALIDATION', 'full') == 'trusted'
+
+# Blobs (disco local, GridFS o S3 según BLOB_BACKEND), compartidos entre workers salvo en local
+upload_blobs = blobstore.from_env("uploads", ROOT_DIR, db, public=True)
+prescription_blobs = blobstore.from_env("prescriptions", ROOT_DIR, db)
+# Imágenes subidas: almacén direccionado por contenido (sha256.ext)
+upload_store = uploads.ContentAddressedStore.from_env(ROOT_DIR / "uploads", upload_blobs)
+# Recetas: subidas reanudables por bloques, publicadas en prescription_blobs
+prescription_uploads = prescriptions.ResumableUploads.from_env(db.prescription_uploads, prescription_blobs, ROOT_DIR / "prescriptions")
+# Derivados (miniatura/tarjeta/detalle + WebP) en un pool de procesos
+image_pipeline = images.ImagePipeline(upload_store)
+
+# Vigilante de bloqueos del event loop
+loop_watchdog = stalls.LoopWatchdog.from_env()
+
+# Control de admisión: concurrencia por clase de ruta, plazos (maxTimeMS) y 503 adaptativos
+admission_controller = admission.AdmissionController.from_env()
+
+# Perfiles de CPU bajo demanda (X-Profile)
+profiler = profiling.Profiler.from_env()
+
+# tracemalloc: snapshots y picos de asignación por ruta
+memory_profiler = memprof.MemoryProfiler.from_env()
+if os.environ.get('MEMORY_TRACING', 'off') == 'on':
+    memory_profiler.start(int(os.environ.get('MEMORY_TRACING_FRAMES', 1)))
+
 # Security - Modificamos HTTPBearer para excluir OPTIONS
 class OptionalHTTPBearer(HTTPBearer):
     async def __call__(self, request: Request):
@@ -77,6 +145,9 @@ class Product(BaseModel):
     category: Optional[str] = None  # Ahora opcional
     stock: int
     image_url: Optional[str] = None
+    # Variantes redimensionadas y srcset por formato (ver farmachelo.images)
+    image_variants: Optional[Dict[str, Dict[str, Any]]] = None
+    image_srcset: Optional[Dict[str, str]] = None
     requires_prescription: bool = False
     active: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -176,39 +247,14 @@ class CardValidationResponse(BaseModel):
 
 def validate_card_number(card_number: str) -> bool:
     """Validar número de tarjeta usando el algoritmo de Luhn"""
-    card_number = card_number.replace(" ", "")
+    card_number = cards.normalize_card_number(card_number)
     if not card_number.isdigit():
         return False
-    
-    # Algoritmo de Luhn
-    total = 0
-    reverse_digits = card_number[::-1]
-    for i, digit in enumerate(reverse_digits):
-        n = int(digit)
-        if i % 2 == 1:
-            n *= 2
-            if n > 9:
-                n -= 9
-        total += n
-    
-    return total % 10 == 0
+    return cards.luhn_valid(card_number)
 
 def get_card_type(card_number: str) -> str:
-    """Determinar el tipo de tarjeta basado en el número"""
-    card_number = card_number.replace(" ", "")
-    
-    if card_number.startswith("4"):
-        return "Visa"
-    elif card_number.startswith(("51", "52", "53", "54", "55")):
-        return "Mastercard"
-    elif card_number.startswith(("34", "37")):
-        return "Amex"
-    elif card_number.startswith(("300", "301", "302", "303", "304", "305", "36", "38")):
-        return "Diners Club"
-    elif card_number.startswith(("6011", "65")):
-        return "Discover"
-    else:
-        return "Unknown"
+    """Determinar el tipo de tarjeta según la tabla de rangos IIN"""
+    return cards.get_card_type(card_number)
 
 def validate_expiry_date(expiry_date: str) -> bool:
     """Validar fecha de expiración MM/AA"""
@@ -235,6 +281,13 @@ def validate_expiry_date(expiry_date: str) -> bool:
 
 # ==================== HELPER / AUTH FUNCTIONS ====================
 
+# Proyecciones mínimas de los helpers internos (no traer documentos completos)
+PRODUCT_CART_PROJECTION = {"_id": 0, "name": 1, "price": 1, "image_url": 1, "requires_prescription": 1}
+PRODUCT_LINE_PROJECTION = {"_id": 0, "name": 1, "description": 1, "price": 1, "requires_prescription": 1}
+USER_CONTACT_PROJECTION = {"_id": 0, "id": 1, "name": 1, "email": 1, "phone": 1, "address": 1, "identification": 1}
+USER_ROLE_PROJECTION = {"_id": 0, "is_admin": 1}
+EXISTS_PROJECTION = {"_id": 1}
+
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
@@ -344,9 +397,28 @@ async def validate_card(card_request: CardValidationRequest):
 @api_router.post("/payments/process", response_model=PaymentResponse)
 async def process_payment(
     payment_request: PaymentRequest,
+    request: Request,
     current_user_id: str = Depends(get_current_user)
 ):
     try:
+        # Puntaje de fraude por velocidad (en memoria, antes de cualquier escritura)
+        card_last_four = payment_request.card.cardNumber[-4:]
+        card_type = get_card_type(payment_request.card.cardNumber)
+        risk_keys = {
+            "email": payment_request.email.lower(),
+            "card": f"{card_type}:{card_last_four}",
+            "ip": request.client.host if request.client else None,
+        }
+        try:
+            # Claves que este worker no ha visto: totales de los demás workers
+            await fraud_guard.load(db, **risk_keys)
+        except PyMongoError as e:
+            logger.warning(f"Fraud velocity lookup failed, scoring with local counters: {e.__class__.__name__}")
+        risk = fraud_guard.assess(amount=payment_request.amount, **risk_keys)
+        if risk.action == fraud.REJECT:
+            logger.warning(f"Payment rejected by fraud scoring for user {current_user_id}: score={risk.score} reasons={risk.reasons}")
+            return PaymentResponse(success=False, error="Pago rechazado por controles de riesgo")
+        
         # Validar que el monto coincida con el carrito actual
         cart = await _get_or_create_cart(current_user_id)
         enriched_cart = await _enrich_cart(cart)
@@ -376,7 +448,7 @@ async def process_payment(
             order_id = payment_request.order_id or f"ORD_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
             
             # Crear orden si no existe
-            existing_order = await db.orders.find_one({"id": order_id})
+            existing_order = await workloads.payment.orders.find_one({"id": order_id}, EXISTS_PROJECTION)
             if not existing_order:
                 order_data = {
                     "id": order_id,
@@ -387,10 +459,10 @@ async def process_payment(
                     "payment_session_id": transaction_id,
                     "created_at": datetime.now(timezone.utc)
                 }
-                await db.orders.insert_one(order_data)
+                await workloads.payment.orders.insert_one(order_data)
             else:
                 # Actualizar orden existente
-                await db.orders.update_one(
+                await workloads.payment.orders.update_one(
                     {"id": order_id},
                     {"$set": {
                         "status": "paid", 
@@ -407,14 +479,17 @@ async def process_payment(
                 "user_id": current_user_id,
                 "amount": payment_request.amount,
                 "currency": payment_request.currency,
-                "card_last_four": payment_request.card.cardNumber[-4:],
-                "card_type": get_card_type(payment_request.card.cardNumber),
+                "card_last_four": card_last_four,
+                "card_type": card_type,
                 "status": "completed",
                 "order_id": order_id,
+                "risk_score": risk.score,
+                "risk_flagged": risk.action == fraud.FLAG,
+                "risk_reasons": risk.reasons,
                 "created_at": datetime.now(timezone.utc)
             }
             
-            await db.payment_transactions.insert_one(transaction_data)
+            await workloads.payment.payment_transactions.insert_one(transaction_data)
             
             # 3. CREAR FACTURA AUTOMÁTICAMENTE después del pago exitoso
             try:
@@ -492,24 +567,24 @@ async def create_invoice_after_payment(order_id: str, payment_transaction_id: st
         
     try:
         # Verificar que la orden existe
-        order = await db.orders.find_one({"id": order_id, "user_id": user_id})
+        order = await workloads.payment.orders.find_one({"id": order_id, "user_id": user_id})
         if not order:
             raise Exception("Orden no encontrada")
         
         # Obtener información del usuario
-        user = await db.users.find_one({"id": user_id})
+        user = await db.users.find_one({"id": user_id}, USER_CONTACT_PROJECTION)
         if not user:
             raise Exception("Usuario no encontrado")
         
         # Generar número de factura SIMPLE (1, 2, 3, 4...)
         # Contar cuántos pedidos pagados existen
-        paid_orders_count = await db.orders.count_documents({"status": {"$in": ["paid", "processing", "shipped", "delivered"]}})
+        paid_orders_count = await workloads.payment.orders.count_documents({"status": {"$in": ["paid", "processing", "shipped", "delivered"]}})
         invoice_number = f"{paid_orders_count + 1:05d}"  # Número simple: "00001", "00002"...
         
         # Enriquecer items de la orden
         enriched_items = []
         for item in order.get("items", []):
-            product = await db.products.find_one({"id": item["product_id"]})
+            product = await db.products.find_one({"id": item["product_id"]}, PRODUCT_LINE_PROJECTION)
             if product:
                 item_total = product["price"] * item["quantity"]
                 enriched_items.append({
@@ -555,7 +630,7 @@ async def create_invoice_after_payment(order_id: str, payment_transaction_id: st
         
         # ACTUALIZAR LA ORDEN con los datos de facturación
         now = datetime.now(timezone.utc)
-        update_result = await db.orders.update_one(
+        update_result = await workloads.payment.orders.update_one(
             {"id": order_id},
             {"$set": {
                 "status": "paid",
@@ -579,7 +654,7 @@ async def create_invoice_after_payment(order_id: str, payment_transaction_id: st
             raise Exception("No se pudo actualizar la orden con los datos de facturación")
         
         # Limpiar carrito después de pago exitoso
-        await db.carts.update_one(
+        await workloads.cart.carts.update_one(
             {"user_id": user_id},
             {"$set": {"items": [], "updated_at": datetime.now(timezone.utc)}}
         )
@@ -594,65 +669,79 @@ async def create_invoice_after_payment(order_id: str, payment_transaction_id: st
         logger.error(f"Error creating invoice after payment: {str(e)}")
         return {"success": False, "error": str(e)}
 
-# ==================== PRODUCTS DATA ====================
-
-PHARMACY_PRODUCTS = [
-    {
-        "name": "Paracetamol 500mg",
-        "description": "Analgésico y antipirético para alivio del dolor y fiebre",
-        "price": 8500,
-        "category": "over_counter",
-        "stock": 100,
-        "image_url": "https://images.unsplash.com/photo-1631549916768-4119b2e5f926?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NDQ2Mzl8MHwxfHNlYXJjaHw0fHxwaGFybWFjeXxlbnwwfHx8fDE3NTYyNTEyMjd8MA&ixlib=rb-4.1.0&q=85",
-        "requires_prescription": False
-    },
-    {
-        "name": "Ibuprofeno 400mg",
-        "description": "Antiinflamatorio no esteroideo para dolor e inflamación",
-        "price": 12000,
-        "category": "over_counter",
-        "stock": 85,
-        "image_url": "https://images.pexels.com/photos/139398/thermometer-headache-pain-pills-139398.jpeg",
-        "requires_prescription": False
-    },
-]
-
 # ==================== LIFESPAN HANDLER ====================
 
+async def startup_once():
+    """Arranque que debe ejecutarse una sola vez por despliegue, no por worker"""
+    logger.info("Initializing database...")
+    try:
+        # Acotado: con MongoDB caído se arranca igual (modo degradado) y los índices quedan para el próximo arranque
+        with pymongo.timeout(WARMUP_TIMEOUT_SECONDS):
+            await indexes.ensure_indexes(db)
+            await fraud_guard.ensure_indexes(db)
+    except PyMongoError as e:
+        logger.error(f"Skipping index creation, MongoDB unavailable ({e.__class__.__name__}); run 'manage ensure-indexes' later")
+    removed_partials = await asyncio.to_thread(prescription_uploads.prune)
+    if removed_partials:
+        logger.info(f"Removed {removed_partials} abandoned prescription uploads")
+
+async def warm_up():
+    """Precalienta conexiones y cachés en segundo plano; /ready se abre al terminar"""
+    try:
+        with startup.phases.phase("warmup"):
+            await asyncio.to_thread(catalog_snapshot.load)
+            try:
+                with pymongo.timeout(WARMUP_TIMEOUT_SECONDS):
+                    await client.admin.command("ping")
+                    await catalog_snapshot.refresh_if_stale(db.products, jsonresp.model_projection(Product))
+            except PyMongoError as e:
+                logger.warning(f"Warm-up finished without MongoDB: {e.__class__.__name__}")
+            # Serializador del catálogo construido antes de la primera petición
+            jsonresp.list_adapter(Product)
+    except Exception as e:
+        logger.error(f"Error during warm-up: {str(e)}")
+    startup.phases.open_gate()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    logger.info("Initializing database...")
-    
-    # Initialize database with sample products
-    existing_products = await db.products.count_documents({})
-    if existing_products == 0:
-        logger.info("Initializing database with sample products...")
-        for product_data in PHARMACY_PRODUCTS:
-            product = Product(**product_data)
-            await db.products.insert_one(product.dict())
-        logger.info("Sample products added successfully!")
-    
-    # Crear administrador por defecto si no existe
-    admin_email = "admin@farmachelo.com"
-    existing_admin = await db.admin_users.find_one({"email": admin_email})
-    if not existing_admin:
-        logger.info("Creating default admin user...")
-        admin_data = {
-            "email": admin_email,
-            "password": hash_password("admin123"),
-            "name": "Administrador Principal",
-            "is_admin": True,
-            "id": str(uuid.uuid4()),
-            "created_at": datetime.now(timezone.utc)
-        }
-        await db.admin_users.insert_one(admin_data)
-        logger.info("Default admin user created! Email: admin@farmachelo.com, Password: admin123")
+    # Startup (con el lanzador multi-worker, startup_once ya corrió en el maestro)
+    with startup.phases.phase("lifespan"):
+        if not launcher.startup_done():
+            await startup_once()
+        warmup_task = asyncio.create_task(warm_up())
+        # Datos iniciales una vez por despliegue: solo el primer worker (o el proceso único sin lanzador)
+        bootstrap_task = (
+            asyncio.create_task(bootstrap.run_in_background(db, db_breaker))
+            if BOOTSTRAP_MODE == "background" and launcher.worker_id() in (None, 0) else None
+        )
+        breaker_task = asyncio.create_task(db_breaker.run(client))
+        snapshot_task = asyncio.create_task(
+            catalog_snapshot.run(db.products, jsonresp.model_projection(Product), db_breaker)
+        )
+        fraud_sync_task = asyncio.create_task(fraud_guard.run_sync_loop(db, FRAUD_SYNC_SECONDS))
+        loop_lag_task = asyncio.create_task(metrics.monitor_event_loop_lag())
+        watchdog_task = asyncio.create_task(loop_watchdog.run()) if loop_watchdog.enabled else None
     
     yield
     
     # Shutdown
     logger.info("Shutting down...")
+    warmup_task.cancel()
+    if bootstrap_task is not None:
+        bootstrap_task.cancel()
+    breaker_task.cancel()
+    snapshot_task.cancel()
+    fraud_sync_task.cancel()
+    loop_lag_task.cancel()
+    if watchdog_task is not None:
+        watchdog_task.cancel()
+    image_pipeline.shutdown()
+    await upload_blobs.close()
+    await prescription_blobs.close()
+    try:
+        await fraud_guard.sync(db)
+    except Exception as e:
+        logger.error(f"Error flushing fraud velocity counters: {str(e)}")
     client.close()
 
 # FastAPI app with lifespan
@@ -662,6 +751,15 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Límite de tamaño de subidas antes de procesar el multipart (dentro de CORS para que el 413 lleve sus encabezados)
+app.add_middleware(uploads.UploadSizeLimitMiddleware, paths=["/api/admin/upload-image"], max_bytes=upload_store.max_bytes)
+
+# Admisión por clase de ruta (dentro de CORS para que los 503 lleven sus encabezados)
+app.add_middleware(admission.AdmissionMiddleware, controller=admission_controller)
+
+# Circuit breaker de MongoDB: 503 inmediato con Retry-After mientras está abierto (fuera de la admisión)
+app.add_middleware(breaker.BreakerMiddleware, breaker=db_breaker)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -669,14 +767,74 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Upload-Offset", "Upload-Length"],
 )
 
-# Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Compresión gzip/br/zstd con ETag y caché de cuerpos comprimidos
+app.add_middleware(compression.CompressionMiddleware)
+
+# Tarea -> petición, para atribuir los bloqueos del event loop a una ruta
+app.add_middleware(stalls.StallAttributionMiddleware, watchdog=loop_watchdog)
+
+# Consultas por petición (Server-Timing, N+1 y presupuestos declarados con @query_budget)
+app.add_middleware(querytrace.QueryAccountingMiddleware)
+
+async def authorize_profiling(scope) -> bool:
+    """Solo administradores pueden pedir un perfil con X-Profile"""
+    authorization = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"authorization"), "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        await get_current_admin(HTTPAuthorizationCredentials(scheme=scheme, credentials=token))
+        return True
+    except HTTPException:
+        return False
+
+# Pico de memoria por petición (solo mientras tracemalloc está activo)
+app.add_middleware(memprof.AllocationTrackingMiddleware, profiler=memory_profiler)
+
+# Perfilado por petición con X-Profile (fuera de la contabilidad de consultas para no contar la autorización)
+app.add_middleware(profiling.ProfilingMiddleware, profiler=profiler, authorize=authorize_profiling)
+
+# Métricas Prometheus por ruta
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: el proceso responde (sin consultar MongoDB); incluye el estado del breaker"""
+    return jsonresp.FastJSONResponse({
+        "status": "degraded" if db_breaker.is_open else "ok",
+        "worker": launcher.worker_id(),
+        "startup": startup.phases.snapshot(),
+        "database": db_breaker.snapshot(),
+        "catalog_snapshot": catalog_snapshot.status(),
+    })
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness: tras el precalentamiento, con MongoDB disponible o, en modo degradado, con snapshot del catálogo"""
+    is_ready = startup.phases.ready and (not db_breaker.is_open or catalog_snapshot.available)
+    if not startup.phases.ready:
+        status_name = "starting"
+    else:
+        status_name = "ready" if not db_breaker.is_open else ("degraded" if is_ready else "unavailable")
+    return jsonresp.FastJSONResponse(
+        {"status": status_name, "database": db_breaker.snapshot(), "catalog_snapshot": catalog_snapshot.status()},
+        status_code=200 if is_ready else 503,
+    )
+
+# Request id en el contexto de logging (middleware más externo)
+app.add_middleware(logs.RequestIdMiddleware)
+
+# Logging (cola + hilo escritor, JSON, muestreo por logger vía LOG_SAMPLING)
+logs.setup_logging(logging.INFO)
 logger = logging.getLogger(__name__)
+cart_logger = logging.getLogger(f"{__name__}.cart")
 
 # ==================== ROUTES ====================
 
@@ -724,25 +882,25 @@ async def create_invoice(
     """
     try:
         # Verificar que la orden existe y pertenece al usuario
-        order = await db.orders.find_one({"id": invoice_data.order_id, "user_id": current_user_id})
+        order = await workloads.payment.orders.find_one({"id": invoice_data.order_id, "user_id": current_user_id})
         if not order:
             raise HTTPException(status_code=404, detail="Orden no encontrada")
         
         # Verificar transacción de pago
-        payment_transaction = await db.payment_transactions.find_one({
+        payment_transaction = await workloads.payment.payment_transactions.find_one({
             "transaction_id": invoice_data.payment_transaction_id
         })
         if not payment_transaction:
             raise HTTPException(status_code=404, detail="Transacción de pago no encontrada")
         
         # Obtener información del usuario
-        user = await db.users.find_one({"id": current_user_id})
+        user = await db.users.find_one({"id": current_user_id}, USER_CONTACT_PROJECTION)
         if not user:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         # Generar número de factura único
         today = datetime.now(timezone.utc)
-        invoice_count = await db.invoices.count_documents({
+        invoice_count = await workloads.payment.invoices.count_documents({
             "issue_date": {"$gte": today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)}
         })
         invoice_number = f"FAC-{today.strftime('%Y%m')}-{invoice_count + 1:04d}"
@@ -750,7 +908,7 @@ async def create_invoice(
         # Enriquecer items de la orden
         enriched_items = []
         for item in order.get("items", []):
-            product = await db.products.find_one({"id": item["product_id"]})
+            product = await db.products.find_one({"id": item["product_id"]}, PRODUCT_LINE_PROJECTION)
             if product:
                 item_total = product["price"] * item["quantity"]
                 enriched_items.append({
@@ -795,10 +953,10 @@ async def create_invoice(
         )
         
         # Guardar en base de datos
-        await db.invoices.insert_one(invoice.dict())
+        await workloads.payment.invoices.insert_one(invoice.dict())
         
         # Actualizar orden con referencia a la factura
-        await db.orders.update_one(
+        await workloads.payment.orders.update_one(
             {"id": invoice_data.order_id},
             {"$set": {"invoice_id": invoice.id, "status": "completed"}}
         )
@@ -830,7 +988,7 @@ async def get_invoice(
         # Verificar que el usuario es el propietario o es admin
         if invoice_data["user_id"] != current_user_id:
             # Verificar si es admin
-            user_data = await db.users.find_one({"id": current_user_id})
+            user_data = await db.users.find_one({"id": current_user_id}, USER_ROLE_PROJECTION)
             if not user_data or not user_data.get("is_admin", False):
                 raise HTTPException(status_code=403, detail="No autorizado para ver esta factura")
         
@@ -838,7 +996,7 @@ async def get_invoice(
         
         # Obtener información adicional
         order = await db.orders.find_one({"id": invoice.order_id})
-        customer = await db.users.find_one({"id": invoice.user_id})
+        customer = await db.users.find_one({"id": invoice.user_id}, USER_CONTACT_PROJECTION)
         
         customer_info = None
         if customer:
@@ -860,13 +1018,19 @@ async def get_invoice(
         raise HTTPException(status_code=500, detail="Error al obtener factura")
 
 @api_router.get("/invoices")
-async def get_user_invoices(current_user_id: str = Depends(get_current_user)):
+@query_budget(1)
+async def get_user_invoices(
+    current_user_id: str = Depends(get_current_user),
+    fieldset: fieldsets.FieldSet = Depends(fieldsets.sparse_fields(Invoice))
+):
     """
     Obtener todas las facturas del usuario
     """
     try:
-        invoices = await db.invoices.find({"user_id": current_user_id}).sort("issue_date", -1).to_list(50)
-        return [Invoice(**invoice) for invoice in invoices]
+        invoices = await db.invoices.find(
+            {"user_id": current_user_id}, fieldset.projection() or jsonresp.model_projection(Invoice)
+        ).sort("issue_date", -1).to_list(50)
+        return jsonresp.list_response(Invoice, invoices, trusted=TRUST_DB_DOCUMENTS, fields=fieldset.names)
         
     except Exception as e:
         logger.error(f"Error getting user invoices: {str(e)}")
@@ -875,11 +1039,13 @@ async def get_user_invoices(current_user_id: str = Depends(get_current_user)):
 # ==================== ADMIN INVOICE ROUTES ====================
 
 @api_router.get("/admin/invoices", response_model=List[Invoice])
+@query_budget(3)
 async def get_all_invoices(
     skip: int = 0,
     limit: int = 50,
     status: Optional[str] = None,
-    current_admin: dict = Depends(get_current_admin)
+    current_admin: dict = Depends(get_current_admin),
+    fieldset: fieldsets.FieldSet = Depends(fieldsets.sparse_fields(Invoice))
 ):
     """
     Obtener todas las facturas (solo administradores)
@@ -889,31 +1055,34 @@ async def get_all_invoices(
         if status:
             query["status"] = status
             
-        invoices = await db.invoices.find(query).sort("issue_date", -1).skip(skip).limit(limit).to_list(limit)
-        return [Invoice(**invoice) for invoice in invoices]
+        invoices = await db.invoices.find(
+            query, fieldset.projection() or jsonresp.model_projection(Invoice)
+        ).sort("issue_date", -1).skip(skip).limit(limit).to_list(limit)
+        return jsonresp.list_response(Invoice, invoices, trusted=TRUST_DB_DOCUMENTS, fields=fieldset.names)
         
     except Exception as e:
         logger.error(f"Error getting all invoices: {str(e)}")
         raise HTTPException(status_code=500, detail="Error al obtener facturas")
 
 @api_router.get("/admin/invoices/stats")
+@query_budget(6)
 async def get_invoice_stats(current_admin: dict = Depends(get_current_admin)):
     """
     Obtener estadísticas de facturación (solo administradores)
     """
     try:
         # Total facturas
-        total_invoices = await db.invoices.count_documents({})
+        total_invoices = await workloads.analytics.invoices.count_documents({})
         
         # Facturas por mes actual
         start_of_month = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_invoices = await db.invoices.count_documents({"issue_date": {"$gte": start_of_month}})
+        monthly_invoices = await workloads.analytics.invoices.count_documents({"issue_date": {"$gte": start_of_month}})
         
         # Ingresos totales
         pipeline = [
             {"$group": {"_id": None, "total_revenue": {"$sum": "$total_amount"}}}
         ]
-        revenue_result = await db.invoices.aggregate(pipeline).to_list(1)
+        revenue_result = await workloads.analytics.invoices.aggregate(pipeline).to_list(1)
         total_revenue = revenue_result[0]["total_revenue"] if revenue_result else 0
         
         # Ingresos del mes
@@ -921,7 +1090,7 @@ async def get_invoice_stats(current_admin: dict = Depends(get_current_admin)):
             {"$match": {"issue_date": {"$gte": start_of_month}}},
             {"$group": {"_id": None, "monthly_revenue": {"$sum": "$total_amount"}}}
         ]
-        monthly_revenue_result = await db.invoices.aggregate(monthly_pipeline).to_list(1)
+        monthly_revenue_result = await workloads.analytics.invoices.aggregate(monthly_pipeline).to_list(1)
         monthly_revenue = monthly_revenue_result[0]["monthly_revenue"] if monthly_revenue_result else 0
         
         return {
@@ -941,6 +1110,7 @@ async def root():
 
 # Authentication Routes
 @api_router.post("/auth/register")
+@query_budget(2)
 async def register(user_data: UserCreate):
     # Check if user exists
     existing_user = await db.users.find_one({"email": user_data.email})
@@ -960,6 +1130,7 @@ async def register(user_data: UserCreate):
     return {"user": user, "token": token}
 
 @api_router.post("/auth/login")
+@query_budget(2)
 async def login(login_data: UserLogin):
     # Buscar usuario normal
     user_data = await db.users.find_one({"email": login_data.email})
@@ -985,6 +1156,7 @@ async def login(login_data: UserLogin):
     raise HTTPException(status_code=401, detail="Invalid email or password")
 
 @api_router.get("/auth/me", response_model=User)
+@query_budget(2)
 async def get_current_user_info(current_user_id: str = Depends(get_current_user)):
     user_data = await db.users.find_one({"id": current_user_id})
     if user_data:
@@ -1004,30 +1176,76 @@ async def get_current_user_info(current_user_id: str = Depends(get_current_user)
     raise HTTPException(status_code=404, detail="User not found")
 
 # Products Routes
+def _snapshot_or_unavailable() -> None:
+    """Sin snapshot en disco no hay modo degradado: 503 con el mismo Retry-After que el breaker"""
+    if not catalog_snapshot.available:
+        raise HTTPException(
+            status_code=503,
+            detail="Catálogo no disponible temporalmente",
+            headers={"Retry-After": str(db_breaker.retry_after())},
+        )
+
+def _from_snapshot(response: Response) -> Response:
+    """Marca una respuesta del catálogo servida desde el snapshot (modo degradado)"""
+    breaker.snapshot_served_total.inc()
+    response.headers["X-Catalog-Snapshot"] = catalog_snapshot.taken_at
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
 @api_router.get("/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None, search: Optional[str] = None):
+@query_budget(1)
+async def get_products(
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    fieldset: fieldsets.FieldSet = Depends(fieldsets.sparse_fields(Product))
+):
     query = {"active": True}
     if category:
         query["category"] = category
     if search:
         query["name"] = {"$regex": search, "$options": "i"}
     
-    products = await db.products.find(query).to_list(100)
-    return [Product(**product) for product in products]
+    if not db_breaker.is_open:
+        try:
+            products = await db.products.find(query, fieldset.projection() or jsonresp.model_projection(Product)).to_list(100)
+            return jsonresp.list_response(Product, products, trusted=TRUST_DB_DOCUMENTS, fields=fieldset.names)
+        except PyMongoError as e:
+            if not breaker.is_unavailable(e):
+                raise
+    _snapshot_or_unavailable()
+    return _from_snapshot(jsonresp.list_response(
+        Product, catalog_snapshot.search(category, search), trusted=True, fields=fieldset.names
+    ))
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product_data = await db.products.find_one({"id": product_id, "active": True})
+@query_budget(1)
+async def get_product(
+    product_id: str,
+    fieldset: fieldsets.FieldSet = Depends(fieldsets.sparse_fields(Product))
+):
+    if not db_breaker.is_open:
+        try:
+            product_data = await db.products.find_one(
+                {"id": product_id, "active": True}, fieldset.projection() or jsonresp.model_projection(Product)
+            )
+            if not product_data:
+                raise HTTPException(status_code=404, detail="Product not found")
+            return jsonresp.model_response(Product, product_data, trusted=TRUST_DB_DOCUMENTS, fields=fieldset.names)
+        except PyMongoError as e:
+            if not breaker.is_unavailable(e):
+                raise
+    _snapshot_or_unavailable()
+    product_data = catalog_snapshot.get(product_id)
     if not product_data:
         raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**product_data)
+    return _from_snapshot(jsonresp.model_response(Product, product_data, trusted=True, fields=fieldset.names))
 
 # Cart helpers
 async def _get_or_create_cart(user_id: str) -> Cart:
-    cart_data = await db.carts.find_one({"user_id": user_id})
+    cart_data = await workloads.cart.carts.find_one({"user_id": user_id})
     if not cart_data:
         cart = Cart(user_id=user_id)
-        await db.carts.insert_one(cart.dict())
+        await workloads.cart.carts.insert_one(cart.dict())
         return cart
     return Cart(**cart_data)
 
@@ -1035,7 +1253,7 @@ async def _enrich_cart(cart: Cart) -> Dict[str, Any]:
     # Adjuntar datos de producto a cada item
     enriched_items: List[Dict[str, Any]] = []
     for item in cart.items:
-        product = await db.products.find_one({"id": item.product_id})
+        product = await db.products.find_one({"id": item.product_id}, PRODUCT_CART_PROJECTION)
         if product:
             enriched_items.append({
                 "product_id": item.product_id,
@@ -1062,32 +1280,32 @@ async def get_cart(current_user_id: str = Depends(get_current_user)):
 
 @api_router.post("/cart/items")
 async def add_cart_item(cart_item: CartItem, current_user_id: str = Depends(get_current_user)):
-    logger.info(f"Adding item to cart for user {current_user_id}: {cart_item}")
+    cart_logger.info("Adding item to cart for user %s: %s x%s", current_user_id, cart_item.product_id, cart_item.quantity)
     # Verificar producto
-    product = await db.products.find_one({"id": cart_item.product_id, "active": True})
+    product = await db.products.find_one({"id": cart_item.product_id, "active": True}, EXISTS_PROJECTION)
     if not product:
-        logger.error(f"Product not found: {cart_item.product_id}")
+        cart_logger.error("Product not found: %s", cart_item.product_id)
         raise HTTPException(status_code=404, detail="Product not found")
 
     cart = await _get_or_create_cart(current_user_id)
-    logger.info(f"Cart found/created: {cart.id}")
+    cart_logger.info("Cart found/created: %s", cart.id)
     # Buscar item existente
     index = next((i for i, it in enumerate(cart.items) if it.product_id == cart_item.product_id), None)
     if index is not None:
         cart.items[index].quantity += max(1, cart_item.quantity)
-        logger.info(f"Updated quantity for product {cart_item.product_id} to {cart.items[index].quantity}")
+        cart_logger.info("Updated quantity for product %s to %s", cart_item.product_id, cart.items[index].quantity)
     else:
         if cart_item.quantity <= 0:
             cart_item.quantity = 1
         cart.items.append(cart_item)
-        logger.info(f"Added new product {cart_item.product_id} to cart")
+        cart_logger.info("Added new product %s to cart", cart_item.product_id)
     cart.updated_at = datetime.now(timezone.utc)
     
-    update_result = await db.carts.update_one({"user_id": current_user_id}, {"$set": cart.dict()}, upsert=True)
-    logger.info(f"Cart update result: matched={update_result.matched_count}, modified={update_result.modified_count}, upserted_id={update_result.upserted_id}")
+    update_result = await workloads.cart.carts.update_one({"user_id": current_user_id}, {"$set": cart.dict()}, upsert=True)
+    cart_logger.info("Cart update result: matched=%s, modified=%s, upserted_id=%s", update_result.matched_count, update_result.modified_count, update_result.upserted_id)
 
     enriched_cart = await _enrich_cart(cart)
-    logger.info("Cart enriched successfully")
+    cart_logger.info("Cart enriched successfully")
     return enriched_cart
 
 @api_router.put("/cart/items/{product_id}")
@@ -1104,7 +1322,7 @@ async def update_cart_item(product_id: str, payload: Dict[str, int], current_use
     else:
         cart.items[index].quantity = quantity
     cart.updated_at = datetime.now(timezone.utc)
-    await db.carts.update_one({"user_id": current_user_id}, {"$set": cart.dict()})
+    await workloads.cart.carts.update_one({"user_id": current_user_id}, {"$set": cart.dict()})
     return await _enrich_cart(cart)
 
 @api_router.delete("/cart/items/{product_id}")
@@ -1116,9 +1334,107 @@ async def delete_cart_item(product_id: str, current_user_id: str = Depends(get_c
         # No existe el item, pero devolvemos el carrito igualmente
         return await _enrich_cart(cart)
     cart.updated_at = datetime.now(timezone.utc)
-    await db.carts.update_one({"user_id": current_user_id}, {"$set": cart.dict()})
+    await workloads.cart.carts.update_one({"user_id": current_user_id}, {"$set": cart.dict()})
     return await _enrich_cart(cart)
 
+# ==================== PRESCRIPTION UPLOAD ROUTES ====================
+
+class PrescriptionUploadCreate(BaseModel):
+    product_id: str
+    filename: str
+    size: int
+
+def _upload_error(e: uploads.UploadRejected) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail)
+
+async def _prescription_cart_item(user_id: str, product_id: str) -> None:
+    """El producto debe requerir receta y estar en el carrito del usuario"""
+    product = await db.products.find_one({"id": product_id}, {"_id": 0, "requires_prescription": 1})
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if not product.get("requires_prescription", False):
+        raise HTTPException(status_code=400, detail="Este producto no requiere receta")
+    if not await workloads.cart.carts.count_documents({"user_id": user_id, "items.product_id": product_id}, limit=1):
+        raise HTTPException(status_code=404, detail="Item not found in cart")
+
+@api_router.post("/prescriptions/uploads", status_code=201)
+async def create_prescription_upload(payload: PrescriptionUploadCreate, current_user_id: str = Depends(get_current_user)):
+    await _prescription_cart_item(current_user_id, payload.product_id)
+    try:
+        session = await prescription_uploads.create(current_user_id, payload.product_id, payload.filename, payload.size)
+    except uploads.UploadRejected as e:
+        raise _upload_error(e)
+    return prescriptions.public_view(session)
+
+@api_router.get("/prescriptions/uploads/{upload_id}")
+async def get_prescription_upload(upload_id: str, current_user_id: str = Depends(get_current_user)):
+    try:
+        session = await prescription_uploads.get(upload_id, current_user_id)
+    except uploads.UploadRejected as e:
+        raise _upload_error(e)
+    return prescriptions.public_view(session)
+
+@api_router.head("/prescriptions/uploads/{upload_id}")
+async def head_prescription_upload(upload_id: str, current_user_id: str = Depends(get_current_user)):
+    try:
+        session = await prescription_uploads.get(upload_id, current_user_id)
+    except uploads.UploadRejected as e:
+        raise _upload_error(e)
+    return Response(status_code=200, headers={
+        "Upload-Offset": str(prescriptions.received_offset(session)),
+        "Upload-Length": str(session["size"]),
+        "Cache-Control": "no-store",
+    })
+
+@api_router.patch("/prescriptions/uploads/{upload_id}", status_code=204)
+async def upload_prescription_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    upload_checksum: str = Header(..., alias="Upload-Checksum"),
+    current_user_id: str = Depends(get_current_user),
+):
+    # Bloques en cualquier orden/paralelo; cada uno se escribe en su posición final
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type debe ser application/offset+octet-stream")
+    try:
+        checksum = prescriptions.parse_checksum(upload_checksum)
+        session = await prescription_uploads.get(upload_id, current_user_id)
+        session = await prescription_uploads.write_chunk(session, upload_offset, request.stream(), checksum)
+    except uploads.UploadRejected as e:
+        raise _upload_error(e)
+    return Response(status_code=204, headers={"Upload-Offset": str(prescriptions.received_offset(session))})
+
+@api_router.post("/prescriptions/uploads/{upload_id}/complete")
+async def complete_prescription_upload(upload_id: str, current_user_id: str = Depends(get_current_user)):
+    try:
+        session = await prescription_uploads.get(upload_id, current_user_id)
+        await _prescription_cart_item(current_user_id, session["product_id"])
+        session = await prescription_uploads.complete(session)
+    except uploads.UploadRejected as e:
+        raise _upload_error(e)
+
+    # Asociar la receta al ítem del carrito
+    await workloads.cart.carts.update_one(
+        {"user_id": current_user_id, "items.product_id": session["product_id"]},
+        {"$set": {"items.$.prescription_file": session["blob_key"], "updated_at": datetime.now(timezone.utc)}},
+    )
+    logger.info(f"Prescription {session['blob_key']} attached to cart item {session['product_id']} for user {current_user_id}")
+    cart = await _get_or_create_cart(current_user_id)
+    return {"upload": prescriptions.public_view(session), "cart": await _enrich_cart(cart)}
+
+@api_router.get("/admin/prescriptions/{key}")
+async def get_prescription_file(key: str, current_admin: dict = Depends(get_current_admin)):
+    # Las recetas no se publican en /uploads: solo el personal las descarga
+    info = await prescription_blobs.stat(key) if static.safe_name(key) else None
+    if info is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return StreamingResponse(
+        prescription_blobs.read(key),
+        media_type=info.content_type or mimetypes.guess_type(key)[0] or "application/octet-stream",
+        headers={"Content-Length": str(info.size), "Cache-Control": "private, no-store"},
+    )
+
 # Payment Routes
 @api_router.post("/payments/checkout")
 async def create_checkout_session(
@@ -1131,9 +1447,14 @@ async def create_checkout_session(
 
 # Orders Routes
 @api_router.get("/orders", response_model=List[Order])
-async def get_user_orders(current_user_id: str = Depends(get_current_user)):
-    orders = await db.orders.find({"user_id": current_user_id}).sort("created_at", -1).to_list(50)
-    return [Order(**order) for order in orders]
+@query_budget(1)
+async def get_user_orders(
+    current_user_id: str = Depends(get_current_user),
+    fieldset: fieldsets.FieldSet = Depends(fieldsets.sparse_fields(Order))
+):
+    orders = await db.orders.find({"user_id": current_user_id}, fieldset.projection()).sort("created_at", -1).to_list(50)
+    # Las órdenes se insertan como dicts en process_payment: se validan (una sola vez)
+    return jsonresp.list_response(Order, orders, fields=fieldset.names)
 
 # Admin Authentication Routes
 @api_router.post("/admin/register")
@@ -1164,6 +1485,7 @@ async def admin_register(admin_data: AdminUserCreate):
     return {"admin": admin, "token": admin_token}
 
 @api_router.post("/admin/login")
+@query_budget(1)
 async def admin_login(login_data: AdminLogin):
     # Emitir JWT estándar cuando el admin es válido
     admin_data = await db.admin_users.find_one({"email": login_data.email})
@@ -1180,12 +1502,13 @@ async def admin_logout(current_admin: dict = Depends(get_current_admin)):
 
 # Admin Product Management Routes
 @api_router.post("/admin/products", response_model=Product)
+@query_budget(3)
 async def create_product(
     product_data: ProductCreate, 
     current_admin: dict = Depends(get_current_admin)
 ):
-    # Crear producto
-    product = Product(**product_data.dict())
+    # Crear producto (con las variantes de la imagen si es un original subido)
+    product = Product(**product_data.dict(), **await image_pipeline.fields_for_url(product_data.image_url))
     await db.products.insert_one(product.dict())
     return product
 
@@ -1196,13 +1519,17 @@ async def update_product(
     current_admin: dict = Depends(get_current_admin)
 ):
     # Verificar si el producto existe
-    existing_product = await db.products.find_one({"id": product_id})
+    existing_product = await db.products.find_one({"id": product_id}, EXISTS_PROJECTION)
     if not existing_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Actualizar solo los campos proporcionados
-    update_data = {k: v for k, v in product_data.dict() if v is not None}
+    update_data = {k: v for k, v in product_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc)
+    if "image_url" in update_data:
+        # Variantes de la nueva imagen (o ninguna si no es un original subido)
+        update_data.update({"image_variants": None, "image_srcset": None})
+        update_data.update(await image_pipeline.fields_for_url(update_data["image_url"]))
     
     await db.products.update_one(
         {"id": product_id}, 
@@ -1214,12 +1541,13 @@ async def update_product(
     return Product(**updated_product)
 
 @api_router.delete("/admin/products/{product_id}")
+@query_budget(4)
 async def delete_product(
     product_id: str, 
     current_admin: dict = Depends(get_current_admin)
 ):
     # Verificar si el producto existe
-    existing_product = await db.products.find_one({"id": product_id})
+    existing_product = await db.products.find_one({"id": product_id}, EXISTS_PROJECTION)
     if not existing_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -1252,7 +1580,7 @@ async def get_invoice_by_transaction(
         
         # Obtener información adicional
         order = await db.orders.find_one({"id": invoice.order_id})
-        customer = await db.users.find_one({"id": invoice.user_id})
+        customer = await db.users.find_one({"id": invoice.user_id}, USER_CONTACT_PROJECTION)
         
         customer_info = None
         if customer:
@@ -1296,7 +1624,7 @@ async def get_invoice(
         # Verificar que el usuario es el propietario o es admin
         if invoice_data["user_id"] != current_user_id:
             # Verificar si es admin
-            user_data = await db.users.find_one({"id": current_user_id})
+            user_data = await db.users.find_one({"id": current_user_id}, USER_ROLE_PROJECTION)
             if not user_data or not user_data.get("is_admin", False):
                 raise HTTPException(status_code=403, detail="No autorizado para ver esta factura")
         
@@ -1304,7 +1632,7 @@ async def get_invoice(
         
         # Obtener información adicional
         order = await db.orders.find_one({"id": invoice.order_id})
-        customer = await db.users.find_one({"id": invoice.user_id})
+        customer = await db.users.find_one({"id": invoice.user_id}, USER_CONTACT_PROJECTION)
         
         customer_info = None
         if customer:
@@ -1391,15 +1719,18 @@ def get_demo_invoice_data():
 
 # ==================== ADMIN ORDER MANAGEMENT ROUTES ====================
 
+ADMIN_ORDER_EXTRA_FIELDS = ("user_info", "items_details", "invoice_info")
+
 @api_router.get("/admin/orders")
 async def get_all_orders(
     status: Optional[str] = None,
     limit: int = 100,
-    current_admin: dict = Depends(get_current_admin)
+    current_admin: dict = Depends(get_current_admin),
+    fieldset: fieldsets.FieldSet = Depends(fieldsets.sparse_fields(Order, extra=ADMIN_ORDER_EXTRA_FIELDS))
 ):
     """
     Listar todos los pedidos del sistema (todos los usuarios)
-    Opcionalmente filtrar por estado
+    Opcionalmente filtrar por estado y elegir campos con fields=
     """
     try:
         # Construir query
@@ -1407,8 +1738,18 @@ async def get_all_orders(
         if status:
             query["status"] = status
         
+        # Campos pedidos más los que necesitan los enriquecimientos solicitados
+        needed = []
+        if fieldset.wants("user_info"):
+            needed.append("user_id")
+        if fieldset.wants("items_details"):
+            needed.extend(["items", "enriched_items"])
+        if fieldset.wants("invoice_info"):
+            needed.append("invoice_number")
+        projection = fieldset.projection(*needed, stored=Order.model_fields)
+        
         # Obtener pedidos
-        orders = await db.orders.find(query).sort("created_at", -1).limit(limit).to_list(limit)
+        orders = await db.orders.find(query, projection).sort("created_at", -1).limit(limit).to_list(limit)
         
         # Enriquecer con información de usuario y productos
         # Enriquecer con información de usuario y productos
@@ -1422,8 +1763,8 @@ async def get_all_orders(
                 # Obtener usuario
                 user_id = order.get("user_id")
                 user = None
-                if user_id:
-                    user = await db.users.find_one({"id": user_id})
+                if user_id and fieldset.wants("user_info"):
+                    user = await db.users.find_one({"id": user_id}, USER_CONTACT_PROJECTION)
                 
                 user_info = {
                     "name": user["name"],
@@ -1433,7 +1774,9 @@ async def get_all_orders(
                 
                 # Obtener información de productos
                 # Si el order ya tiene enriched_items (después de pago), usarlos
-                if order.get("enriched_items"):
+                if not fieldset.wants("items_details"):
+                    items_with_details = None
+                elif order.get("enriched_items"):
                     items_with_details = order["enriched_items"]
                 else:
                     # Si no, construir desde items básicos
@@ -1443,7 +1786,7 @@ async def get_all_orders(
                         if not isinstance(item, dict) or "product_id" not in item:
                             continue
                             
-                        product = await db.products.find_one({"id": item["product_id"]})
+                        product = await db.products.find_one({"id": item["product_id"]}, PRODUCT_LINE_PROJECTION)
                         if product:
                             items_with_details.append({
                                 "product_id": item["product_id"],
@@ -1469,12 +1812,12 @@ async def get_all_orders(
                 if "_id" in order_dict:
                     order_dict["_id"] = str(order_dict["_id"])
                 
-                enriched_orders.append({
+                enriched_orders.append(fieldset.trim({
                     **order_dict,
                     "user_info": user_info,
                     "items_details": items_with_details,
                     "invoice_info": invoice_info
-                })
+                }))
             except Exception as order_error:
                 logger.error(f"Error processing order {order.get('_id')}: {str(order_error)}")
                 continue
@@ -1486,6 +1829,7 @@ async def get_all_orders(
         raise HTTPException(status_code=500, detail="Error al obtener pedidos")
 
 @api_router.get("/admin/orders/stats", response_model=OrderStats)
+@query_budget(12)
 async def get_order_stats(
     current_admin: dict = Depends(get_current_admin)
 ):
@@ -1494,29 +1838,30 @@ async def get_order_stats(
     """
     try:
         # Contar pedidos por estado
-        total_orders = await db.orders.count_documents({})
-        pending_orders = await db.orders.count_documents({"status": "pending"})
-        paid_orders = await db.orders.count_documents({"status": "paid"})
-        processing_orders = await db.orders.count_documents({"status": "processing"})
-        shipped_orders = await db.orders.count_documents({"status": "shipped"})
-        delivered_orders = await db.orders.count_documents({"status": "delivered"})
-        cancelled_orders = await db.orders.count_documents({"status": "cancelled"})
+        total_orders = await workloads.analytics.orders.count_documents({})
+        pending_orders = await workloads.analytics.orders.count_documents({"status": "pending"})
+        paid_orders = await workloads.analytics.orders.count_documents({"status": "paid"})
+        processing_orders = await workloads.analytics.orders.count_documents({"status": "processing"})
+        shipped_orders = await workloads.analytics.orders.count_documents({"status": "shipped"})
+        delivered_orders = await workloads.analytics.orders.count_documents({"status": "delivered"})
+        cancelled_orders = await workloads.analytics.orders.count_documents({"status": "cancelled"})
         
         # Calcular ingresos totales
-        all_orders = await db.orders.find({}).to_list(None)
+        all_orders = await workloads.analytics.orders.find({}, {"_id": 0, "total_amount": 1}).to_list(None)
         total_revenue = sum(order.get("total_amount", 0) for order in all_orders)
         
         # Calcular estadísticas del mes
         now = datetime.now(timezone.utc)
         start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
-        monthly_orders_count = await db.orders.count_documents({
+        monthly_orders_count = await workloads.analytics.orders.count_documents({
             "created_at": {"$gte": start_of_month}
         })
         
-        monthly_orders_list = await db.orders.find({
-            "created_at": {"$gte": start_of_month}
-        }).to_list(None)
+        monthly_orders_list = await workloads.analytics.orders.find(
+            {"created_at": {"$gte": start_of_month}},
+            {"_id": 0, "total_amount": 1}
+        ).to_list(None)
         monthly_revenue = sum(order.get("total_amount", 0) for order in monthly_orders_list)
         
         return OrderStats(
@@ -1539,19 +1884,27 @@ async def get_order_stats(
 @api_router.get("/admin/orders/{order_id}")
 async def get_order_details(
     order_id: str,
-    current_admin: dict = Depends(get_current_admin)
+    current_admin: dict = Depends(get_current_admin),
+    fieldset: fieldsets.FieldSet = Depends(fieldsets.sparse_fields(Order, extra=ADMIN_ORDER_EXTRA_FIELDS + ("payment_transaction",)))
 ):
     """
     Obtener detalles completos de un pedido específico
     """
     try:
-        # Buscar pedido
-        order = await db.orders.find_one({"id": order_id})
+        # Buscar pedido (con los campos que usan los enriquecimientos pedidos)
+        projection = fieldset.projection(
+            "user_id", "items", "invoice_number", "invoice_date", "payment_method",
+            "total_amount", "customer_info", "payment_session_id",
+            stored=Order.model_fields
+        ) or {"_id": 0}
+        order = await db.orders.find_one({"id": order_id}, projection)
         if not order:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
         
         # Obtener usuario
-        user = await db.users.find_one({"id": order["user_id"]})
+        user = None
+        if fieldset.wants("user_info"):
+            user = await db.users.find_one({"id": order["user_id"]}, USER_CONTACT_PROJECTION)
         user_info = {
             "id": user["id"],
             "name": user["name"],
@@ -1562,8 +1915,8 @@ async def get_order_details(
         
         # Obtener productos con detalles
         items_with_details = []
-        for item in order.get("items", []):
-            product = await db.products.find_one({"id": item["product_id"]})
+        for item in (order.get("items", []) if fieldset.wants("items_details") else []):
+            product = await db.products.find_one({"id": item["product_id"]}, PRODUCT_LINE_PROJECTION)
             if product:
                 items_with_details.append({
                     "product_id": item["product_id"],
@@ -1590,10 +1943,11 @@ async def get_order_details(
         
         # Buscar transacción de pago
         payment_transaction = None
-        if order.get("payment_session_id"):
-            payment = await db.payment_transactions.find_one({
-                "transaction_id": order["payment_session_id"]
-            })
+        if order.get("payment_session_id") and fieldset.wants("payment_transaction"):
+            payment = await db.payment_transactions.find_one(
+                {"transaction_id": order["payment_session_id"]},
+                {"_id": 0, "transaction_id": 1, "amount": 1, "currency": 1, "status": 1, "created_at": 1}
+            )
             if payment:
                 payment_transaction = {
                     "transaction_id": payment["transaction_id"],
@@ -1603,13 +1957,13 @@ async def get_order_details(
                     "created_at": payment["created_at"]
                 }
         
-        return {
+        return fieldset.trim({
             **order,
             "user_info": user_info,
             "items_details": items_with_details,
             "invoice_info": invoice_info,
             "payment_transaction": payment_transaction
-        }
+        })
         
     except HTTPException:
         raise
@@ -1618,6 +1972,7 @@ async def get_order_details(
         raise HTTPException(status_code=500, detail="Error al obtener detalles del pedido")
 
 @api_router.put("/admin/orders/{order_id}/status")
+@query_budget(5)
 async def update_order_status(
     order_id: str,
     order_update: OrderUpdate,
@@ -1636,7 +1991,7 @@ async def update_order_status(
             )
         
         # Verificar que el pedido existe
-        order = await db.orders.find_one({"id": order_id})
+        order = await db.orders.find_one({"id": order_id}, EXISTS_PROJECTION)
         if not order:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
         
@@ -1665,43 +2020,218 @@ async def update_order_status(
         logger.error(f"Error updating order status: {str(e)}")
         raise HTTPException(status_code=500, detail="Error al actualizar estado del pedido")
 
+# ==================== ADMIN PAYMENT ROUTES ====================
+
+class CardBatchValidationRequest(BaseModel):
+    card_numbers: List[str] = Field(..., max_length=10000)
+
+@api_router.post("/admin/payments/validate-cards")
+async def validate_cards_batch(
+    batch: CardBatchValidationRequest,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Validar un lote de números de tarjeta (Luhn, longitud, franquicia y país)
+    """
+    return [info.as_dict() for info in cards.validate_cards(batch.card_numbers)]
+
+@api_router.get("/admin/payments/card-reconciliation")
+@query_budget(3)
+async def reconcile_payment_cards(
+    limit: int = 10000,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Conciliar card_last_four/card_type de las transacciones de pago almacenadas
+    """
+    try:
+        records = await db.payment_transactions.find(
+            {},
+            {"_id": 0, "id": 1, "transaction_id": 1, "card_last_four": 1, "card_type": 1}
+        ).limit(limit).to_list(limit)
+        return cards.reconcile_card_records(records)
+
+    except Exception as e:
+        logger.error(f"Error reconciling payment cards: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error al conciliar tarjetas")
+
+# ==================== ADMIN DIAGNOSTICS ROUTES ====================
+
+@api_router.get("/admin/diagnostics/stalls")
+async def get_loop_stalls(current_admin: dict = Depends(get_current_admin)):
+    """
+    Bloqueos del event loop agregados por ruta y punto del código
+    """
+    return {
+        "enabled": loop_watchdog.enabled,
+        "threshold_ms": loop_watchdog.threshold * 1000,
+        "stalls": loop_watchdog.snapshot()
+    }
+
+@api_router.delete("/admin/diagnostics/stalls")
+async def reset_loop_stalls(current_admin: dict = Depends(get_current_admin)):
+    """
+    Reiniciar los reportes de bloqueos
+    """
+    loop_watchdog.reset()
+    return {"message": "Reportes de bloqueos reiniciados"}
+
+@api_router.get("/admin/diagnostics/db-pool")
+async def get_db_pool(current_admin: dict = Depends(get_current_admin)):
+    """
+    Pool de conexiones de MongoDB de este worker: opciones efectivas, servidores y uso
+    """
+    return {
+        "worker": launcher.worker_id(),
+        "pid": os.getpid(),
+        "options": database.effective_options(client),
+        "workloads": workloads.describe(),
+        "topology": database.topology(client),
+        "pools": mongo_pool_stats.snapshot()
+    }
+
+@api_router.delete("/admin/diagnostics/db-pool/peaks")
+async def reset_db_pool_peaks(current_admin: dict = Depends(get_current_admin)):
+    """
+    Reiniciar la espera máxima de checkout registrada
+    """
+    mongo_pool_stats.reset_peaks()
+    return {"message": "Picos del pool reiniciados"}
+
+@api_router.get("/admin/diagnostics/admission")
+async def get_admission(current_admin: dict = Depends(get_current_admin)):
+    """
+    Límites adaptativos, peticiones en curso y colas por clase de ruta (este worker)
+    """
+    return {"worker": launcher.worker_id(), **admission_controller.snapshot()}
+
+@api_router.get("/admin/profiles")
+async def list_profiles(current_admin: dict = Depends(get_current_admin)):
+    """
+    Perfiles de CPU capturados con X-Profile (más recientes primero)
+    """
+    return profiler.list()
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Descargar un perfil: pilas colapsadas (sample) o salida de pstats (cprofile)
+    """
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return PlainTextResponse(profile.collapsed if profile.mode == profiling.SAMPLE else profile.pstats)
+
+class MemoryTracingRequest(BaseModel):
+    frames: int = 1
+
+@api_router.get("/admin/diagnostics/memory")
+async def get_memory_status(current_admin: dict = Depends(get_current_admin)):
+    """
+    Estado de tracemalloc y snapshots guardados
+    """
+    return memory_profiler.status()
+
+@api_router.post("/admin/diagnostics/memory/start")
+async def start_memory_tracing(
+    request: MemoryTracingRequest,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Iniciar tracemalloc (frames = profundidad de traceback por asignación)
+    """
+    memory_profiler.start(max(1, min(request.frames, 64)))
+    return memory_profiler.status()
+
+@api_router.post("/admin/diagnostics/memory/stop")
+async def stop_memory_tracing(current_admin: dict = Depends(get_current_admin)):
+    """
+    Detener tracemalloc y descartar los snapshots
+    """
+    memory_profiler.stop()
+    return memory_profiler.status()
+
+@api_router.post("/admin/diagnostics/memory/snapshots")
+async def take_memory_snapshot(
+    label: Optional[str] = None,
+    group_by: str = "lineno",
+    limit: int = 25,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Tomar un snapshot y devolver las mayores asignaciones
+    """
+    if not memory_profiler.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc no está activo")
+    if group_by not in memprof.GROUP_BY:
+        raise HTTPException(status_code=400, detail="group_by inválido")
+    snapshot_id = await asyncio.to_thread(memory_profiler.take_snapshot, label)
+    top = await asyncio.to_thread(memory_profiler.top, snapshot_id, group_by, limit)
+    return {"id": snapshot_id, "top": top}
+
+@api_router.get("/admin/diagnostics/memory/snapshots/{old_id}/diff/{new_id}")
+async def diff_memory_snapshots(
+    old_id: int,
+    new_id: int,
+    group_by: str = "lineno",
+    limit: int = 25,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Diferencia entre dos snapshots agrupada por archivo o línea
+    """
+    if group_by not in memprof.GROUP_BY:
+        raise HTTPException(status_code=400, detail="group_by inválido")
+    diff = await asyncio.to_thread(memory_profiler.diff, old_id, new_id, group_by, limit)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Snapshot no encontrado")
+    return diff
+
+@api_router.get("/admin/diagnostics/memory/peaks")
+async def get_memory_peaks(current_admin: dict = Depends(get_current_admin)):
+    """
+    Pico de asignación por ruta y peticiones que superaron el umbral
+    """
+    return memory_profiler.report()
+
 # Endpoint para subir imágenes (opcional)
 @api_router.post("/admin/upload-image")
 async def upload_image(
     file: UploadFile = File(...), 
     current_admin: dict = Depends(get_current_admin)
 ):
-    # Crear directorio de uploads si no existe
-    upload_dir = ROOT_DIR / "uploads"
-    upload_dir.mkdir(exist_ok=True)
+    # Streaming a un temporal fuera del loop, tipo por bytes mágicos y nombre = sha256
+    try:
+        stored = await upload_store.save_upload(file)
+    except uploads.UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    # Generar nombre único para el archivo
-    file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{secrets.token_urlsafe(8)}.{file_extension}"
-    file_path = upload_dir / unique_filename
+    if not stored.created:
+        logger.info(f"Upload deduplicated: {stored.filename}")
     
-    # Guardar el archivo
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Derivados redimensionados (idempotente: si el contenido ya estaba, se reutilizan)
+    image_fields = {}
+    try:
+        image_fields = await image_pipeline.derive(stored.filename)
+    except Exception as e:
+        logger.error(f"Error generating image derivatives for {stored.filename}: {str(e)}")
     
-    # Devolver la URL relativa del archivo
-    return {"image_url": f"/uploads/{unique_filename}"}
-
-def FileResponse(file_path):
-    from fastapi.responses import FileResponse as FastAPIFileResponse
-    return FastAPIFileResponse(file_path)
-
-# Servir archivos estáticos (para las imágenes subidas)
-@app.get("/uploads/{filename}")
-async def get_uploaded_file(filename: str):
-    file_path = ROOT_DIR / "uploads" / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path)
+    # Devolver la URL relativa del archivo (la existente si el contenido ya estaba)
+    return {
+        "image_url": stored.url,
+        "sha256": stored.sha256,
+        "size": stored.size,
+        "deduplicated": not stored.created,
+        **image_fields
+    }
+
+# Servir archivos estáticos (para las imágenes subidas): ETag, caché inmutable, rangos y sidecars
+app.add_route("/uploads/{filename}", static.UploadsApp(upload_blobs), methods=["GET", "HEAD"], include_in_schema=False)
 
 # Include router
 app.include_router(api_router)
 
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+startup.phases.mark("app")
@@ -319,7 +319,7 @@ const AdminPanel = ({ onBack }) => {
           fetch(`${API_BASE}/admin/orders/stats`, {
             headers: { 'Authorization': `Bearer ${token}` }
           }),
-          fetch(`${API_BASE}/admin/orders`, {
+          fetch(`${API_BASE}/admin/orders?fields=id,status,created_at,total_amount,user_info,items_details,invoice_info`, {
             headers: { 'Authorization': `Bearer ${token}` }
           })
         ]);
@@ -1,9 +1,99 @@
-import React from 'react';
+import React, { useState } from 'react';
 import axios from 'axios';
 
 const API = process.env.REACT_APP_BACKEND_URL ? `${process.env.REACT_APP_BACKEND_URL}/api` : 'http://localhost:8000/api';
 
+// Subida reanudable de recetas: bloques en paralelo con checksum y reintentos
+const CHUNK_PARALLELISM = 3;
+const MAX_RETRIES = 5;
+
+const toBase64 = (buffer) => btoa(String.fromCharCode(...new Uint8Array(buffer)));
+
+const uploadPrescription = async (productId, file, token, onProgress) => {
+  const headers = { Authorization: `Bearer ${token}` };
+  // Si la conexión se corta, el mismo archivo retoma la sesión guardada
+  const storageKey = `prescription-upload:${productId}:${file.name}:${file.size}:${file.lastModified}`;
+  let session = null;
+  const savedId = localStorage.getItem(storageKey);
+  if (savedId) {
+    try {
+      session = (await axios.get(`${API}/prescriptions/uploads/${savedId}`, { headers })).data;
+    } catch (error) {
+      localStorage.removeItem(storageKey);
+    }
+  }
+  if (!session) {
+    session = (await axios.post(`${API}/prescriptions/uploads`,
+      { product_id: productId, filename: file.name, size: file.size },
+      { headers }
+    )).data;
+    localStorage.setItem(storageKey, session.id);
+  }
+
+  const pending = [...session.missing];
+  let done = session.chunk_count - pending.length;
+  onProgress(done / session.chunk_count);
+
+  const sendChunk = async (index) => {
+    const offset = index * session.chunk_size;
+    const buffer = await file.slice(offset, Math.min(file.size, offset + session.chunk_size)).arrayBuffer();
+    const checksum = toBase64(await crypto.subtle.digest('SHA-256', buffer));
+    for (let attempt = 0; ; attempt += 1) {
+      try {
+        await axios.patch(`${API}/prescriptions/uploads/${session.id}`, buffer, {
+          headers: {
+            ...headers,
+            'Content-Type': 'application/offset+octet-stream',
+            'Upload-Offset': String(offset),
+            'Upload-Checksum': `sha256 ${checksum}`,
+          },
+        });
+        return;
+      } catch (error) {
+        const status = error.response?.status;
+        // Reintentar cortes de red, 5xx y checksums corruptos en tránsito
+        if (attempt >= MAX_RETRIES || (status && status < 500 && status !== 460)) throw error;
+        await new Promise((resolve) => setTimeout(resolve, Math.min(8000, 500 * 2 ** attempt)));
+      }
+    }
+  };
+
+  const worker = async () => {
+    while (pending.length) {
+      await sendChunk(pending.shift());
+      done += 1;
+      onProgress(done / session.chunk_count);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(CHUNK_PARALLELISM, pending.length) }, worker));
+
+  const result = (await axios.post(`${API}/prescriptions/uploads/${session.id}/complete`, null, { headers })).data;
+  localStorage.removeItem(storageKey);
+  return result.cart;
+};
+
 const CartModal = ({ isOpen, onClose, cart, onUpdateCart, token }) => {
+  const [prescriptionProgress, setPrescriptionProgress] = useState({});
+
+  const handlePrescriptionFile = async (productId, file) => {
+    if (!file) return;
+    setPrescriptionProgress((current) => ({ ...current, [productId]: 0 }));
+    try {
+      const updatedCart = await uploadPrescription(productId, file, token, (progress) =>
+        setPrescriptionProgress((current) => ({ ...current, [productId]: progress }))
+      );
+      onUpdateCart(updatedCart);
+    } catch (error) {
+      console.error('Error uploading prescription:', error);
+      alert(error.response?.data?.detail || 'No se pudo subir la receta. Vuelve a seleccionarla para reanudar.');
+    } finally {
+      setPrescriptionProgress((current) => {
+        const { [productId]: _, ...rest } = current;
+        return rest;
+      });
+    }
+  };
+
   const updateQuantity = async (productId, newQuantity) => {
     if (newQuantity <= 0) {
       await removeItem(productId);
@@ -74,6 +164,24 @@ const CartModal = ({ isOpen, onClose, cart, onUpdateCart, token }) => {
                       {item.requires_prescription && (
                         <span className="prescription-note">💊 Requiere receta</span>
                       )}
+                      {item.requires_prescription && token && (
+                        (item.product_id || item.id) in prescriptionProgress ? (
+                          <span className="prescription-status">
+                            Subiendo receta… {Math.round(prescriptionProgress[item.product_id || item.id] * 100)}%
+                          </span>
+                        ) : item.prescription_file ? (
+                          <span className="prescription-status">✅ Receta adjunta</span>
+                        ) : (
+                          <label className="prescription-upload">
+                            Adjuntar receta
+                            <input
+                              type="file"
+                              accept="image/*,application/pdf"
+                              onChange={(e) => handlePrescriptionFile(item.product_id || item.id, e.target.files[0])}
+                            />
+                          </label>
+                        )
+                      )}
                     </div>
                     
                     <div className="item-controls">
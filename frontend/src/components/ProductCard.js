@@ -1,5 +1,7 @@
 import React from 'react';
 
+const CARD_IMAGE_SIZES = '(max-width: 600px) 50vw, 300px';
+
 const ProductCard = ({ product, onAddToCart, user }) => {
   const handleAddToCart = () => {
     // Delegar la lógica al padre: App.js ahora maneja carrito local y autenticado
@@ -9,8 +11,21 @@ const ProductCard = ({ product, onAddToCart, user }) => {
   return (
     <div className="product-card">
       <div className="product-image">
-        {product.image_url ? (
-          <img src={product.image_url} alt={product.name} />
+        {product.image_srcset ? (
+          // Variantes redimensionadas: el navegador elige tamaño y WebP si lo soporta
+          <picture>
+            <source type="image/webp" srcSet={product.image_srcset.webp} sizes={CARD_IMAGE_SIZES} />
+            <img
+              src={product.image_variants?.card?.src || product.image_url}
+              srcSet={product.image_srcset.src}
+              sizes={CARD_IMAGE_SIZES}
+              alt={product.name}
+              loading="lazy"
+              decoding="async"
+            />
+          </picture>
+        ) : product.image_url ? (
+          <img src={product.image_url} alt={product.name} loading="lazy" decoding="async" />
         ) : (
           <div className="product-placeholder">
             <span>🏥</span>